@@ -2,27 +2,27 @@
 import json
 import os
 import re
+import threading
 import time
-from time import sleep
 import backoff
 import requests
 import selenium
 import undetected_chromedriver.v2 as uc
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException, ElementClickInterceptedException, \
-    ElementNotInteractableException, JavascriptException
+from selenium.common.exceptions import ElementClickInterceptedException, ElementNotInteractableException, \
+    JavascriptException
 from bs4 import BeautifulSoup
 from random_user_agent.params import HardwareType, Popularity
 from random_user_agent.user_agent import UserAgent
-from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.wait import WebDriverWait
 from undetected_chromedriver import ChromeOptions
 
 from apaFin import proxies
+from apaFin.browser_profile import PAGE_LOAD_METRICS_SCRIPT, blocked_url_patterns
+from apaFin.http_session import create_session
+from apaFin.page_cache import PageNotModified, SearchPageCache
 from apaFin.captcha.captcha_solver import CaptchaUnsolvableError
 from apaFin.logging import logger
+from apaFin.waits import NetworkIdle, StepTimer, element_invisible, element_visible
 
 
 class Crawler:
@@ -30,10 +30,47 @@ class Crawler:
 
     AUTO_SUBMIT = False
 
+    captcha_solver = None
+
+    # User agent of the browser whose session has been handed off to the HTTP client
+    browser_user_agent = None
+
     URL_PATTERN = None
 
     MODULE_NAME = None
 
+    # Fetch strategies to try, cheapest first. Unavailable ones are skipped
+    FETCH_STRATEGIES = ('direct', 'proxy', 'browser')
+
+    # Number of proxy lists the 'proxy' strategy works through before it gives up
+    PROXY_LIST_ATTEMPTS = 3
+
+    CAPTCHA_PATTERN = re.compile("initGeetest|g-recaptcha")
+
+    # Element that is only shown to logged in users, e.g. the logout link. Crawlers that
+    # log in define it; without it, login sessions are neither saved nor restored
+    LOGGED_IN_XPATH = None
+
+    # Sets the value of an input or textarea through the native setter, so frameworks
+    # that track the value (React, Angular) see it, and fires the events they listen to.
+    # Returns whether the field accepted the value
+    FILL_SCRIPT = """
+        const element = arguments[0];
+        const value = arguments[1];
+        const prototype = element.tagName === 'TEXTAREA'
+            ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+        Object.getOwnPropertyDescriptor(prototype, 'value').set.call(element, value);
+        for (const type of ['input', 'change']) {
+            element.dispatchEvent(new Event(type, {bubbles: true}));
+        }
+        return element.value === value
+            && (typeof element.checkValidity !== 'function' || element.checkValidity());
+    """
+
+    # Strainer selecting the part of a search result page that holds the result list.
+    # Only that part is parsed; None parses the whole page
+    RESULT_LIST_STRAINER = None
+
     user_agent_rotator = UserAgent(popularity=[Popularity.COMMON.value],
                                    hardware_types=[HardwareType.COMPUTER.value])
 
@@ -53,31 +90,81 @@ class Crawler:
         'Accept-Language': 'en-US,en;q=0.9',
     }
 
+    _session_lock = threading.Lock()
+
     def __init__(self, config):
         self.config = config
         self.checkbox = None
         self.afterlogin_string = None
+        self.page_cache = SearchPageCache()
+        self.thread_leases = threading.local()
+        self.primed_urls = set()
+        self.session = None
         self.auto_submit_config = config.get("auto_submit")
         self.AUTO_SUBMIT = self.auto_submit_config['enable']
         if self.AUTO_SUBMIT:
             self.contact_text = self.get_contact_text(self.auto_submit_config['contact_text_file'])
 
     def initialize_driver(self):
+        """Enables the browser for this crawler if captcha solving is configured. No
+           browser is launched here: it is leased from the shared driver pool when the
+           crawler first needs one"""
         if self.config.captcha_enabled():
             self.captcha_solver = self.config.get_captcha_solver()
-            captcha_config = self.config.get('captcha')
-            driver_arguments = captcha_config.get('driver_arguments', [])
+            self.checkbox = self.config.get_captcha_checkbox() or False
+            self.afterlogin_string = self.config.get_captcha_afterlogin_string() or ""
+
+    def leases(self):
+        """Per-thread storage of the drivers leased by this crawler"""
+        return self.thread_leases
+
+    @property
+    def driver(self):
+        """The WebDriver leased by the current thread, or None if this crawler has no
+           browser. The first access on a thread leases a driver from the pool"""
+        driver = getattr(self.leases(), 'driver', None)
+        if driver is None and self.captcha_solver is not None:
+            driver = self.config.driver_pool().acquire(self.get_driver)
+            self.leases().driver = driver
+            self.block_resources(driver)
+        return driver
 
-            if captcha_config.get('checkbox', '') == "":
-                self.checkbox = False
-            else:
-                self.checkbox = captcha_config.get('checkbox', '')
-            if captcha_config.get('afterlogin_string', '') == "":
-                self.afterlogin_string = ""
-            else:
-                self.afterlogin_string = captcha_config.get('afterlogin_string', '')
-            if self.captcha_solver:
-                self.driver = self.configure_driver(driver_arguments)
+    @driver.setter
+    def driver(self, driver):
+        self.leases().driver = driver
+
+    def browser_available(self):
+        """Whether this crawler holds a browser, or can lease one when needed"""
+        return getattr(self.leases(), 'driver', None) is not None \
+            or self.captcha_solver is not None
+
+    def release_driver(self):
+        """Returns the driver leased by the current thread to the pool"""
+        driver = getattr(self.leases(), 'driver', None)
+        if driver is not None:
+            self.leases().driver = None
+            self.config.driver_pool().release(driver)
+
+    def step_timer(self):
+        """Records the waits of the browser flow running in this thread"""
+        timer = getattr(self.leases(), 'step_timer', None)
+        if timer is None:
+            timer = StepTimer(self.get_name())
+            self.leases().step_timer = timer
+        return timer
+
+    def wait_for(self, step, condition, driver=None, required=False):
+        """Waits for the condition, at most as long as configured for the named step.
+           Returns the value of the condition, or None when the deadline passed"""
+        return self.step_timer().wait(driver or self.driver, step, condition,
+                                      self.config.wait_timeout(step), required)
+
+    def log_wait_times(self):
+        """Logs the time spent in each wait step since the last call"""
+        timer = getattr(self.leases(), 'step_timer', None)
+        if timer is not None:
+            self.leases().step_timer = None
+            timer.log_summary()
 
     def configure_driver(self, driver_arguments):
         """Configure Chrome WebDriver"""
@@ -86,65 +173,172 @@ class Crawler:
         if driver_arguments is not None:
             for driver_argument in driver_arguments:
                 chrome_options.add_argument(driver_argument)
+        chrome_options.page_load_strategy = self.config.browser_page_load_strategy()
 
         driver = uc.Chrome(options=chrome_options)
 
-        driver.execute_cdp_cmd('Network.setBlockedURLs', {"urls": ["https://api.geetest.com/get.*"]})
+        driver.set_page_load_timeout(self.config.browser_page_load_timeout())
         driver.execute_cdp_cmd('Network.enable', {})
 
         return driver
 
+    def block_resources(self, driver):
+        """Blocks the resource types and hosts configured for this portal in the browser.
+           Applied on every lease, as browsers are shared between portals"""
+        name = self.get_name()
+        patterns = blocked_url_patterns(self.config.browser_blocked_resources(name),
+                                        self.config.browser_blocked_hosts(name))
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {"urls": patterns})
+
     def rotate_user_agent(self):
         """Choose a new random user agent"""
         self.HEADERS['User-Agent'] = self.user_agent_rotator.get_random_user_agent()
 
+    def request_headers(self):
+        """Headers for a request with the HTTP session: with the browser's user agent while
+           its session is handed off to the HTTP client, a random one otherwise"""
+        if self.browser_user_agent is not None:
+            return {**self.HEADERS, 'User-Agent': self.browser_user_agent}
+        self.rotate_user_agent()
+        return {**self.HEADERS}
+
+    def hand_off_browser_session(self, driver):
+        """Copies the cookies and user agent of the browser, which has just passed a
+           challenge, into the HTTP session. Following pages of the portal are then
+           fetched without the browser, until the portal challenges again"""
+        session = self.get_session()
+        for cookie in driver.get_cookies():
+            session.cookies.set(cookie['name'], cookie['value'],
+                                domain=cookie.get('domain', ''), path=cookie.get('path', '/'))
+        self.browser_user_agent = driver.execute_script('return navigator.userAgent;')
+        logger.info('Passed challenge in browser, fetching %s pages without browser again',
+                    self.get_name())
+
+    def end_session_hand_off(self, reason):
+        """Stops using the handed off browser session, after the portal challenged it"""
+        if self.browser_user_agent is not None:
+            logger.info('Handed off browser session for %s was challenged (%s)',
+                        self.get_name(), reason)
+            self.browser_user_agent = None
+
+    def get_session(self):
+        """Returns the pooled HTTP session of this crawler. All page fetches for the
+           portal share it, so keep-alive connections to the portal are reused"""
+        session = self.session
+        if session is None:
+            with self._session_lock:
+                session = self.session
+                if session is None:
+                    name = self.get_name()
+                    session = create_session(
+                        headers=self.HEADERS,
+                        pool_connections=self.config.http_pool_connections(name),
+                        pool_maxsize=self.config.http_pool_maxsize(name))
+                    # search pages are primed once per session
+                    self.primed_urls.clear()
+                    self.session = session
+        return session
+
     # pylint: disable=unused-argument
     def get_page(self, search_url, driver=None, page_no=None):
         """Applies a page number to a formatted search URL and fetches the exposes at that page"""
-        return self.get_soup_from_url(search_url)
-
-    @backoff.on_exception(wait_gen=backoff.constant,
-                          exception=selenium.common.exceptions.TimeoutException,
-                          max_tries=3)
-    def get_soup_from_url(self, url, driver=None, checkbox=None, afterlogin_string=None):
-        """Creates a Soup object from the HTML at the provided URL"""
-
-        self.rotate_user_agent()
-        resp = requests.get(url, headers=self.HEADERS)
-
+        return self.get_soup_from_url(search_url, parse_only=self.RESULT_LIST_STRAINER)
+
+    def make_soup(self, content, parse_only=None):
+        """Parses HTML with the configured parser. If a strainer is given, only
+           the tags it matches are parsed"""
+        return BeautifulSoup(content, self.config.html_parser(self.get_name()),
+                             parse_only=parse_only)
+
+    def fetch_strategies(self, driver=None):
+        """Returns the ordered chain of fetch strategies for this portal: the configured
+           'fetch_strategies' of the portal, or the crawler's FETCH_STRATEGIES, without
+           those that are not available (no proxy list configured, no WebDriver)"""
+        strategies = self.config.portal_setting(self.get_name(), 'fetch_strategies',
+                                                self.FETCH_STRATEGIES)
+        available = []
+        for strategy in strategies:
+            if strategy not in ('direct', 'session', 'proxy', 'browser'):
+                logger.warning('Unknown fetch strategy "%s" for crawler "%s"',
+                               strategy, self.get_name())
+            elif strategy == 'proxy' and not self.config.use_proxy():
+                continue
+            elif strategy == 'browser' and driver is None and not self.browser_available():
+                continue
+            else:
+                available.append(strategy)
+        return available if len(available) > 0 else ['direct']
+
+    def get_soup_from_url(self, url, driver=None, checkbox=None, afterlogin_string=None,
+                          parse_only=None):
+        """Creates a Soup object from the HTML at the provided URL. The page is fetched
+           once, by the first strategy in the portal's fetch chain that succeeds"""
+        strategies = self.fetch_strategies(driver)
+        fallbacks = []
+        for idx, strategy in enumerate(strategies):
+            is_last = idx == len(strategies) - 1
+            try:
+                content = getattr(self, 'fetch_' + strategy)(
+                    url, driver=driver, checkbox=checkbox,
+                    afterlogin_string=afterlogin_string, is_last=is_last)
+            except FetchFailed as error:
+                if is_last:
+                    raise
+                logger.info('Fetching %s with strategy "%s" failed (%s), falling back to "%s"',
+                            url, strategy, error, strategies[idx + 1])
+                fallbacks.append(strategy)
+                continue
+            logger.debug('Fetched %s with strategy "%s" (fallbacks: %s)',
+                         url, strategy, ', '.join(fallbacks) or 'none')
+            return self.make_soup(content, parse_only=parse_only)
+        raise FetchFailed(f"no fetch strategy for {url}")
+
+    def _fetch_http(self, url, is_last):
+        """Fetch the URL with the pooled HTTP session. Raises FetchFailed if the portal
+           rejects the request or serves a captcha, unless this is the last strategy"""
+        resp = self.get_session().get(
+            url, headers={**self.request_headers(), **self.page_cache.conditional_headers(url)})
+        if resp.status_code == 304:
+            self.page_cache.check_response(url, resp)
         if resp.status_code not in (200, 405):
+            self.end_session_hand_off(f"response status {resp.status_code}")
+            if not is_last:
+                raise FetchFailed(f"response status {resp.status_code}")
             logger.error("Got response (%i): %s", resp.status_code, resp.content)
-        if self.config.use_proxy():
-            return self.get_soup_with_proxy(url)
-        if driver is not None:
-            driver.get(url)
-            if re.search("initGeetest", driver.page_source):
-                try:
-                    self.resolve_geetest(driver)
-                except CaptchaUnsolvableError:
-                    pass
-            elif re.search("g-recaptcha", driver.page_source):
-                try:
-                    self.resolve_recaptcha(driver, checkbox, afterlogin_string)
-                except CaptchaUnsolvableError:
-                    pass
-            return BeautifulSoup(driver.page_source, 'html.parser')
-        return BeautifulSoup(resp.content, 'html.parser')
+        elif self.CAPTCHA_PATTERN.search(resp.text):
+            self.end_session_hand_off("captcha in response")
+            if not is_last:
+                raise FetchFailed("captcha in response")
+        self.page_cache.check_response(url, resp)
+        return resp.content
 
-    def get_soup_with_proxy(self, url):
-        """Will try proxies until it's possible to crawl and return a soup"""
-        resolved = False
-        resp = None
+    # pylint: disable=unused-argument
+    def fetch_direct(self, url, is_last=True, **kwargs):
+        """Fetch strategy 'direct': a single GET with the pooled HTTP session"""
+        return self._fetch_http(url, is_last)
+
+    # pylint: disable=unused-argument
+    def fetch_session(self, url, is_last=True, **kwargs):
+        """Fetch strategy 'session': like 'direct', but the first time a search page is
+           fetched in the session it is loaded once more before, so the portal can set its
+           cookies for the search filters. Other pages, and later fetches of the search
+           page, need a single GET"""
+        if self.page_cache.is_tracked(url) and url not in self.primed_urls:
+            self.get_session().get(url, headers=self.request_headers())
+            self.primed_urls.add(url)
+        return self._fetch_http(url, is_last)
 
-        # We will keep trying to fetch new proxies until one works
-        while not resolved:
-            proxies_list = proxies.get_proxies()
-            for proxy in proxies_list:
+    # pylint: disable=unused-argument
+    def fetch_proxy(self, url, **kwargs):
+        """Fetch strategy 'proxy': tries proxies until one returns the page. Raises
+           FetchFailed if none did in PROXY_LIST_ATTEMPTS proxy lists"""
+        for _ in range(self.PROXY_LIST_ATTEMPTS):
+            for proxy in proxies.get_proxies():
                 self.rotate_user_agent()
 
                 try:
                     # Very low proxy read timeout, or it will get stuck on slow proxies
-                    resp = requests.get(
+                    resp = self.get_session().get(
                         url,
                         headers=self.HEADERS,
                         proxies={"http": proxy, "https": proxy},
@@ -154,8 +348,7 @@ class Crawler:
                     if resp.status_code != 200:
                         logger.error("Got response (%i): %s", resp.status_code, resp.content)
                     else:
-                        resolved = True
-                        break
+                        return resp.content
 
                 except requests.exceptions.ConnectionError:
                     logger.error("Connection failed for proxy %s. Trying new proxy...", proxy)
@@ -166,10 +359,77 @@ class Crawler:
                 except requests.exceptions.RequestException:
                     logger.error("Some error occurred. Trying new proxy...")
 
-        if not resp:
-            raise Exception("An error occurred while fetching proxies or content")
+        raise FetchFailed(f"no proxy returned the page in {self.PROXY_LIST_ATTEMPTS} proxy lists")
+
+    # pylint: disable=unused-argument
+    @backoff.on_exception(wait_gen=backoff.constant,
+                          exception=selenium.common.exceptions.TimeoutException,
+                          max_tries=3)
+    def fetch_browser(self, url, driver=None, checkbox=None, afterlogin_string=None, **kwargs):
+        """Fetch strategy 'browser': loads the page in the WebDriver, solving captchas.
+           Without a given driver, one is leased for this fetch only"""
+        if driver is not None:
+            return self._fetch_with_driver(driver, url, checkbox, afterlogin_string)
+        if getattr(self.leases(), 'driver', None) is not None:
+            return self._fetch_with_driver(self.driver, url, checkbox, afterlogin_string)
+        try:
+            return self._fetch_with_driver(self.driver, url, checkbox, afterlogin_string)
+        finally:
+            self.release_driver()
+
+    def _fetch_with_driver(self, driver, url, checkbox, afterlogin_string):
+        self.load_page(driver, url)
+        if re.search("initGeetest", driver.page_source):
+            try:
+                self.resolve_geetest(driver)
+                self.hand_off_browser_session(driver)
+            except CaptchaUnsolvableError:
+                pass
+        elif re.search("g-recaptcha", driver.page_source):
+            try:
+                self.resolve_recaptcha(driver, checkbox, afterlogin_string)
+                self.hand_off_browser_session(driver)
+            except CaptchaUnsolvableError:
+                pass
+        return driver.page_source
 
-        return BeautifulSoup(resp.content, 'html.parser')
+    def load_in_browser(self, url):
+        """Loads the URL in the leased browser and logs the load time and traffic"""
+        self.load_page(self.driver, url)
+
+    def load_page(self, driver, url):
+        """Loads the URL in the browser and counts the page load for recycling. A leased
+           browser that exceeds the page load timeout is closed and replaced"""
+        pool = self.config.driver_pool()
+        started = time.time()
+        try:
+            driver.get(url)
+        except selenium.common.exceptions.TimeoutException:
+            logger.warning('Page load timed out after %.0fs: %s', time.time() - started, url)
+            if getattr(self.leases(), 'driver', None) is driver:
+                self.leases().driver = None
+                pool.discard(driver, 'timeout')
+            raise
+        pool.record_page_load(driver)
+        self.log_page_load(driver, url, time.time() - started)
+
+    @staticmethod
+    def log_page_load(driver, url, duration):
+        """Logs load time, number of requests and bytes transferred of the page in the browser.
+           Cross-origin resources without timing permission are counted with 0 bytes"""
+        try:
+            metrics = driver.execute_script(PAGE_LOAD_METRICS_SCRIPT)
+        except JavascriptException:
+            metrics = None
+        if not metrics:
+            logger.info('Browser loaded %s in %.2fs', url, duration)
+            return
+        logger.info('Browser loaded %s in %.2fs: %d requests, %d kB transferred',
+                    url, duration, metrics['requests'], metrics['transferSize'] // 1024)
+
+    def get_soup_with_proxy(self, url):
+        """Will try proxies until it's possible to crawl and return a soup"""
+        return self.make_soup(self.fetch_proxy(url))
 
     def extract_data(self, soup):
         """Should be implemented in subclass"""
@@ -181,10 +441,12 @@ class Crawler:
         logger.debug("Got search URL %s", search_url)
 
         # load first page
+        self.page_cache.track(search_url)
         soup = self.get_page(search_url)
 
         # get data from first page
         entries = self.extract_data(soup)
+        self.page_cache.check_entries(search_url, entries)
         # apply crawler specific filter
         entries = self.entry_is_new_and_fits(entries, self.MODULE_NAME)
         logger.debug('Number of found entries: %d', len(entries))
@@ -192,28 +454,29 @@ class Crawler:
         return entries
 
     def entry_is_new_and_fits(self, entries, module_name):
-        """ Check whether apartment fits and is not present in json log. """
-        filepath = os.path.join(os.getcwd(), f'{module_name}_{self.config["user"]}.json')
-        if os.path.exists(filepath):
-            with open(filepath, 'r') as file:
-                already_contacted_entries = json.load(file)
-        else:
-            already_contacted_entries = {}
-
-        filtered_entreis = []
+        """ Check whether apartment fits and has not been contacted before. """
+        store = self.config.contacted_store()
+        user = self.config["user"]
+        filtered_entries = []
+        new_ids = set()
         for entry in entries:
-            if entry['id'] not in list(already_contacted_entries.keys()) and self.apartment_fits(entry):
-                filtered_entreis.append(entry)
-                already_contacted_entries.update({entry['id']: entry})
+            if str(entry['id']) in new_ids or store.is_contacted(module_name, user, entry['id']):
+                continue
+            if self.apartment_fits(entry):
+                filtered_entries.append(entry)
+                new_ids.add(str(entry['id']))
 
-        # save contacted entries
-        with open(filepath, 'w') as file:
-            json.dump(already_contacted_entries, file)
-
-        return filtered_entreis
+        store.add(module_name, user, filtered_entries)
+        return filtered_entries
 
     def submit_to_entries(self, entries):
-        """ Submit to all available entries and log it. """
+        """ Submit to all available entries and log it. If an application queue is
+            running, the applications are queued instead of submitted right away """
+        queue = self.config.application_queue()
+        if self.AUTO_SUBMIT and queue is not None:
+            queued = [entry for entry in entries if queue.enqueue(self.get_name(), entry)]
+            logger.info('Queued %d applications for %s', len(queued), self.get_name())
+            return
         if self.AUTO_SUBMIT:
             for entry in entries:
                 try:
@@ -225,6 +488,8 @@ class Crawler:
                     logger.info('Failure')
                     entry.update({'applied': 'No'})
                     self.driver.save_screenshot(f'screenshots\\{entry["id"]}.png')
+                finally:
+                    self.log_wait_times()
         self.log_success_rate(entries)
 
     def apartment_fits(self, entry):
@@ -238,9 +503,13 @@ class Crawler:
         if re.search(self.URL_PATTERN, url):
             try:
                 return self.get_results(url, max_pages)
+            except PageNotModified:
+                return []
             except requests.exceptions.ConnectionError:
                 logger.warning("Connection to %s failed. Retrying.", url.split('/')[2])
                 return []
+            finally:
+                self.release_driver()
         return []
 
     def get_name(self):
@@ -275,7 +544,7 @@ class Crawler:
                       f'geetest_validate: "{captcha_response.validate}",'
                       f'data: "{data}"}});')
             driver.execute_script(script)
-            sleep(2)
+            self.wait_for('geetest_submitted', NetworkIdle(), driver)
         except CaptchaUnsolvableError:
             driver.refresh()
             raise
@@ -351,51 +620,35 @@ class Crawler:
         driver.switch_to.default_content()
 
     def click_was_enough(self, driver):
-        try:
-            WebDriverWait(driver, 30).until(
-                EC.visibility_of_element_located((By.CLASS_NAME, "recaptcha-checkbox-checked")))
-            return True
-        except selenium.common.exceptions.TimeoutException:
-            return False
+        return self.wait_for('captcha_checkbox',
+                             element_visible(By.CLASS_NAME, "recaptcha-checkbox-checked"),
+                             driver) is not None
 
     def _wait_for_captcha_resolution(self, driver, afterlogin_string=""):
         xpath_string = f"//*[contains(text(), '{afterlogin_string}')]"
-        try:
-            WebDriverWait(driver, 120) \
-                .until(EC.visibility_of_element_located((By.XPATH, xpath_string)))
-        except selenium.common.exceptions.TimeoutException:
-            print("No Captcha solution found.")
+        if self.wait_for('captcha_solved', element_visible(By.XPATH, xpath_string), driver) is None:
+            logger.info("No Captcha solution found.")
 
     def _wait_for_iframe(self, driver: selenium.webdriver.Chrome, element_selector=None):
         """Wait for iFrame to appear"""
-        iframe = None
         if not element_selector:
             element_selector = "iframe[src^='https://www.google.com/recaptcha/api2/anchor?']"
-        while iframe is None:
-            try:
-                iframe = WebDriverWait(driver, 10).until(EC.visibility_of_element_located(
-                    (By.CSS_SELECTOR, element_selector)))
-                return iframe
-            except (selenium.common.exceptions.TimeoutException, NoSuchElementException):
-                logger.info("No iframe found, therefore no chaptcha verification necessary")
-                return None
+        iframe = self.wait_for('captcha_iframe', element_visible(By.CSS_SELECTOR, element_selector),
+                               driver)
+        if iframe is None:
+            logger.info("No iframe found, therefore no chaptcha verification necessary")
+        return iframe
 
     def _wait_until_iframe_disappears(self, driver: selenium.webdriver.Chrome):
         """Wait for iFrame to disappear"""
-        element_selectors = ["iframe[src^='https://www.google.com/recaptcha/api2/bframe?']",
-                             "iframe[src^='https://www.google.com/recaptcha/api2/anchor?']"]
-        element_selector = element_selectors.pop()
-        try:
-            WebDriverWait(driver, 10).until(EC.invisibility_of_element(
-                (By.CSS_SELECTOR, element_selector)))
-        except (selenium.common.exceptions.TimeoutException, NoSuchElementException):
-            if len(element_selectors) == 0:
-                logger.info("Element not found")
+        element_selector = "iframe[src^='https://www.google.com/recaptcha/api2/anchor?']"
+        if self.wait_for('captcha_iframe_gone', element_invisible(By.CSS_SELECTOR, element_selector),
+                         driver) is None:
+            logger.info("Element not found")
 
     def get_driver(self):
-        captcha_config = self.config.get('captcha')
-        driver_arguments = captcha_config.get('driver_arguments', [])
-        return self.configure_driver(driver_arguments)
+        """Launches a new browser, configured for captcha solving"""
+        return self.configure_driver(self.config.captcha_driver_arguments())
 
     def try_solving_capthca(self, checkbox=False):
         if re.search("initGeetest", self.driver.page_source):
@@ -426,8 +679,71 @@ class Crawler:
 
     def find_and_fill(self, element, input_value, method=By.XPATH):
         text_area = self.driver.find_element(method, element)
-        text_area.clear()
-        text_area.send_keys(input_value)
+        self.fill_element(text_area, input_value)
+
+    def fill_element(self, field, input_value):
+        """Fills a form field. In the default 'inject' fill mode, the value is set through
+           JavaScript; the field is only typed into if it rejects that value"""
+        started = time.time()
+        mode = 'inject'
+        try:
+            filled = self.config.form_fill_mode() == 'inject' \
+                and self.driver.execute_script(self.FILL_SCRIPT, field, input_value)
+        except JavascriptException:
+            filled = False
+        if not filled:
+            mode = 'type'
+            field.clear()
+            field.send_keys(input_value)
+        logger.info('Filled %d characters into "%s" in %.2fs (%s)', len(input_value),
+                    field.get_attribute('name') or field.get_attribute('id'),
+                    time.time() - started, mode)
+
+    def is_logged_in(self):
+        """Checks the page in the browser for LOGGED_IN_XPATH, without waiting for it"""
+        if self.LOGGED_IN_XPATH is None:
+            return False
+        previous_wait = self.driver.timeouts.implicit_wait
+        self.driver.implicitly_wait(0)
+        try:
+            return len(self.driver.find_elements(By.XPATH, self.LOGGED_IN_XPATH)) > 0
+        finally:
+            self.driver.implicitly_wait(previous_wait)
+
+    def restore_login_session(self):
+        """Makes sure the browser, which is on a page of the portal, is logged in, using
+           the saved login session if needed. Returns False if it is still logged out"""
+        if self.LOGGED_IN_XPATH is None:
+            return False
+        if self.is_logged_in():
+            return True
+        if not self.config.login_session_store().restore(self.get_name(), self.driver):
+            return False
+        self.driver.refresh()
+        if self.is_logged_in():
+            logger.info('Restored login session for %s', self.get_name())
+            return True
+        logger.info('Saved login session for %s has expired', self.get_name())
+        return False
+
+    def save_login_session(self):
+        """Saves the login session of the browser, if it is logged in"""
+        if self.is_logged_in():
+            self.config.login_session_store().save(self.get_name(), self.driver)
+
+    def ensure_logged_in(self):
+        """Logs the browser in to the portal. The full login only runs if there is no
+           valid saved login session"""
+        if self.restore_login_session():
+            return
+        self.login()
+        logger.info('Login successful')
+        self.save_login_session()
+
+    def login(self):
+        """Runs the login form of the portal. Crawlers of portals that need a login
+           override this"""
+        logger.debug('%s has no login form', self.get_name())
 
     @staticmethod
     def get_contact_text(file_name):
@@ -440,7 +756,7 @@ class Crawler:
     def log_success_rate(self, entries):
         """ Log the success rate to a json """
         total = len(entries)
-        succesful = len([entry for entry in entries if entry['applied']])
+        succesful = len([entry for entry in entries if entry.get('applied') == 'Yes'])
         failed_entries = [entry['id'] for entry in entries]
         log = {
             'rate': succesful / total if total > 0 else None,
@@ -456,5 +772,9 @@ class CaptchaNotFound(Exception):
     pass
 
 
+class FetchFailed(Exception):
+    """Raised by a fetch strategy that could not load a page"""
+
+
 class ApplicationUnsuccesfulException(Exception):
     pass
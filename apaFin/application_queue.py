@@ -0,0 +1,234 @@
+"""Durable queue of automatic applications, drained by a background worker so that
+crawling does not wait for contact forms to be submitted"""
+import datetime
+import json
+from dataclasses import dataclass
+import sqlite3 as lite
+import threading
+import time
+import traceback
+
+from apaFin.idmaintainer import migrate
+from apaFin.logging import logger
+
+
+@dataclass
+class Outcome:
+    """New state of an application after an attempt to submit it"""
+    status: str
+    error: str = None
+    next_attempt: datetime.datetime = None
+    attempts: int = None
+
+
+class ApplicationQueue:
+    """SQLite table of pending, applied and failed applications, one row per expose
+       and crawler. Stored in the same database as the processed exposes"""
+
+    PENDING = 'pending'
+    IN_PROGRESS = 'in_progress'
+    APPLIED = 'applied'
+    FAILED = 'failed'
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.threadlocal = threading.local()
+
+    def get_connection(self):
+        """Connects to the SQLite database. Connections are thread-local"""
+        connection = getattr(self.threadlocal, 'connection', None)
+        if connection is None:
+            try:
+                connection = lite.connect(self.db_name)
+                migrate(connection)
+                self.threadlocal.connection = connection
+            except lite.Error as error:
+                logger.error("Error %s:", error.args[0])
+                raise error
+        return connection
+
+    def enqueue(self, crawler_name, expose):
+        """Queues an application for the expose. Returns False if it was queued before"""
+        now = datetime.datetime.now()
+        connection = self.get_connection()
+        cur = connection.execute('INSERT OR IGNORE INTO applications (crawler, expose_id, \
+                                  expose, status, attempts, created, updated, next_attempt) \
+                                  VALUES (?, ?, ?, ?, 0, ?, ?, ?)',
+                                 (crawler_name, str(expose['id']), json.dumps(expose),
+                                  self.PENDING, now, now, now))
+        connection.commit()
+        return cur.rowcount > 0
+
+    def claim_next(self, concurrency=None):
+        """Takes the oldest application that is due out of the queue and marks it as
+           in progress. 'concurrency' maps a crawler name to the number of applications
+           for the portal that may be in progress at the same time. The claim is atomic,
+           so concurrent workers never get the same application. Returns (crawler name,
+           expose), or None if nothing is due"""
+        connection = self.get_connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            in_progress = dict(connection.execute(
+                'SELECT crawler, COUNT(*) FROM applications WHERE status = ? GROUP BY crawler',
+                (self.IN_PROGRESS,)).fetchall())
+            rows = connection.execute('SELECT crawler, expose_id, expose FROM applications \
+                                       WHERE status = ? AND next_attempt <= ? \
+                                       ORDER BY next_attempt',
+                                      (self.PENDING, datetime.datetime.now()))
+            for crawler_name, expose_id, expose in rows:
+                if concurrency is not None and \
+                        in_progress.get(crawler_name, 0) >= concurrency(crawler_name):
+                    continue
+                connection.execute('UPDATE applications SET status = ?, updated = ? \
+                                    WHERE crawler = ? AND expose_id = ?',
+                                   (self.IN_PROGRESS, datetime.datetime.now(),
+                                    crawler_name, expose_id))
+                return crawler_name, json.loads(expose)
+            return None
+        finally:
+            connection.commit()
+
+    def mark_applied(self, crawler_name, expose, latency=None):
+        """Records a successful application, and how many seconds submitting it took"""
+        self._update(crawler_name, expose, Outcome(self.APPLIED))
+        connection = self.get_connection()
+        connection.execute('UPDATE applications SET latency = ? WHERE crawler = ? AND expose_id = ?',
+                           (latency, crawler_name, str(expose['id'])))
+        connection.commit()
+
+    def queued_at(self, crawler_name, expose):
+        """Time the application for the expose was queued"""
+        row = self.get_connection().execute('SELECT created FROM applications \
+                                             WHERE crawler = ? AND expose_id = ?',
+                                            (crawler_name, str(expose['id']))).fetchone()
+        return datetime.datetime.fromisoformat(row[0]) if row is not None else None
+
+    def mark_failed(self, crawler_name, expose, error, max_attempts, retry_delay):
+        """Records a failed attempt. The application is retried after 'retry_delay'
+           (growing with every attempt) until 'max_attempts' attempts have failed"""
+        connection = self.get_connection()
+        row = connection.execute('SELECT attempts FROM applications \
+                                  WHERE crawler = ? AND expose_id = ?',
+                                 (crawler_name, str(expose['id']))).fetchone()
+        attempts = (row[0] if row is not None else 0) + 1
+        if attempts >= max_attempts:
+            self._update(crawler_name, expose, Outcome(self.FAILED, error, attempts=attempts))
+            return False
+        next_attempt = datetime.datetime.now() + retry_delay * attempts
+        self._update(crawler_name, expose,
+                     Outcome(self.PENDING, error, next_attempt, attempts))
+        return True
+
+    def _update(self, crawler_name, expose, outcome):
+        connection = self.get_connection()
+        connection.execute('UPDATE applications SET status = ?, last_error = ?, updated = ?, \
+                            next_attempt = COALESCE(?, next_attempt), \
+                            attempts = COALESCE(?, attempts + 1) \
+                            WHERE crawler = ? AND expose_id = ?',
+                           (outcome.status, outcome.error, datetime.datetime.now(),
+                            outcome.next_attempt, outcome.attempts,
+                            crawler_name, str(expose['id'])))
+        connection.commit()
+
+    def requeue_interrupted(self):
+        """Puts applications that were in progress when the process stopped back
+           into the queue"""
+        connection = self.get_connection()
+        cur = connection.execute('UPDATE applications SET status = ? WHERE status = ?',
+                                 (self.PENDING, self.IN_PROGRESS))
+        connection.commit()
+        return cur.rowcount
+
+    def status_counts(self):
+        """Number of applications per status"""
+        cur = self.get_connection().execute(
+            'SELECT status, COUNT(*) FROM applications GROUP BY status')
+        return dict(cur.fetchall())
+
+
+def start_application_workers(config, queue):
+    """Resumes interrupted applications and starts the configured number of workers"""
+    requeued = queue.requeue_interrupted()
+    if requeued > 0:
+        logger.info("Resuming %d interrupted applications", requeued)
+    workers = [ApplicationWorker(config, queue, number)
+               for number in range(config.application_workers())]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def drain_application_workers(workers):
+    """Lets the workers submit every application that is due, then waits for them to
+       stop. Applications waiting for a retry stay queued for the next run"""
+    for worker in workers:
+        worker.drain()
+    for worker in workers:
+        worker.join()
+
+
+class ApplicationWorker(threading.Thread):
+    """Background thread submitting queued applications, one at a time. Several workers
+       submit in parallel, each in a browser of its own, leased from the driver pool for
+       every application and logged in from the saved login session"""
+
+    def __init__(self, config, queue, number=0):
+        super().__init__(name=f'application-worker-{number}', daemon=True)
+        self.config = config
+        self.queue = queue
+        self.stopped = threading.Event()
+        self.draining = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            if not self.process_next():
+                if self.draining.is_set():
+                    return
+                self.draining.wait(self.config.application_poll_seconds())
+
+    def stop(self):
+        """Stops the worker after the current application"""
+        self.stopped.set()
+        self.draining.set()
+
+    def drain(self):
+        """Stops the worker as soon as the queue has no application that is due"""
+        self.draining.set()
+
+    def searcher(self, crawler_name):
+        """The search plugin with the given name"""
+        return next((searcher for searcher in self.config.searchers()
+                     if searcher.get_name() == crawler_name), None)
+
+    def process_next(self):
+        """Submits the next due application. Returns False if the queue had none"""
+        job = self.queue.claim_next(self.config.application_concurrency)
+        if job is None:
+            return False
+        crawler_name, expose = job
+        searcher = self.searcher(crawler_name)
+        if searcher is None:
+            self.queue.mark_failed(crawler_name, expose, 'no such crawler', 1,
+                                   datetime.timedelta(0))
+            return True
+        logger.info("Attempt automatic application for %s", expose['url'])
+        started = time.time()
+        try:
+            searcher.submit_application(expose)
+            latency = time.time() - started
+            self.queue.mark_applied(crawler_name, expose, latency)
+            waited = datetime.datetime.now() - self.queue.queued_at(crawler_name, expose)
+            logger.info("Application for %s succeeded in %.1fs, %.0fs after it was queued",
+                        expose['url'], latency, waited.total_seconds())
+        # pylint: disable=broad-except
+        except Exception as error:
+            logger.debug("".join(traceback.TracebackException.from_exception(error).format()))
+            retry = self.queue.mark_failed(crawler_name, expose, repr(error),
+                                           self.config.application_max_attempts(),
+                                           self.config.application_retry_delay())
+            logger.info("Application for %s failed (%s)%s", expose['url'], repr(error),
+                        ", will retry" if retry else "")
+        finally:
+            searcher.log_wait_times()
+            searcher.release_driver()
+        return True
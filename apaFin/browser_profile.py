@@ -0,0 +1,59 @@
+"""Resource blocking and page load metrics for the browser"""
+from apaFin.logging import logger
+
+# Always blocked: loading the geetest captcha is left to the captcha solver
+GEETEST_URL_PATTERN = "https://api.geetest.com/get.*"
+
+ANALYTICS_HOSTS = [
+    'google-analytics.com',
+    'googletagmanager.com',
+    'googlesyndication.com',
+    'doubleclick.net',
+    'connect.facebook.net',
+    'hotjar.com',
+    'criteo.com',
+    'criteo.net',
+    'adnxs.com',
+    'tiqcdn.com',
+    'bat.bing.com',
+]
+
+
+def extension_patterns(extensions):
+    """URL patterns matching paths that end in one of the extensions, with or without a
+       query string"""
+    return [pattern for extension in extensions
+            for pattern in (f'*.{extension}', f'*.{extension}?*')]
+
+
+RESOURCE_URL_PATTERNS = {
+    'images': extension_patterns(['png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'svg', 'ico']),
+    'media': extension_patterns(['mp4', 'webm', 'mp3', 'ogg', 'm4a', 'm3u8']),
+    'fonts': extension_patterns(['woff', 'woff2', 'ttf', 'otf', 'eot']),
+    'analytics': [pattern for host in ANALYTICS_HOSTS
+                  for pattern in (f'*://{host}/*', f'*://*.{host}/*')],
+}
+
+PAGE_LOAD_METRICS_SCRIPT = """
+const entries = performance.getEntriesByType('navigation')
+    .concat(performance.getEntriesByType('resource'));
+return {
+    requests: entries.length,
+    transferSize: entries.reduce((sum, entry) => sum + (entry.transferSize || 0), 0)
+};
+"""
+
+
+def blocked_url_patterns(resources, hosts):
+    """Returns the URL patterns for Network.setBlockedURLs that block the given
+       resource types ('images', 'media', 'fonts', 'analytics') and hosts"""
+    patterns = [GEETEST_URL_PATTERN]
+    for resource in resources:
+        if resource not in RESOURCE_URL_PATTERNS:
+            logger.warning('Unknown resource type "%s" to block, valid types: %s',
+                           resource, ', '.join(RESOURCE_URL_PATTERNS))
+            continue
+        patterns.extend(RESOURCE_URL_PATTERNS[resource])
+    for host in hosts:
+        patterns.extend([f'*://{host}/*', f'*://*.{host}/*'])
+    return patterns
@@ -1,4 +1,6 @@
 """Wrap configuration options as an object"""
+import atexit
+import datetime
 import os
 from typing import Optional
 
@@ -8,6 +10,7 @@ from dotenv import load_dotenv
 from apaFin.captcha.captcha_solver import CaptchaSolver
 from apaFin.captcha.imagetyperz_solver import ImageTyperzSolver
 from apaFin.captcha.twocaptcha_solver import TwoCaptchaSolver
+from apaFin.contacted_store import ContactedStore
 from apaFin.crawl_ebaykleinanzeigen import CrawlEbayKleinanzeigen
 from apaFin.crawl_idealista import CrawlIdealista
 from apaFin.crawl_immobiliare import CrawlImmobiliare
@@ -15,8 +18,13 @@ from apaFin.crawl_immobilienscout import CrawlImmobilienscout
 from apaFin.crawl_immowelt import CrawlImmowelt
 from apaFin.crawl_wggesucht import CrawlWgGesucht
 from apaFin.crawler_subito import CrawlSubito
+from apaFin.driver_pool import DriverPool
 from apaFin.filter import Filter
+from apaFin.http_session import DEFAULT_POOL_CONNECTIONS, DEFAULT_POOL_MAXSIZE
 from apaFin.logging import logger
+from apaFin.login_session import LoginSessionStore
+from apaFin.portal_registry import PortalRegistry
+from apaFin.waits import DEFAULT_WAIT_TIMEOUTS
 
 load_dotenv()
 
@@ -38,6 +46,7 @@ class Env:
     APAFIN_GOOGLE_CLOUD_PROJECT_ID = _read_env("APAFIN_GOOGLE_CLOUD_PROJECT_ID")
     APAFIN_VERBOSE_LOG = _read_env("APAFIN_VERBOSE_LOG")
     APAFIN_LOOP_PERIOD_SECONDS = _read_env("APAFIN_LOOP_PERIOD_SECONDS")
+    APAFIN_CRAWL_CONCURRENCY = _read_env("APAFIN_CRAWL_CONCURRENCY")
     APAFIN_MESSAGE_FORMAT = _read_env("APAFIN_MESSAGE_FORMAT")
 
     # Website setup
@@ -65,6 +74,11 @@ Preis: {price}
     def __init__(self, config={}):
         self.config = config
         self.__searchers__ = []
+        self.__portal_registry__ = None
+        self.__driver_pool__ = None
+        self.__login_session_store__ = None
+        self.__application_queue__ = None
+        self.__contacted_store__ = None
         self.check_deprecated()
 
     def __iter__(self):
@@ -86,6 +100,7 @@ Preis: {price}
             CrawlImmobiliare(self),
             CrawlIdealista(self)
         ]
+        self.__portal_registry__ = PortalRegistry(self.__searchers__, self.target_urls())
 
     def check_deprecated(self):
         """Notifies user of deprecated config items"""
@@ -112,18 +127,56 @@ Preis: {price}
         config = self.config
         parts = path.split('.')
         while len(parts) > 1:
-            config = config.get(parts[0], {})
+            config = config.get(parts[0]) or {}
             parts = parts[1:]
         return config.get(parts[0], default_value)
 
     def set_searchers(self, searchers):
         """Update the active search plugins"""
         self.__searchers__ = searchers
+        self.__portal_registry__ = None
 
     def searchers(self):
         """Get the list of search plugins"""
         return self.__searchers__
 
+    def portal_registry(self):
+        """Get the host name to search plugin index"""
+        if self.__portal_registry__ is None:
+            self.__portal_registry__ = PortalRegistry(self.__searchers__, self.target_urls())
+        return self.__portal_registry__
+
+    def driver_pool(self):
+        """Get the browser pool shared by all search plugins"""
+        if self.__driver_pool__ is None:
+            self.__driver_pool__ = DriverPool(self.browser_pool_size(),
+                                              max_page_loads=self.browser_max_page_loads(),
+                                              max_memory_mb=self.browser_max_memory_mb())
+            atexit.register(self.__driver_pool__.quit)
+        return self.__driver_pool__
+
+    def login_session_store(self):
+        """Get the store of saved login sessions for auto-submit"""
+        if self.__login_session_store__ is None:
+            self.__login_session_store__ = LoginSessionStore(self.login_session_directory())
+        return self.__login_session_store__
+
+    def contacted_store(self):
+        """Get the record of exposes contacted by auto-submit"""
+        if self.__contacted_store__ is None:
+            self.__contacted_store__ = ContactedStore(
+                os.path.join(self.database_location(), 'processed_ids.db'),
+                legacy_directory=os.getcwd())
+        return self.__contacted_store__
+
+    def set_application_queue(self, queue):
+        """Set the queue that automatic applications are submitted through"""
+        self.__application_queue__ = queue
+
+    def application_queue(self):
+        """Get the application queue, or None if applications are submitted right away"""
+        return self.__application_queue__
+
     def get_filter(self):
         """Read the configured filter"""
         builder = Filter.builder()
@@ -150,9 +203,143 @@ Preis: {price}
     def target_urls(self):
         return self._read_yaml_path('urls', [])
 
+    def retention_processed_days(self):
+        """Days after which processed ids are forgotten (None: keep them)"""
+        days = self._read_yaml_path('retention.processed_days')
+        return int(days) if days is not None else None
+
+    def retention_exposes_days(self):
+        """Days after which saved exposes are removed (None: keep them)"""
+        days = self._read_yaml_path('retention.exposes_days')
+        return int(days) if days is not None else None
+
+    def retention_exposes_archive(self):
+        """Database file that removed exposes are archived to (None: delete them)"""
+        return self._read_yaml_path('retention.exposes_archive')
+
+    def retention_executions_days(self):
+        """Days after which the hunts are rolled up into daily summaries (None: keep
+           them)"""
+        days = self._read_yaml_path('retention.executions_days')
+        return int(days) if days is not None else None
+
+    def retention_compact(self):
+        """Check if the database is compacted with the retention policies"""
+        return bool(self._read_yaml_path('retention.compact', False))
+
+    def maintenance_interval_hours(self):
+        """Hours between two runs of the database retention and compaction"""
+        return float(self._read_yaml_path('retention.interval_hours', 24))
+
+    def auto_submit_enabled(self):
+        """Check if applications are submitted automatically"""
+        return bool(self._read_yaml_path('auto_submit.enable', False))
+
+    def application_max_attempts(self):
+        """Number of attempts to submit an application before giving up"""
+        return int(self._read_yaml_path('auto_submit.max_attempts', 3))
+
+    def application_retry_delay(self):
+        """Delay before the first retry of a failed application; grows with each attempt"""
+        return datetime.timedelta(
+            seconds=int(self._read_yaml_path('auto_submit.retry_delay_seconds', 300)))
+
+    def form_fill_mode(self):
+        """How form fields are filled: 'inject' (set by JavaScript) or 'type' (keystrokes)"""
+        return self._read_yaml_path('auto_submit.fill_mode', 'inject')
+
+    def application_workers(self):
+        """Number of applications submitted in parallel, each in its own browser"""
+        return int(self._read_yaml_path('auto_submit.workers', 1))
+
+    def application_concurrency(self, portal_name):
+        """Number of applications to the named crawler's portal submitted in parallel"""
+        return int(self.portal_setting(portal_name, 'application_concurrency', 1))
+
+    def application_poll_seconds(self):
+        """Seconds the application worker waits when the queue is empty"""
+        return int(self._read_yaml_path('auto_submit.poll_seconds', 10))
+
+    def login_session_directory(self):
+        """Directory where the login sessions of auto-submit are saved"""
+        return self._read_yaml_path('auto_submit.session_directory',
+                                    os.path.join(self.database_location(), 'login_sessions'))
+
     def verbose_logging(self):
         return self._read_yaml_path('verbose') is not None
 
+    def html_parser(self, portal_name):
+        """BeautifulSoup parser backend used by the named crawler"""
+        return self.portal_setting(portal_name, 'html_parser',
+                                   self._read_yaml_path('html_parser', 'lxml'))
+
+    def crawl_concurrency(self):
+        """Number of crawls that may run at the same time"""
+        return int(self._read_yaml_path('crawl.concurrency', 1))
+
+    def portal_setting(self, portal_name, key, default_value=None):
+        """Read a setting from the 'portals' section for the named crawler"""
+        return self._read_yaml_path(f'portals.{portal_name}.{key}', default_value)
+
+    def http_pool_connections(self, portal_name):
+        """Number of hosts the named crawler keeps HTTP connection pools for"""
+        return int(self.portal_setting(portal_name, 'pool_connections',
+                                       self._read_yaml_path('http.pool_connections',
+                                                            DEFAULT_POOL_CONNECTIONS)))
+
+    def http_pool_maxsize(self, portal_name):
+        """Number of keep-alive connections the named crawler keeps open per host"""
+        return int(self.portal_setting(portal_name, 'pool_maxsize',
+                                       self._read_yaml_path('http.pool_maxsize',
+                                                            DEFAULT_POOL_MAXSIZE)))
+
+    def browser_pool_size(self):
+        """Maximum number of browsers running at the same time. By default, one for each
+           application worker, plus one for the crawlers"""
+        default = self.application_workers() + 1 if self.auto_submit_enabled() else 1
+        return int(self._read_yaml_path('browser.pool_size', default))
+
+    def browser_max_page_loads(self):
+        """Number of page loads after which a browser is restarted (0: never)"""
+        return int(self._read_yaml_path('browser.max_page_loads', 100))
+
+    def browser_max_memory_mb(self):
+        """Memory use in MB above which a browser is restarted (0: never)"""
+        return int(self._read_yaml_path('browser.max_memory_mb', 2048))
+
+    def browser_page_load_timeout(self):
+        """Seconds after which loading a page in the browser is aborted"""
+        return int(self._read_yaml_path('browser.page_load_timeout', 60))
+
+    def browser_implicit_wait(self):
+        """Seconds the browser looks for an element before giving up. Slow steps of the
+           submission flows wait for their condition explicitly, see wait_timeout"""
+        return float(self._read_yaml_path('browser.implicit_wait', 2))
+
+    def wait_timeout(self, step):
+        """Deadline in seconds of the named wait step of the browser flows"""
+        return float(self._read_yaml_path(f'browser.wait_timeouts.{step}',
+                                          DEFAULT_WAIT_TIMEOUTS.get(step, 10)))
+
+    def browser_page_load_strategy(self):
+        """When the browser considers a page loaded: 'normal' (all resources), 'eager'
+           (DOM ready) or 'none'"""
+        return self._read_yaml_path('browser.page_load_strategy', 'normal')
+
+    def browser_blocked_resources(self, portal_name):
+        """Resource types the browser does not load for the named crawler"""
+        return self.portal_setting(portal_name, 'block_resources',
+                                   self._read_yaml_path('browser.block_resources', []))
+
+    def browser_blocked_hosts(self, portal_name):
+        """Hosts the browser does not load anything from for the named crawler"""
+        return self.portal_setting(portal_name, 'blocked_hosts',
+                                   self._read_yaml_path('browser.blocked_hosts', []))
+
+    def pagination_concurrency(self, portal_name):
+        """Number of result pages of a single search the named crawler fetches at the same time"""
+        return int(self.portal_setting(portal_name, 'pagination_concurrency', 3))
+
     def loop_is_active(self):
         return self._read_yaml_path('loop.active', False)
 
@@ -283,6 +470,11 @@ class Config(CaptchaEnvironmentConfig,YamlConfig):
             return True
         return super().verbose_logging()
 
+    def crawl_concurrency(self):
+        if Env.APAFIN_CRAWL_CONCURRENCY is not None:
+            return int(Env.APAFIN_CRAWL_CONCURRENCY)
+        return super().crawl_concurrency()
+
     def loop_is_active(self):
         if Env.APAFIN_LOOP_PERIOD_SECONDS is not None:
             return True
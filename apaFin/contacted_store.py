@@ -0,0 +1,99 @@
+"""Record of the exposes each user has contacted on each portal"""
+import datetime
+import json
+import os
+import sqlite3 as lite
+import threading
+
+from apaFin.idmaintainer import migrate
+from apaFin.logging import logger
+
+
+class ContactedStore:
+    """SQLite table of contacted exposes, keyed by portal, user and expose id. The ids
+       of a portal and user are loaded into memory once, so membership checks do not
+       touch the database, and new entries are appended with a single insert.
+
+       Contacted exposes used to be kept in a '<portal>_<user>.json' file per portal
+       and user. If 'legacy_directory' is given, the file found there is imported the
+       first time the ids of its portal and user are loaded"""
+
+    def __init__(self, db_name, legacy_directory=None):
+        self.db_name = db_name
+        self.legacy_directory = legacy_directory
+        self.threadlocal = threading.local()
+        self.lock = threading.Lock()
+        self.contacted = {}
+
+    def get_connection(self):
+        """Connects to the SQLite database. Connections are thread-local"""
+        connection = getattr(self.threadlocal, 'connection', None)
+        if connection is None:
+            try:
+                connection = lite.connect(self.db_name)
+                migrate(connection)
+                self.threadlocal.connection = connection
+            except lite.Error as error:
+                logger.error("Error %s:", error.args[0])
+                raise error
+        return connection
+
+    def contacted_ids(self, portal, user):
+        """Set of the ids of the exposes the user has contacted on the portal"""
+        with self.lock:
+            if (portal, user) not in self.contacted:
+                if self.legacy_directory is not None:
+                    self.import_json(portal, user,
+                                     os.path.join(self.legacy_directory, f'{portal}_{user}.json'))
+                cur = self.get_connection().execute(
+                    'SELECT expose_id FROM contacted WHERE portal = ? AND user = ?',
+                    (portal, user))
+                self.contacted[(portal, user)] = {row[0] for row in cur}
+            return self.contacted[(portal, user)]
+
+    def is_contacted(self, portal, user, expose_id):
+        """Returns true if the user has contacted the expose on the portal"""
+        return str(expose_id) in self.contacted_ids(portal, user)
+
+    @staticmethod
+    def rows(portal, user, entries):
+        """Rows of the contacted table for the entries"""
+        now = datetime.datetime.now()
+        return [(portal, user, str(entry['id']), json.dumps(entry), now) for entry in entries]
+
+    def add(self, portal, user, entries):
+        """Records the exposes as contacted by the user"""
+        ids = self.contacted_ids(portal, user)
+        connection = self.get_connection()
+        connection.executemany('INSERT OR IGNORE INTO contacted VALUES (?, ?, ?, ?, ?)',
+                               self.rows(portal, user, entries))
+        connection.commit()
+        with self.lock:
+            ids.update(str(entry['id']) for entry in entries)
+
+    def import_json(self, portal, user, filepath):
+        """Imports the contacted exposes of the portal and user from a JSON file of the
+           former file based record, which maps expose ids to exposes. The import is
+           recorded in the database, so it happens only once; the file is left in place.
+           Returns the number of exposes read"""
+        connection = self.get_connection()
+        if connection.execute('SELECT 1 FROM contacted_imports WHERE portal = ? AND user = ?',
+                              (portal, user)).fetchone() is not None:
+            return 0
+        entries = {}
+        if os.path.exists(filepath):
+            with open(filepath, 'r', encoding='utf-8') as file:
+                entries = json.load(file)
+        imported = [dict(entry, id=expose_id) if isinstance(entry, dict) else {'id': expose_id}
+                    for expose_id, entry in entries.items()]
+        connection.executemany('INSERT OR IGNORE INTO contacted VALUES (?, ?, ?, ?, ?)',
+                               self.rows(portal, user, imported))
+        connection.execute('INSERT INTO contacted_imports VALUES (?, ?, ?)',
+                           (portal, user, datetime.datetime.now()))
+        connection.commit()
+        ids = self.contacted.get((portal, user))
+        if ids is not None:
+            ids.update(str(entry['id']) for entry in imported)
+        if len(entries) > 0:
+            logger.info('Imported %d contacted exposes from %s', len(entries), filepath)
+        return len(entries)
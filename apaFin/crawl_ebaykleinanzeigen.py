@@ -4,14 +4,16 @@ import datetime
 import time
 import traceback
 
-from selenium.common import ElementNotInteractableException, NoSuchElementException, TimeoutException, \
-    StaleElementReferenceException
+from bs4 import SoupStrainer
+from selenium.common import ElementNotInteractableException, NoSuchElementException, \
+    TimeoutException, StaleElementReferenceException
 from selenium.webdriver.chrome import webdriver
+from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 
 from apaFin.logging import logger
 from apaFin.abstract_crawler import Crawler, CaptchaNotFound, ApplicationUnsuccesfulException
-from selenium.webdriver.chrome.options import Options
+from apaFin.waits import element_visible
 
 
 class CrawlEbayKleinanzeigen(Crawler):
@@ -20,6 +22,18 @@ class CrawlEbayKleinanzeigen(Crawler):
     MODULE_NAME = 'ebay'
 
     URL_PATTERN = re.compile(r'https://www\.ebay-kleinanzeigen\.de')
+
+    RESULT_LIST_STRAINER = SoupStrainer(id="srchrslt-adtable")
+
+    # Elements of the login and contact forms, for applications
+    LOGIN_FORM_XPATH = '/html/body/div[1]/div/div[3]/div[1]/form'
+    LOGIN_USERNAME_XPATH = LOGIN_FORM_XPATH + '/div[1]/div/div/input'
+    LOGIN_PASSWORD_XPATH = LOGIN_FORM_XPATH + '/div[2]/div/div/input'
+    LOGIN_SUBMIT_XPATH = LOGIN_FORM_XPATH + '/div[4]/div/div/button'
+    CONTACT_MESSAGE_SELECTOR = '#viewad-contact-form > fieldset > div:nth-child(1) > div > textarea'
+    CONTACT_SUBMIT_SELECTOR = '#viewad-contact-form > fieldset > ' \
+                              'div.formgroup.formgroup--btn-submit-right > button'
+
     MONTHS = {
         "Januar": "01",
         "Februar": "02",
@@ -47,12 +61,8 @@ class CrawlEbayKleinanzeigen(Crawler):
 
         return entries
 
-    def get_page(self, search_url, driver=None, page_no=None):
-        """Applies a page number to a formatted search URL and fetches the exposes at that page"""
-        return self.get_soup_from_url(search_url)
-
     def get_expose_details(self, expose):
-        soup = self.get_page(expose['url'])
+        soup = self.get_soup_from_url(expose['url'])
         for detail in soup.find_all('li', {"class": "addetailslist--detail"}):
             if re.match(r'Verfügbar ab', detail.text):
                 date_string = re.match(r'(\w+) (\d{4})', detail.text)
@@ -78,7 +88,8 @@ class CrawlEbayKleinanzeigen(Crawler):
 
         for idx, title_el in enumerate(title_elements):
             try:
-                price = expose_ids[idx].find(class_="aditem-main--middle--price-shipping--price").text.strip()
+                price = expose_ids[idx].find(
+                    class_="aditem-main--middle--price-shipping--price").text.strip()
                 tags = expose_ids[idx].find_all(class_="simpletag tag-small")
                 address = expose_ids[idx].find("div", {"class": "aditem-main--top--left"})
                 image_element = expose_ids[idx].find("div", {"class": "galleryimage-element"})
@@ -122,7 +133,7 @@ class CrawlEbayKleinanzeigen(Crawler):
 
     def load_address(self, url):
         """Extract address from expose itself"""
-        expose_soup = self.get_page(url)
+        expose_soup = self.get_soup_from_url(url)
         try:
             street_raw = expose_soup.find(id="street-address").text
         except AttributeError:
@@ -136,11 +147,13 @@ class CrawlEbayKleinanzeigen(Crawler):
         return address
 
     def apartment_fits(self, entry):
-        accaptable_quartiers = ['Prenzlauer Berg', 'Friedrichshain', 'Mitte', 'Kreuzberg', 'Charlottenburg',
-                                'Tempelhof', 'Neukölln']
+        accaptable_quartiers = ['Prenzlauer Berg', 'Friedrichshain', 'Mitte', 'Kreuzberg',
+                                'Charlottenburg', 'Tempelhof', 'Neukölln']
         forbidden_keywords = ['Zwischenmiete', 'Untermiete', 'befristet', 'zeitweise']
-        if any([quartier.lower() in entry['address'].lower() for quartier in accaptable_quartiers]) \
-                and not any([no_go.lower() in entry['title'].lower() for no_go in forbidden_keywords]):
+        if any([quartier.lower() in entry['address'].lower()
+                for quartier in accaptable_quartiers]) \
+                and not any([no_go.lower() in entry['title'].lower()
+                             for no_go in forbidden_keywords]):
             return True
         else:
             return False
@@ -156,10 +169,10 @@ class CrawlEbayKleinanzeigen(Crawler):
         contact_text_with_salutation = 'Guten Tag,\n\n' + self.contact_text
 
         # change the location of the driver on your machine
-        self.driver.implicitly_wait(10)
+        self.driver.implicitly_wait(self.config.browser_implicit_wait())
 
         try:
-            self.driver.get(entry['url'])
+            self.load_in_browser(entry['url'])
             self.click_away_conditions()
             # log in only required at beginning
             try:
@@ -175,18 +188,24 @@ class CrawlEbayKleinanzeigen(Crawler):
                     pass
 
                 # username and password, then click log in
-                self.find_and_fill(element='/html/body/div[1]/div/div[3]/div[1]/form/div[1]/div/div/input', input_value=self.auto_submit_config['login_ebay']['username'])
-                self.find_and_fill(element='/html/body/div[1]/div/div[3]/div[1]/form/div[2]/div/div/input', input_value=self.auto_submit_config['login_ebay']['password'])
-                self.find_and_click('/html/body/div[1]/div/div[3]/div[1]/form/div[4]/div/div/button')
+                self.wait_for('login_form', element_visible(By.XPATH, self.LOGIN_USERNAME_XPATH))
+                self.find_and_fill(element=self.LOGIN_USERNAME_XPATH,
+                                   input_value=self.auto_submit_config['login_ebay']['username'])
+                self.find_and_fill(element=self.LOGIN_PASSWORD_XPATH,
+                                   input_value=self.auto_submit_config['login_ebay']['password'])
+                self.find_and_click(self.LOGIN_SUBMIT_XPATH)
                 logger.info('Login successful')
             except NoSuchElementException:
                 pass
 
             logger.info('captcha done')
 
-            self.find_and_fill(element='#viewad-contact-form > fieldset > div:nth-child(1) > div > textarea', method=By.CSS_SELECTOR, input_value=contact_text_with_salutation)
+            self.wait_for('contact_form',
+                          element_visible(By.CSS_SELECTOR, self.CONTACT_MESSAGE_SELECTOR))
+            self.find_and_fill(element=self.CONTACT_MESSAGE_SELECTOR, method=By.CSS_SELECTOR,
+                               input_value=contact_text_with_salutation)
 
-            self.find_and_click(element="#viewad-contact-form > fieldset > div.formgroup.formgroup--btn-submit-right > button", method=By.CSS_SELECTOR)
+            self.find_and_click(element=self.CONTACT_SUBMIT_SELECTOR, method=By.CSS_SELECTOR)
 
         except NoSuchElementException as e:
             logger.debug("Unable to find HTML element")
@@ -0,0 +1,46 @@
+"""Concurrent execution of crawls on a bounded pool of worker threads"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, zip_longest
+
+from apaFin.logging import logger
+
+
+class CrawlExecutor:
+    """Runs crawl jobs - (searcher, url) pairs - on a bounded pool of worker threads.
+       Different portals are crawled in parallel, but each portal runs one job at a
+       time: a portal has a single crawler instance, whose request headers, HTTP
+       session and result page cache are not safe to share between threads"""
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.portal_locks = {}
+
+    def portal_lock(self, searcher):
+        """Returns the lock serializing the crawls of the searcher's portal"""
+        return self.portal_locks.setdefault(searcher.get_name(), threading.Lock())
+
+    @staticmethod
+    def interleave(jobs):
+        """Orders the jobs round-robin by portal, so that workers are not all stuck
+           waiting for the same portal while jobs for other portals are queued"""
+        by_portal = {}
+        for job in jobs:
+            by_portal.setdefault(job[0].get_name(), []).append(job)
+        return [job for job in chain(*zip_longest(*by_portal.values())) if job is not None]
+
+    def run(self, crawl, jobs):
+        """Calls crawl(searcher, url) for every job and returns the results in job order"""
+        jobs = list(jobs)
+        locks = {id(job): self.portal_lock(job[0]) for job in jobs}
+
+        def run_job(job):
+            searcher, url = job
+            with locks[id(job)]:
+                logger.debug("Crawling %s with %s", url, searcher.get_name())
+                return list(crawl(searcher, url))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix='crawl') as executor:
+            futures = {id(job): executor.submit(run_job, job) for job in self.interleave(jobs)}
+            return [futures[id(job)].result() for job in jobs]
@@ -1,6 +1,8 @@
 """Expose crawler for Idealista"""
 import re
 
+from bs4 import SoupStrainer
+
 from apaFin.logging import logger
 from apaFin.abstract_crawler import Crawler
 
@@ -9,18 +11,12 @@ class CrawlIdealista(Crawler):
 
     URL_PATTERN = re.compile(r'https://www\.idealista\.it')
 
+    RESULT_LIST_STRAINER = SoupStrainer("article", class_="item")
+
     def __init__(self, config):
         super().__init__(config)
         self.config = config
 
-    # pylint: disable=unused-argument
-    def get_page(self, search_url, driver=None, page_no=None):
-        """Applies a page number to a formatted search URL and fetches the exposes at that page"""
-        if self.config.use_proxy():
-            return self.get_soup_with_proxy(search_url)
-
-        return self.get_soup_from_url(search_url)
-
     # pylint: disable=too-many-locals
     def extract_data(self, soup):
         """Extracts all exposes from a provided Soup object"""
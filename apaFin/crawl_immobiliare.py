@@ -1,6 +1,8 @@
 """Expose crawler for Immobiliare"""
 import re
 
+from bs4 import SoupStrainer
+
 from apaFin.logging import logger
 from apaFin.abstract_crawler import Crawler
 
@@ -9,6 +11,8 @@ class CrawlImmobiliare(Crawler):
 
     URL_PATTERN = re.compile(r'https://www\.immobiliare\.it')
 
+    RESULT_LIST_STRAINER = SoupStrainer(class_="listing-item")
+
     def __init__(self, config):
         super().__init__(config)
         self.config = config
@@ -1,18 +1,26 @@
 """Expose crawler for ImmobilienScout"""
 import datetime
+import json
+import math
 import re
-import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import requests
+from bs4 import SoupStrainer
 from jsonpath_ng import parse
-from selenium.common.exceptions import JavascriptException, NoSuchElementException, NoSuchWindowException, \
-    TimeoutException
+from selenium.common.exceptions import JavascriptException, NoSuchElementException, \
+    NoSuchWindowException, TimeoutException
 from selenium.webdriver import ActionChains
 from selenium.webdriver.common.by import By
+from selenium.webdriver.support.wait import WebDriverWait
 
-from apaFin.abstract_crawler import Crawler, CaptchaNotFound, ApplicationUnsuccesfulException
+from apaFin.abstract_crawler import Crawler, CaptchaNotFound, ApplicationUnsuccesfulException, \
+    FetchFailed
 from apaFin.captcha.captcha_solver import CaptchaUnsolvableError
 from apaFin.logging import logger
+from apaFin.utils.list import chunk
+from apaFin.waits import element_visible, url_changed
 
 
 class CrawlImmobilienscout(Crawler):
@@ -22,8 +30,35 @@ class CrawlImmobilienscout(Crawler):
 
     MODULE_NAME = 'immoscout'
 
+    # The header links to the SSO logout once logged in
+    LOGGED_IN_XPATH = "//a[contains(@href, 'sso/logout')]"
+
+    # The result list JSON is embedded in the page, so plain requests come first and
+    # the browser is only used when a captcha is hit
+    FETCH_STRATEGIES = ('direct', 'proxy', 'browser')
+
+    # The scripts hold the result list JSON; the HTML result list (ul#resultListItems)
+    # and the span with its count are kept for pages without it
+    RESULT_LIST_STRAINER = SoupStrainer(["script", "ul", "span"])
+
+    # Elements of the contact form, for applications
+    PREMIUM_CLOSE_XPATH = '/html/body/div[5]/div/div/div/div/div[2]/button'
+    PREMIUM_LOGIN_XPATH = '/html/body/div[2]/div[2]/div/header/div/div[3]/div/ul/li/div/div/div/' \
+                          'div[1]/a'
+    CONTACT_LOGIN_XPATH = '/html/body/div[5]/div/div/div/div/div/div[1]/div[2]/div/div/div/' \
+                          'form/div/div/div[3]/div/div/div[1]/div[2]/a'
+    CONTACT_TITLE_XPATH = '/html/body/div[5]/div/div/div/div/div/div[1]/h4'
+    CONTACT_SUBMIT_XPATH = '//*[@id="is24-expose-modal"]/div/div/div/div/div/div[1]/div[2]/div/' \
+                           'div/div/form/div/div/div/div[5]/div'
+    PETS_FIELD_XPATH = '/html/body/div[5]/div/div/div/div/div/div[1]/div[2]/div/div/div/form/' \
+                       'div/div/div/div[3]/div/div[5]/div/div/div[2]/div/div/div[7]/ul/li[3]'
+    CONDITIONS_XPATH = '/html/body/div[10]//div/div/div/div/div[2]/div/div[2]/div/div/div/button[2]'
+
+    RESULT_LIST_MODEL_PATTERN = re.compile(r'resultListModel\s*:\s*')
+
     JSON_PATH_PARSER_ENTRIES = parse("$..['resultlist.realEstate']")
     JSON_PATH_PARSER_IMAGES = parse("$..galleryAttachments..['@href']")
+    JSON_PATH_PARSER_PAGING = parse("$..['resultlist.resultlist'].paging")
 
     RESULT_LIMIT = 50
 
@@ -32,21 +67,8 @@ class CrawlImmobilienscout(Crawler):
 
     def __init__(self, config):
         super().__init__(config)
-        self.initialize_driver()
-
         self.config = config
-        self.driver = None
-        self.checkbox = None
-        self.afterlogin_string = None
-
-        if config.captcha_enabled():
-            driver_arguments = config.captcha_driver_arguments()
-
-            self.checkbox = config.get_captcha_checkbox()
-            self.afterlogin_string = config.get_captcha_afterlogin_string()
-
-            if self.captcha_solver:
-                self.driver = self.configure_driver(driver_arguments)
+        self.initialize_driver()
 
     def get_results(self, search_url, max_pages=None):
         """Loads the exposes from the ImmoScout site, starting at the provided URL"""
@@ -63,74 +85,204 @@ class CrawlImmobilienscout(Crawler):
 
         # load first page to get number of entries
         page_no = 1
-        soup = self.get_page(search_url, self.driver, page_no)
-
-        # If we are using Selenium, just parse the results from the JSON in the page response
-        if self.driver is not None:
-            entries = self.get_entries_from_javascript()
+        first_page_url = search_url.format(page_no)
+        self.page_cache.track(first_page_url)
+        soup = self.get_page(search_url, page_no=page_no)
+
+        # Parse the results from the result list JSON embedded in the page, if there is one
+        result_json = self.get_result_list_from_soup(soup)
+        if result_json is not None:
+            entries = self.get_entries_from_json(result_json)
             if len(entries) == 0:
                 return []
-            entries = self.entry_is_new_and_fits(entries, self.MODULE_NAME)
-            self.submit_to_entries(entries)
-            return entries
-
-        try:
-            no_of_results = int(
-                soup.find_all(lambda e: e.has_attr('data-is24-qa') and \
-                                        e['data-is24-qa'] == 'resultlist-resultCount')[0] \
-                    .text.replace('.', ''))
-        except IndexError:
-            logger.error('Index error occurred')
-            no_of_results = 0
-
-        # get data from first page
-        entries = self.extract_data(soup)
-
-        # iterate over all remaining pages
-        while len(entries) < min(no_of_results, self.RESULT_LIMIT) and \
-                (max_pages is None or page_no < max_pages):
-            logger.debug(
-                '(Next page) Number of entries: %d / Number of results: %d',
-                len(entries), no_of_results)
-            page_no += 1
-            soup = self.get_page(search_url, self.driver, page_no)
-            cur_entry = self.extract_data(soup)
-            if isinstance(cur_entry, list):
-                break
-            entries.extend(cur_entry)
+            self.page_cache.check_entries(first_page_url, entries)
+            paging = self.get_paging_from_json(result_json)
+            page_numbers = self.remaining_page_numbers(
+                int(paging.get('numberOfHits', 0)), int(paging.get('pageSize', len(entries))),
+                max_pages)
+            if self.fetch_strategies()[0] == 'browser':
+                entries.extend(self.get_entries_from_tabs(
+                    search_url, page_numbers, self.RESULT_LIMIT - len(entries)))
+            else:
+                entries.extend(self.get_entries_from_pages(
+                    search_url, page_numbers, self.RESULT_LIMIT - len(entries)))
+        else:
+            try:
+                no_of_results = int(
+                    soup.find_all(lambda e: e.has_attr('data-is24-qa') and \
+                                            e['data-is24-qa'] == 'resultlist-resultCount')[0] \
+                        .text.replace('.', ''))
+            except IndexError:
+                logger.error('Index error occurred')
+                no_of_results = 0
+
+            # get data from first page
+            entries = self.extract_data(soup)
+            self.page_cache.check_entries(first_page_url, entries)
+
+            page_numbers = self.remaining_page_numbers(no_of_results, len(entries), max_pages)
+            entries.extend(self.get_entries_from_pages(
+                search_url, page_numbers, self.RESULT_LIMIT - len(entries)))
 
         entries = self.entry_is_new_and_fits(entries, self.MODULE_NAME)
         self.submit_to_entries(entries)
         return entries
 
-    def get_entries_from_javascript(self):
-        """Get entries from JavaScript"""
+    def remaining_page_numbers(self, no_of_results, page_size, max_pages=None):
+        """Numbers of the pages after the first one that are needed to collect
+           min(no_of_results, RESULT_LIMIT) results"""
+        if page_size <= 0:
+            return []
+        last_page = math.ceil(min(no_of_results, self.RESULT_LIMIT) / page_size)
+        if max_pages is not None:
+            last_page = min(last_page, max_pages)
+        logger.debug('Number of results: %d, fetching pages 2 to %d', no_of_results, last_page)
+        return list(range(2, last_page + 1))
+
+    def get_entries_from_pages(self, search_url, page_numbers, limit):
+        """Fetches the given result pages concurrently and extracts the exposes of each
+           page as it arrives. Pages still pending are cancelled once 'limit' exposes
+           have been found. Returns the exposes in page order"""
+        if len(page_numbers) == 0 or limit <= 0:
+            return []
+        pages = {}
+        workers = min(self.config.pagination_concurrency(self.get_name()), len(page_numbers))
+        with ThreadPoolExecutor(max_workers=workers,
+                                thread_name_prefix='immoscout-page') as executor:
+            futures = {executor.submit(self.get_page, search_url, None, page_no): page_no
+                       for page_no in page_numbers}
+            for future in as_completed(futures):
+                page_no = futures[future]
+                try:
+                    page_entries = self.extract_page(future.result())
+                except (FetchFailed, requests.exceptions.RequestException) as error:
+                    logger.warning('Unable to fetch result page %d: %s', page_no, error)
+                    continue
+                pages[page_no] = page_entries
+                if sum(len(page) for page in pages.values()) >= limit:
+                    for pending in futures:
+                        pending.cancel()
+                    break
+        return [entry for page_no in sorted(pages) for entry in pages[page_no]]
+
+    def extract_page(self, soup):
+        """Extracts the exposes of a result page, from its embedded JSON if possible"""
+        result_json = self.get_result_list_from_soup(soup)
+        if result_json is not None:
+            return self.get_entries_from_json(result_json)
+        return self.extract_data(soup)
+
+    def get_result_list_from_soup(self, soup):
+        """Finds and decodes the result list JSON embedded in an inline script of the page.
+           Returns None if the page does not contain it"""
+        decoder = json.JSONDecoder()
+        for script in soup.find_all("script"):
+            text = script.string or ''
+            match = self.RESULT_LIST_MODEL_PATTERN.search(text)
+            if match is None:
+                continue
+            try:
+                model, _ = decoder.raw_decode(text, match.end())
+            except json.JSONDecodeError:
+                logger.warning("Unable to decode result list JSON")
+                continue
+            return {'resultListModel': model}
+        return None
+
+    def get_entries_from_tabs(self, search_url, page_numbers, limit):
+        """Loads the given result pages in browser tabs, several at a time, and reads
+           the exposes from each tab's JavaScript"""
+        entries = []
+        main_window = self.driver.current_window_handle
+        batch_size = self.config.pagination_concurrency(self.get_name())
+        for batch in chunk(page_numbers, batch_size):
+            if len(entries) >= limit:
+                break
+            tabs = []
+            try:
+                for page_no in batch:
+                    known_handles = set(self.driver.window_handles)
+                    self.driver.execute_script("window.open(arguments[0], '_blank');",
+                                               search_url.format(page_no))
+                    new_handles = set(self.driver.window_handles) - known_handles
+                    tabs.append((page_no, new_handles.pop()))
+                while len(tabs) > 0:
+                    page_no, handle = tabs.pop(0)
+                    self.driver.switch_to.window(handle)
+                    try:
+                        result_json = self.wait_for_result_list()
+                    finally:
+                        self.driver.close()
+                    if result_json is None:
+                        logger.warning('Unable to read result page %d from browser tab', page_no)
+                    else:
+                        entries.extend(self.get_entries_from_json(result_json))
+            finally:
+                # a failed page must not leave tabs behind in the pooled browser
+                self.close_tabs([handle for _, handle in tabs])
+                self.driver.switch_to.window(main_window)
+        return entries
+
+    def close_tabs(self, handles):
+        """Closes the browser tabs that are still open"""
+        for handle in handles:
+            try:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+            except NoSuchWindowException:
+                pass
+
+    def wait_for_result_list(self, timeout=30):
+        """Waits until the page in the current tab has published its result list"""
+        try:
+            return WebDriverWait(self.driver, timeout).until(
+                lambda driver: self.get_result_list_from_javascript())
+        except TimeoutException:
+            return None
+
+    def get_result_list_from_javascript(self):
+        """Get the result list JSON from JavaScript"""
         try:
-            result_json = self.driver.execute_script('return window.IS24.resultList;')
+            return self.driver.execute_script('return window.IS24 && window.IS24.resultList;')
         except JavascriptException:
             logger.warning("Unable to find IS24 variable in window")
+            return None
+
+    def get_entries_from_javascript(self):
+        """Get entries from JavaScript"""
+        result_json = self.get_result_list_from_javascript()
+        if result_json is None:
             return []
         return self.get_entries_from_json(result_json)
 
-    def get_entries_from_json(self, json):
+    def get_paging_from_json(self, result_json):
+        """Get the paging information (numberOfHits, pageSize, ...) from JSON"""
+        paging = self.JSON_PATH_PARSER_PAGING.find(result_json)
+        return paging[0].value if len(paging) > 0 else {}
+
+    def get_entries_from_json(self, result_json):
         """Get entries from JSON"""
         return [
-            self.extract_entry_from_javascript(entry.value) for entry in self.JSON_PATH_PARSER_ENTRIES.find(json)
+            self.extract_entry_from_javascript(entry.value)
+            for entry in self.JSON_PATH_PARSER_ENTRIES.find(result_json)
         ]
 
     def extract_entry_from_javascript(self, entry):
         """Get single entry from JavaScript"""
 
-        # the url that is being returned to the frontend has a placeholder for screen size. (%WIDTH% and %HEIGHT%)
-        # The website's frontend fills these variables based on the user's screen size.
-        # If we remove this part, the API will return the original size of the image.
+        # the url that is being returned to the frontend has a placeholder for screen size.
+        # (%WIDTH% and %HEIGHT%) The website's frontend fills these variables based on the
+        # user's screen size. If we remove this part, the API will return the original size
+        # of the image.
         #
         # Before:
-        # https://pictures.immobilienscout24.de/listings/$$IMAGE_ID$$.jpg/ORIG/legacy_thumbnail/%WIDTH%x%HEIGHT%3E/format/webp/quality/50
+        # https://pictures.immobilienscout24.de/listings/$$IMAGE_ID$$.jpg/ORIG/
+        #     legacy_thumbnail/%WIDTH%x%HEIGHT%3E/format/webp/quality/50
         #
         # After: https://pictures.immobilienscout24.de/listings/$$IMAGE_ID$$.jpg
 
-        images = [image.value[:image.value.find(".jpg") + 4] for image in self.JSON_PATH_PARSER_IMAGES.find(entry)]
+        images = [image.value[:image.value.find(".jpg") + 4]
+                  for image in self.JSON_PATH_PARSER_IMAGES.find(entry)]
 
         object_id: int = int(entry.get("@id", 0))
         return {
@@ -142,7 +294,8 @@ class CrawlImmobilienscout(Crawler):
             'address': entry.get("address", {}).get("description", {}).get("text", ''),
             'crawler': self.get_name(),
             'price': str(entry.get("price", {}).get("value", '')),
-            'total_price': str(entry.get('calculatedTotalRent', {}).get("totalRent", {}).get('value', '')),
+            'total_price': str(entry.get('calculatedTotalRent', {})
+                               .get("totalRent", {}).get('value', '')),
             'size': str(entry.get("livingSpace", '')),
             'rooms': str(entry.get("numberOfRooms", ''))
         }
@@ -153,7 +306,8 @@ class CrawlImmobilienscout(Crawler):
             search_url.format(page_no),
             driver=driver,
             checkbox=self.checkbox,
-            afterlogin_string=self.afterlogin_string
+            afterlogin_string=self.afterlogin_string,
+            parse_only=self.RESULT_LIST_STRAINER
         )
 
     def get_expose_details(self, expose):
@@ -243,8 +397,9 @@ class CrawlImmobilienscout(Crawler):
         return entries
 
     def submit_application(self, entry):
-        self.driver.implicitly_wait(15)
-        self.driver.get(f'https://www.immobilienscout24.de/{entry["id"]}#/basicContact/email')
+        self.driver.implicitly_wait(self.config.browser_implicit_wait())
+        contact_url = f'https://www.immobilienscout24.de/{entry["id"]}#/basicContact/email'
+        self.load_in_browser(contact_url)
         # self.click_away_conditions()
         self.click_away_premium_membership_offer()
 
@@ -254,42 +409,33 @@ class CrawlImmobilienscout(Crawler):
         except (TimeoutException, CaptchaNotFound):
             pass
 
-        # Case 1: Some offers are for premium members only. In this case, click close, log in, get contact page again.
-        try:
-            close_button = self.driver.find_element(By.XPATH, '/html/body/div[5]/div/div/div/div/div[2]/button')
-            self.driver.execute_script("arguments[0].click();", close_button)
-            login_button = self.driver.find_element(By.XPATH,
-                                                    '/html/body/div[2]/div[2]/div/header/div/div[3]/div/ul/li/div/div/div/div[1]/a')
-            self.driver.execute_script("arguments[0].click();", login_button)
-            username_area = self.driver.find_element(By.ID, 'username')
-            username_area.send_keys(self.auto_submit_config['login_immoscout']['username'])
-            submit_username_button = self.driver.find_element(By.ID, 'submit')
-            submit_username_button.click()
-            password_area = self.driver.find_element(By.XPATH, '/html/body/div[1]/div/form/div[4]/div/input')
-            password_area.send_keys(self.auto_submit_config['login_immoscout']['password'])
-            submit_password_button = self.driver.find_element(By.XPATH, '/html/body/div[1]/div/form/button')
-            submit_password_button.click()
-            self.driver.get(f'https://www.immobilienscout24.de/{entry["id"]}#/basicContact/email')
-            logger.info('Login successful')
-        except NoSuchElementException:
-            pass
-
-        # Case 2: Facilitate login directly.
-        try:
-            login_button = self.driver.find_element(By.XPATH,
-                                                    '/html/body/div[5]/div/div/div/div/div/div[1]/div[2]/div/div/div/form/div/div/div[3]/div/div/div[1]/div[2]/a')
-            self.driver.execute_script("arguments[0].click();", login_button)
-            username_area = self.driver.find_element(By.ID, 'username')
-            username_area.send_keys(self.auto_submit_config['login_immoscout']['username'])
-            submit_username_button = self.driver.find_element(By.ID, 'submit')
-            submit_username_button.click()
-            password_area = self.driver.find_element(By.XPATH, '/html/body/div[1]/div/form/div[4]/div/input')
-            password_area.send_keys(self.auto_submit_config['login_immoscout']['password'])
-            submit_password_button = self.driver.find_element(By.XPATH, '/html/body/div[1]/div/form/button')
-            submit_password_button.click()
-            logger.info('Login successful')
-        except NoSuchElementException:
-            pass
+        # A saved login session makes the login forms below unnecessary
+        if self.restore_login_session():
+            self.load_in_browser(contact_url)
+        else:
+            # Case 1: Some offers are for premium members only. In this case, click close,
+            # log in, get contact page again.
+            try:
+                close_button = self.driver.find_element(By.XPATH, self.PREMIUM_CLOSE_XPATH)
+                self.driver.execute_script("arguments[0].click();", close_button)
+                login_button = self.driver.find_element(By.XPATH, self.PREMIUM_LOGIN_XPATH)
+                self.driver.execute_script("arguments[0].click();", login_button)
+                self.login()
+                self.load_in_browser(contact_url)
+                logger.info('Login successful')
+                self.save_login_session()
+            except NoSuchElementException:
+                pass
+
+            # Case 2: Facilitate login directly.
+            try:
+                login_button = self.driver.find_element(By.XPATH, self.CONTACT_LOGIN_XPATH)
+                self.driver.execute_script("arguments[0].click();", login_button)
+                self.login()
+                logger.info('Login successful')
+                self.save_login_session()
+            except NoSuchElementException:
+                pass
 
         # Captchas might appear here.
         try:
@@ -298,7 +444,7 @@ class CrawlImmobilienscout(Crawler):
             pass
 
         try:
-            title = self.driver.find_element(By.XPATH, '/html/body/div[5]/div/div/div/div/div/div[1]/h4')
+            title = self.driver.find_element(By.XPATH, self.CONTACT_TITLE_XPATH)
             title_words = title.text.split(' ')
         except NoSuchElementException:
             title_words = ''
@@ -311,30 +457,46 @@ class CrawlImmobilienscout(Crawler):
             else:
                 greeting = "Guten Tag,\n\n"
             contact_text_with_salutation = greeting + self.contact_text
+            self.wait_for('contact_form', element_visible(By.ID, 'contactForm-Message'))
             text_area = self.driver.find_element(By.ID, 'contactForm-Message')
-            text_area.clear()
-            text_area.send_keys(contact_text_with_salutation)
+            self.fill_element(text_area, contact_text_with_salutation)
             self.check_for_optional_fields()
 
-            self.find_and_click(
-                '//*[@id="is24-expose-modal"]/div/div/div/div/div/div[1]/div[2]/div/div/div/form/div/div/div/div[5]/div')
+            self.find_and_click(self.CONTACT_SUBMIT_XPATH)
         except NoSuchElementException as e:
             logger.debug("Unable to find HTML element")
             logger.debug("".join(traceback.TracebackException.from_exception(e).format()))
             raise ApplicationUnsuccesfulException
 
+    def login(self):
+        """Fills in the SSO login form, which asks for username and password in turn"""
+        self.wait_for('login_form', element_visible(By.ID, 'username'))
+        username_area = self.driver.find_element(By.ID, 'username')
+        username_area.send_keys(self.auto_submit_config['login_immoscout']['username'])
+        submit_username_button = self.driver.find_element(By.ID, 'submit')
+        submit_username_button.click()
+        password_xpath = '/html/body/div[1]/div/form/div[4]/div/input'
+        self.wait_for('login_form', element_visible(By.XPATH, password_xpath))
+        password_area = self.driver.find_element(By.XPATH, password_xpath)
+        password_area.send_keys(self.auto_submit_config['login_immoscout']['password'])
+        login_url = self.driver.current_url
+        submit_password_button = self.driver.find_element(
+            By.XPATH, '/html/body/div[1]/div/form/button')
+        submit_password_button.click()
+        # the SSO page redirects back once the login went through
+        self.wait_for('login_submitted', url_changed(login_url), required=True)
+
     def check_for_optional_fields(self):
         try:
             "Haben Sie Haustiere?"
-            self.find_and_click(
-                '/html/body/div[5]/div/div/div/div/div/div[1]/div[2]/div/div/div/form/div/div/div/div[3]/div/div[5]/div/div/div[2]/div/div/div[7]/ul/li[3]')
+            self.find_and_click(self.PETS_FIELD_XPATH)
             logger.info('Fill optional fields')
         except NoSuchElementException:
             pass
 
     def click_away_conditions(self):
         try:
-            self.find_and_click('/html/body/div[10]//div/div/div/div/div[2]/div/div[2]/div/div/div/button[2]')
+            self.find_and_click(self.CONDITIONS_XPATH)
             logger.info('Click away conditions')
         except NoSuchElementException:
             pass
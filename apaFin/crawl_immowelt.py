@@ -5,11 +5,13 @@ import hashlib
 import time
 import traceback
 
+from bs4 import SoupStrainer
 from selenium.common import NoSuchElementException
 from selenium.webdriver.common.by import By
 
 from apaFin.logging import logger
 from apaFin.abstract_crawler import Crawler, CaptchaNotFound, ApplicationUnsuccesfulException
+from apaFin.waits import element_visible, url_changed
 
 
 class CrawlImmowelt(Crawler):
@@ -19,13 +21,27 @@ class CrawlImmowelt(Crawler):
 
     MODULE_NAME = 'immowelt'
 
+    # The account menu of the header offers to log out once logged in
+    LOGGED_IN_XPATH = "//navigation-ui-header//*" \
+                      "[contains(text(), 'Abmelden') or contains(text(), 'Ausloggen')]"
+
+    RESULT_LIST_STRAINER = SoupStrainer("main")
+
+    # Elements of the contact and login forms, for applications
+    CONTACT_BUTTON_XPATH = '/html/body/app-root/div/div/div/div[2]/main/app-expose/div[3]/' \
+                           'div[3]/sd-container[1]/sd-row[9]/sd-col/app-offerer/sd-card/' \
+                           'app-commercial-offerer/div[3]/sd-button/button'
+    LOGIN_LINK_XPATH = '/html/body/app-root/div/div/div/div[1]/navigation-ui-header/div/header/' \
+                       'div[2]/div[2]/div/nav/div/ul/li[1]/div/ul/li[1]/a'
+    LOGIN_PASSWORD_XPATH = '/html/body/div[1]/div/div[1]/div/form[1]/div/div/div[2]/div/input'
+
     def __init__(self, config):
         super().__init__(config)
         self.initialize_driver()
 
     def get_expose_details(self, expose):
         """Loads additional details for an expose by processing the expose detail URL"""
-        soup = self.get_page(expose['url'])
+        soup = self.get_soup_from_url(expose['url'])
         date = datetime.datetime.now().strftime("%2d.%2m.%Y")
 
         immo_div = soup.find("app-estate-object-informations")
@@ -123,10 +139,12 @@ class CrawlImmowelt(Crawler):
         logger.debug("Got search URL %s", search_url)
 
         # load first page
+        self.page_cache.track(search_url)
         soup = self.get_page(search_url)
 
         # get data from first page
         entries = self.extract_data(soup)
+        self.page_cache.check_entries(search_url, entries)
         entries = self.entry_is_new_and_fits(entries, self.MODULE_NAME)
         logger.debug('Number of found entries: %d', len(entries))
 
@@ -138,30 +156,44 @@ class CrawlImmowelt(Crawler):
         contact_text_with_salutation = 'Guten Tag,\n\n' + self.contact_text
 
         # change the location of the driver on your machine
-        self.driver.implicitly_wait(10)
+        self.driver.implicitly_wait(self.config.browser_implicit_wait())
 
         try:
-            self.driver.get(entry['url'])
-            # log in
-            self.find_and_click('/html/body/app-root/div/div/div/div[1]/navigation-ui-header/div/header/div[2]/div[2]/div/nav/div/ul/li[1]/div/ul/li[1]/a')
-            self.find_and_fill('/html/body/div[1]/div/div[1]/div/form[1]/div/div/div[1]/input', self.auto_submit_config['login_immowelt']['username'])
-            self.find_and_fill('/html/body/div[1]/div/div[1]/div/form[1]/div/div/div[2]/div/input', self.auto_submit_config['login_immowelt']['password'])
-            self.find_and_click('/html/body/div[1]/div/div[1]/div/form[1]/div/div/div[3]/input')
-            logger.info('Login successful')
-            try:
-                self.try_solving_capthca(checkbox=True)
-                self.find_and_click('/html/body/div[1]/div/div[1]/div/form[1]/div/div/div[3]/input')
-            except CaptchaNotFound:
-                pass
-            # go back to the expose url
-            self.driver.get(entry['url'])
+            self.load_in_browser(entry['url'])
+            # log in, unless the saved login session is still valid
+            if not self.restore_login_session():
+                self.login()
+                logger.info('Login successful')
+                # go back to the expose url
+                self.load_in_browser(entry['url'])
+                self.save_login_session()
             # click contact button
-            self.find_and_click('/html/body/app-root/div/div/div/div[2]/main/app-expose/div[3]/div[3]/sd-container[1]/sd-row[9]/sd-col/app-offerer/sd-card/app-commercial-offerer/div[3]/sd-button/button')
+            self.find_and_click(self.CONTACT_BUTTON_XPATH)
             # fill out text field
-            self.find_and_fill('/html/body/div[4]/div/div/div[2]/div/form/sd-form-field[3]/textarea', contact_text_with_salutation)
+            text_xpath = '/html/body/div[4]/div/div/div[2]/div/form/sd-form-field[3]/textarea'
+            self.wait_for('contact_form', element_visible(By.XPATH, text_xpath))
+            self.find_and_fill(text_xpath, contact_text_with_salutation)
             # submit
             self.find_and_click('/html/body/div[4]/div/div/div[2]/div/form/sd-button/button')
         except NoSuchElementException as e:
             logger.debug("Unable to find HTML element")
             logger.debug("".join(traceback.TracebackException.from_exception(e).format()))
-            raise ApplicationUnsuccesfulException
\ No newline at end of file
+            raise ApplicationUnsuccesfulException
+
+    def login(self):
+        """Opens the login page from the header and fills in the login form"""
+        self.find_and_click(self.LOGIN_LINK_XPATH)
+        username_xpath = '/html/body/div[1]/div/div[1]/div/form[1]/div/div/div[1]/input'
+        self.wait_for('login_form', element_visible(By.XPATH, username_xpath))
+        login_url = self.driver.current_url
+        self.find_and_fill(username_xpath, self.auto_submit_config['login_immowelt']['username'])
+        self.find_and_fill(self.LOGIN_PASSWORD_XPATH,
+                           self.auto_submit_config['login_immowelt']['password'])
+        self.find_and_click('/html/body/div[1]/div/div[1]/div/form[1]/div/div/div[3]/input')
+        try:
+            self.try_solving_capthca(checkbox=True)
+            self.find_and_click('/html/body/div[1]/div/div[1]/div/form[1]/div/div/div[3]/input')
+        except CaptchaNotFound:
+            pass
+        # the login page redirects back once the login went through
+        self.wait_for('login_submitted', url_changed(login_url), required=True)
@@ -1,16 +1,15 @@
 """Expose crawler for WgGesucht"""
 import re
-import time
 import traceback
 
-import requests
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
 from selenium.common import ElementNotInteractableException, NoSuchElementException
 from selenium.webdriver.common.by import By
 
 from apaFin.logging import logger
 from apaFin.abstract_crawler import Crawler, ApplicationUnsuccesfulException
 from apaFin.string_utils import remove_prefix
+from apaFin.waits import NetworkIdle, element_invisible, element_visible
 
 
 class CrawlWgGesucht(Crawler):
@@ -20,6 +19,20 @@ class CrawlWgGesucht(Crawler):
 
     MODULE_NAME = 'wg_gesucht'
 
+    # The login link turns into a logout link once logged in
+    LOGGED_IN_XPATH = "//a[contains(@href, 'logout') or contains(text(), 'Ausloggen')]"
+
+    # WG-Gesucht applies search filters only after the page has been loaded once
+    # in the session, so the 'session' strategy primes each URL before fetching it
+    FETCH_STRATEGIES = ('session', 'proxy', 'browser')
+
+    RESULT_LIST_STRAINER = SoupStrainer(id=re.compile(r'^liste-'))
+
+    # Elements of the contact form, for applications. The title element may vary in
+    # position, see submit_application()
+    CONTACT_TITLE_XPATH = '/html/body/div[3]/div[1]/div[3]/div[1]/div[1]/div[{}]/div[1]/label/b'
+    CONTACT_SUBMIT_XPATH = "//button[@data-ng-click='submit()' or contains(.,'Nachricht senden')]"
+
     def __init__(self, config):
         super().__init__(config)
         self.config = config
@@ -107,65 +120,23 @@ class CrawlWgGesucht(Crawler):
             logger.debug("No address in response for URL: %s", url)
             return None
 
-    def get_soup_from_url(
-            self,
-            url,
-            driver=None,
-            checkbox=None,
-            afterlogin_string=None):
-        """
-        Creates a Soup object from the HTML at the provided URL
-
-        Overwrites the method inherited from abstract_crawler. This is
-        necessary as we need to reload the page once for all filters to
-        be applied correctly on wg-gesucht.
-        """
-        self.rotate_user_agent()
-        sess = requests.session()
-        # First page load to set filters; response is discarded
-        sess.get(url, headers=self.HEADERS)
-        # Second page load
-        resp = sess.get(url, headers=self.HEADERS)
-
-        if resp.status_code not in (200, 405):
-            logger.error("Got response (%i): %s", resp.status_code, resp.content)
-        if self.config.use_proxy():
-            return self.get_soup_with_proxy(url)
-        if driver is not None:
-            driver.get(url)
-            if re.search("initGeetest", driver.page_source):
-                self.resolve_geetest(driver)
-            elif re.search("g-recaptcha", driver.page_source):
-                self.resolve_recaptcha(driver, checkbox, afterlogin_string)
-            return BeautifulSoup(driver.page_source, 'html.parser')
-        return BeautifulSoup(resp.content, 'html.parser')
-
     def submit_application(self, entry):
         # todo does not work on 2nd entry
         # change the location of the driver on your machine
-        self.driver.implicitly_wait(30)
+        self.driver.implicitly_wait(self.config.browser_implicit_wait())
         try:
-            self.driver.get('https://www.wg-gesucht.de/nachricht-senden/' + entry['url'].split('/')[-1])
+            self.load_in_browser('https://www.wg-gesucht.de/nachricht-senden/'
+                                 + entry['url'].split('/')[-1])
             self.click_away_conditions()
 
-            # log in on first connect
+            # log in on first connect, unless the saved login session is still valid
             try:
-                try:
-                    self.find_and_click("//*[contains(text(), 'loggen')]")
-                except (NoSuchElementException, ElementNotInteractableException):
-                    self.find_and_click("//*[contains(text(), 'Login')]")
-                self.find_and_fill(element='login_email_username',
-                                   input_value=self.auto_submit_config['login_wggesucht']['username'], method=By.ID)
-                self.find_and_fill(element='login_password',
-                                   input_value=self.auto_submit_config['login_wggesucht']['password'], method=By.ID)
-
-                self.find_and_click('login_submit', method=By.ID)
-                logger.info('Login successful')
+                self.ensure_logged_in()
             except NoSuchElementException:
                 pass
 
             # if already contacted, break here
-            time.sleep(5)
+            self.wait_for('page_settled', NetworkIdle())
             if self.driver.page_source.find(self.contact_text[-10:]) != -1:
                 return 0
 
@@ -179,8 +150,7 @@ class CrawlWgGesucht(Crawler):
             title_words = ''
             for i in [3, 4, 5]:
                 try:
-                    title = self.driver.find_element(By.XPATH,
-                                                     f'/html/body/div[3]/div[1]/div[3]/div[1]/div[1]/div[{i}]/div[1]/label/b')
+                    title = self.driver.find_element(By.XPATH, self.CONTACT_TITLE_XPATH.format(i))
                     title_words = title.text[:-1].split(' ')
                     break
                 except NoSuchElementException:
@@ -194,7 +164,9 @@ class CrawlWgGesucht(Crawler):
                 greeting = "Guten Tag,\n\n"
             contact_text_with_salutation = greeting + self.contact_text
 
-            self.find_and_fill(element='message_input', input_value=contact_text_with_salutation, method=By.ID)
+            self.wait_for('contact_form', element_visible(By.ID, 'message_input'))
+            self.find_and_fill(element='message_input', input_value=contact_text_with_salutation,
+                               method=By.ID)
 
             # add documents
             # self.find_and_click('//*[@id="messenger_form"]/div[1]/div[5]/button[2]')
@@ -203,12 +175,30 @@ class CrawlWgGesucht(Crawler):
             #
             # self.find_and_click('//*[@id="attachments_modal"]/div/div/div[2]/div/div[2]/button')
 
-            self.find_and_click("//button[@data-ng-click='submit()' or contains(.,'Nachricht senden')]")
+            self.find_and_click(self.CONTACT_SUBMIT_XPATH)
         except NoSuchElementException as e:
             logger.debug("Unable to find HTML element")
             logger.debug("".join(traceback.TracebackException.from_exception(e).format()))
             raise ApplicationUnsuccesfulException
 
+    def login(self):
+        """Opens the login dialog and fills it in"""
+        try:
+            self.find_and_click("//*[contains(text(), 'loggen')]")
+        except (NoSuchElementException, ElementNotInteractableException):
+            self.find_and_click("//*[contains(text(), 'Login')]")
+        self.wait_for('login_form', element_visible(By.ID, 'login_email_username'))
+        login = self.auto_submit_config['login_wggesucht']
+        self.find_and_fill(element='login_email_username', input_value=login['username'],
+                           method=By.ID)
+        self.find_and_fill(element='login_password', input_value=login['password'],
+                           method=By.ID)
+
+        self.find_and_click('login_submit', method=By.ID)
+        # the login dialog closes once the login went through
+        self.wait_for('login_submitted', element_invisible(By.ID, 'login_email_username'),
+                      required=True)
+
     def click_away_conditions(self):
         try:
             self.find_and_click('/html/body/div[2]/div[1]/div[2]/span[2]/a')
@@ -2,6 +2,8 @@
 import re
 import json
 
+from bs4 import SoupStrainer
+
 from apaFin.logging import logger
 from apaFin.abstract_crawler import Crawler
 
@@ -10,6 +12,8 @@ class CrawlSubito(Crawler):
 
     URL_PATTERN = re.compile(r'https://www\.subito\.it')
 
+    RESULT_LIST_STRAINER = SoupStrainer("script", id="__NEXT_DATA__")
+
     def __init__(self, config):
         super().__init__(config)
         self.config = config
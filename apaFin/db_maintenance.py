@@ -0,0 +1,54 @@
+"""Background retention and compaction of the SQLite database"""
+import datetime
+import sqlite3 as lite
+import threading
+import time
+
+from apaFin.logging import logger
+
+
+class DatabaseMaintenance(threading.Thread):
+    """Applies the configured retention policies to the database and compacts it, once
+       at startup and then periodically. Runs on a thread of its own, and deletes in
+       short transactions, so hunts are not blocked"""
+
+    def __init__(self, config, id_watch):
+        super().__init__(name='db-maintenance', daemon=True)
+        self.config = config
+        self.id_watch = id_watch
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.run_once()
+            except lite.Error as error:
+                logger.error('Database maintenance failed: %s', error.args[0])
+            self.stopped.wait(self.config.maintenance_interval_hours() * 3600)
+
+    def stop(self):
+        """Stops the thread after the current maintenance run"""
+        self.stopped.set()
+
+    def run_once(self):
+        """Applies the retention policies and compacts the database"""
+        started = time.monotonic()
+        now = datetime.datetime.now()
+        removed = {}
+        processed_days = self.config.retention_processed_days()
+        if processed_days is not None:
+            removed['processed'] = self.id_watch.prune_processed(
+                now - datetime.timedelta(days=processed_days))
+        exposes_days = self.config.retention_exposes_days()
+        if exposes_days is not None:
+            removed['exposes'] = self.id_watch.prune_exposes(
+                now - datetime.timedelta(days=exposes_days),
+                archive=self.config.retention_exposes_archive())
+        executions_days = self.config.retention_executions_days()
+        if executions_days is not None:
+            removed['executions'] = self.id_watch.roll_up_executions(
+                now - datetime.timedelta(days=executions_days))
+        if self.config.retention_compact():
+            self.id_watch.compact()
+        logger.info('Database maintenance took %.1fs, removed rows: %s',
+                    time.monotonic() - started, removed)
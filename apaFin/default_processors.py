@@ -1,7 +1,5 @@
 """Built-in expose processor implementations. Used by the processor pipelines
    in apaFin and in the webservice"""
-import re
-
 from apaFin.logging import logger
 from apaFin.abstract_processor import Processor
 
@@ -25,11 +23,10 @@ class AddressResolver(Processor):
         """Fetches the expose from the expose URL and extracts the address"""
         if expose['address'].startswith('http'):
             url = expose['address']
-            for searcher in self.config.searchers():
-                if re.search(searcher.URL_PATTERN, url):
-                    expose['address'] = searcher.load_address(url)
-                    logger.debug("Loaded address %s for url %s", expose['address'], url)
-                    break
+            searcher = self.config.portal_registry().searcher_for_url(url)
+            if searcher is not None:
+                expose['address'] = searcher.load_address(url)
+                logger.debug("Loaded address %s for url %s", expose['address'], url)
         return expose
 
 class CrawlExposeDetails(Processor):
@@ -40,9 +37,9 @@ class CrawlExposeDetails(Processor):
 
     def process_expose(self, expose):
         """Fetches the page at exposes['url'] and extracts additional details from it"""
-        for searcher in self.config.searchers():
-            if re.search(searcher.URL_PATTERN, expose['url']):
-                expose = searcher.get_expose_details(expose)
+        searcher = self.config.portal_registry().searcher_for_url(expose['url'])
+        if searcher is not None:
+            expose = searcher.get_expose_details(expose)
         return expose
 
 class LambdaProcessor(Processor):
@@ -0,0 +1,153 @@
+"""Process-wide pool of WebDrivers, shared by all crawlers"""
+import os
+import threading
+
+from selenium.common.exceptions import WebDriverException
+
+from apaFin.logging import logger
+
+
+def process_tree_rss_mb(pid):
+    """Resident memory of a process and all its descendants in MB, read from /proc.
+       Returns None if it cannot be determined"""
+    total_kb = 0
+    pending = [pid]
+    while len(pending) > 0:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status', encoding='utf-8') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children', encoding='utf-8') as children:
+                    pending.extend(int(child) for child in children.read().split())
+        except (OSError, ValueError):
+            if current == pid:
+                return None
+    return total_kb // 1024
+
+
+def browser_pid(driver):
+    """Process id of the browser controlled by the driver, if known"""
+    pid = getattr(driver, 'browser_pid', None)
+    if pid is None:
+        process = getattr(getattr(driver, 'service', None), 'process', None)
+        pid = getattr(process, 'pid', None)
+    return pid
+
+
+class DriverPool:
+    """Bounded pool of browser instances. Browsers are launched lazily, when a lease
+       finds no idle driver and the pool is not full yet; otherwise the lease waits
+       until another thread returns its driver.
+
+       Before an idle driver is handed out again, it is probed: drivers that do not
+       respond, have loaded 'max_page_loads' pages or use more than 'max_memory_mb'
+       of memory are closed and replaced by a fresh browser"""
+
+    def __init__(self, size, max_page_loads=None, max_memory_mb=None):
+        self.size = max(1, size)
+        self.max_page_loads = max_page_loads
+        self.max_memory_mb = max_memory_mb
+        self.drivers = []
+        self.idle = []
+        self.launching = 0
+        self.page_loads = {}
+        self.launched = 0
+        self.restarts = {}
+        self.condition = threading.Condition()
+
+    def acquire(self, factory):
+        """Leases a driver, launching a new one with 'factory' if the pool has room"""
+        while True:
+            with self.condition:
+                while len(self.idle) == 0 and len(self.drivers) + self.launching >= self.size:
+                    self.condition.wait()
+                if len(self.idle) == 0:
+                    self.launching += 1
+                    break
+                driver = self.idle.pop()
+            reason = self.recycle_reason(driver)
+            if reason is None:
+                return driver
+            self.discard(driver, reason)
+        try:
+            driver = factory()
+        except Exception:
+            with self.condition:
+                self.launching -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.launching -= 1
+            self.drivers.append(driver)
+            self.page_loads[id(driver)] = 0
+            self.launched += 1
+        logger.debug("Launched browser %d of %d", len(self.drivers), self.size)
+        return driver
+
+    def release(self, driver):
+        """Returns a leased driver to the pool"""
+        with self.condition:
+            if driver in self.drivers:
+                self.idle.append(driver)
+            self.condition.notify()
+
+    def record_page_load(self, driver):
+        """Counts a page loaded by the driver"""
+        with self.condition:
+            if id(driver) in self.page_loads:
+                self.page_loads[id(driver)] += 1
+
+    def recycle_reason(self, driver):
+        """Returns why the driver has to be replaced, or None if it is fit for use"""
+        if self.max_page_loads and self.page_loads.get(id(driver), 0) >= self.max_page_loads:
+            return 'page_loads'
+        if self.max_memory_mb:
+            pid = browser_pid(driver)
+            rss_mb = process_tree_rss_mb(pid) if pid is not None else None
+            if rss_mb is not None and rss_mb > self.max_memory_mb:
+                return 'memory'
+        try:
+            driver.execute_script('return document.readyState;')
+        except WebDriverException:
+            return 'unhealthy'
+        return None
+
+    def discard(self, driver, reason):
+        """Closes a driver and removes it from the pool, making room for a new one"""
+        with self.condition:
+            if driver in self.drivers:
+                self.drivers.remove(driver)
+            if driver in self.idle:
+                self.idle.remove(driver)
+            page_loads = self.page_loads.pop(id(driver), 0)
+            self.restarts[reason] = self.restarts.get(reason, 0) + 1
+            self.condition.notify()
+        logger.info("Restarting browser (%s) after %d page loads, restarts so far: %s",
+                    reason, page_loads, self.restarts)
+        self._quit(driver)
+
+    def stats(self):
+        """Number of browsers launched and restarted, by restart reason"""
+        with self.condition:
+            return {'running': len(self.drivers), 'launched': self.launched,
+                    'restarts': dict(self.restarts)}
+
+    def quit(self):
+        """Closes all browsers of the pool"""
+        with self.condition:
+            drivers = self.drivers
+            self.drivers = []
+            self.idle = []
+            self.page_loads = {}
+        for driver in drivers:
+            self._quit(driver)
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except WebDriverException:
+            logger.warning("Unable to close browser", exc_info=True)
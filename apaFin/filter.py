@@ -1,36 +1,11 @@
 """Module with implementations of standard expose filters"""
 from functools import reduce
+from itertools import islice
 import re
 
+from apaFin.expose_helper import ExposeHelper
 from apaFin.idmaintainer import AlreadySeenFilter
 
-class ExposeHelper:
-    """Helper functions for extracting data from expose text"""
-
-    @staticmethod
-    def get_price(expose):
-        """Extracts the price from a price text"""
-        price_match = re.search(r'\d+([\.,]\d+)?', expose['price'])
-        if price_match is None:
-            return None
-        return float(price_match[0].replace(".", "").replace(",", "."))
-
-    @staticmethod
-    def get_size(expose):
-        """Extracts the size from a size text"""
-        size_match = re.search(r'\d+([\.,]\d+)?', expose['size'])
-        if size_match is None:
-            return None
-        return float(size_match[0].replace(",", "."))
-
-    @staticmethod
-    def get_rooms(expose):
-        """Extracts the number of rooms from a room text"""
-        rooms_match = re.search(r'\d+([\.,]\d+)?', expose['rooms'])
-        if rooms_match is None:
-            return None
-        return float(rooms_match[0].replace(",", "."))
-
 class MaxPriceFilter:
     """Exclude exposes above a given price"""
 
@@ -44,6 +19,10 @@ class MaxPriceFilter:
             return True
         return price <= self.max_price
 
+    def sql_clause(self):
+        """SQL condition on the price column, like is_interesting"""
+        return '(price IS NULL OR price <= ?)', [self.max_price]
+
 class MinPriceFilter:
     """Exclude exposes below a given price"""
 
@@ -57,6 +36,10 @@ class MinPriceFilter:
             return True
         return price >= self.min_price
 
+    def sql_clause(self):
+        """SQL condition on the price column, like is_interesting"""
+        return '(price IS NULL OR price >= ?)', [self.min_price]
+
 class MaxSizeFilter:
     """Exclude exposes above a given size"""
 
@@ -70,6 +53,10 @@ class MaxSizeFilter:
             return True
         return size <= self.max_size
 
+    def sql_clause(self):
+        """SQL condition on the size column, like is_interesting"""
+        return '(size IS NULL OR size <= ?)', [self.max_size]
+
 class MinSizeFilter:
     """Exclude exposes below a given size"""
 
@@ -83,6 +70,10 @@ class MinSizeFilter:
             return True
         return size >= self.min_size
 
+    def sql_clause(self):
+        """SQL condition on the size column, like is_interesting"""
+        return '(size IS NULL OR size >= ?)', [self.min_size]
+
 class MaxRoomsFilter:
     """Exclude exposes above a given number of rooms"""
 
@@ -96,6 +87,10 @@ class MaxRoomsFilter:
             return True
         return rooms <= self.max_rooms
 
+    def sql_clause(self):
+        """SQL condition on the rooms column, like is_interesting"""
+        return '(rooms IS NULL OR rooms <= ?)', [self.max_rooms]
+
 class MinRoomsFilter:
     """Exclude exposes below a given number of rooms"""
 
@@ -109,6 +104,10 @@ class MinRoomsFilter:
             return True
         return rooms >= self.min_rooms
 
+    def sql_clause(self):
+        """SQL condition on the rooms column, like is_interesting"""
+        return '(rooms IS NULL OR rooms >= ?)', [self.min_rooms]
+
 class TitleFilter:
     """Exclude exposes whose titles match the provided terms"""
 
@@ -139,6 +138,10 @@ class PPSFilter:
         pps = price / size
         return pps <= self.max_pps
 
+    def sql_clause(self):
+        """SQL condition on the price per square column, like is_interesting"""
+        return '(price_per_sqm IS NULL OR price_per_sqm <= ?)', [self.max_pps]
+
 class PredicateFilter:
     """Include only those exposes satisfying the predicate"""
 
@@ -201,6 +204,10 @@ class FilterBuilder:
 class Filter:
     """Abstract filter object"""
 
+    # Number of exposes filtered together, so that filters with a storage
+    # lookup need one round trip per batch
+    BATCH_SIZE = 500
+
     def __init__(self, filters):
         self.filters = filters
 
@@ -209,9 +216,35 @@ class Filter:
         return reduce((lambda x, y: x and y),
                       map((lambda x: x.is_interesting(expose)), self.filters), True)
 
+    def sql_where(self):
+        """WHERE clause and its parameters selecting the exposes that pass all filters
+           with an SQL equivalent. The other filters still have to be applied"""
+        clauses = [expose_filter.sql_clause() for expose_filter in self.filters
+                   if hasattr(expose_filter, 'sql_clause')]
+        if len(clauses) == 0:
+            return '1', []
+        return ' AND '.join(clause for clause, _ in clauses), \
+            [param for _, params in clauses for param in params]
+
     def filter(self, exposes):
-        """Apply all filters to every expose in the list"""
-        return filter(self.is_interesting_expose, exposes)
+        """Apply all filters to every expose in the list. The exposes are filtered in
+           batches; filters with a 'filter_batch' method handle a batch at once. Every
+           filter sees the whole batch, so the already-seen filter marks all crawled
+           exposes, not only those that passed the filters before it"""
+        exposes = iter(exposes)
+        while True:
+            batch = list(islice(exposes, self.BATCH_SIZE))
+            if len(batch) == 0:
+                return
+            kept = batch
+            for expose_filter in self.filters:
+                if hasattr(expose_filter, 'filter_batch'):
+                    passed = expose_filter.filter_batch(batch)
+                else:
+                    passed = [expose for expose in batch if expose_filter.is_interesting(expose)]
+                passed = {id(expose) for expose in passed}
+                kept = [expose for expose in kept if id(expose) in passed]
+            yield from kept
 
     @staticmethod
     def builder():
@@ -7,10 +7,23 @@ from firebase_admin import firestore
 
 from apaFin.logging import logger
 from apaFin.config import Config
+from apaFin.seen_ids import BloomFilter, SeenIdCache
+from apaFin.utils.list import chunk
 
 class GoogleCloudIdMaintainer:
     """Storage back-end - implementation of IdMaintainer API"""
 
+    # Firestore commits at most 500 writes per batch
+    WRITE_BATCH_SIZE = 500
+
+    # Documents read per page, and at most, when looking for recent exposes that
+    # pass a filter
+    RECENT_EXPOSES_PAGE_SIZE = 25
+    RECENT_EXPOSES_SCAN_LIMIT = 100
+
+    # Largest seen-id filter that is stored, well below the 1 MiB document limit
+    SEEN_IDS_MAX_BYTES = 800 * 1024
+
     def __init__(self):
         project_id = Config().google_cloud_project_id()
         if project_id is None:
@@ -19,47 +32,161 @@ class GoogleCloudIdMaintainer:
             'projectId': project_id
         })
         self.database = firestore.client()
+        self.seen_id_cache = self.create_seen_id_cache()
+        self.seen_ids_changed = False
+
+    def create_seen_id_cache(self):
+        """Filter of the processed ids. Cloud runs do not share a process, so the filter
+           is stored in a single document, read once per run, instead of being rebuilt
+           from all processed documents"""
+        return SeenIdCache(self.get_processed_ids, load_filter=self.load_seen_ids)
+
+    def seen_ids(self):
+        """Filter of the processed ids, so that most lookups need no document read"""
+        return self.seen_id_cache
+
+    def seen_ids_document(self):
+        """The document the seen-id filter is stored in"""
+        return self.database.collection(u'seen_ids').document(u'filter')
+
+    def load_seen_ids(self):
+        """Returns the stored seen-id filter, or None if there is none"""
+        data = self.seen_ids_document().get().to_dict()
+        if data is None:
+            return None
+        try:
+            return BloomFilter.from_dict(data)
+        except (KeyError, ValueError) as error:
+            logger.warning('Ignoring stored seen-id filter: %s', error)
+            return None
+
+    def save_seen_ids(self):
+        """Stores the seen-id filter. Ids another run has added since this one loaded the
+           filter are merged in first; runs that save at the very same time may still
+           lose each other's ids, which are then reported again as new"""
+        stored = self.load_seen_ids()
+        data = self.seen_ids().snapshot(merge_with=stored)
+        if data is None:
+            return
+        if len(data['bits']) > self.SEEN_IDS_MAX_BYTES:
+            # a stale filter would hide ids, so the filter is rebuilt on every run instead
+            logger.warning('Seen-id filter is too large to be stored (%d bytes)',
+                           len(data['bits']))
+            self.seen_ids_document().delete()
+            return
+        self.seen_ids_document().set(data)
+
+    def get_processed_ids(self):
+        """Returns the ids of all processed exposes. Reads every document, so this is
+           only used when there is no stored seen-id filter, or it has to grow"""
+        return [doc.id for doc in self.database.collection(u'processed').stream()]
 
     def mark_processed(self, expose_id):
         """Mark exposes as processed when we have processed them"""
         logger.debug('mark_processed(%d)', expose_id)
         self.database.collection(u'processed').document(str(expose_id)).set({u'id': expose_id})
+        self.seen_ids().add(expose_id)
+        self.seen_ids_changed = True
+
+    def are_processed(self, expose_ids):
+        """Returns the set of the given ids that have already been marked as processed,
+           reading the documents of all possible hits of the seen-id filter in one
+           request"""
+        candidates = {str(expose_id): expose_id for expose_id in expose_ids
+                      if self.seen_ids().might_contain(expose_id)}
+        if len(candidates) == 0:
+            return set()
+        collection = self.database.collection(u'processed')
+        found = {doc.id for doc in self.database.get_all(
+            [collection.document(expose_id) for expose_id in candidates]) if doc.exists}
+        for expose_id in candidates:
+            self.seen_ids().confirm(expose_id in found)
+        return {candidates[expose_id] for expose_id in found}
+
+    def mark_processed_many(self, expose_ids):
+        """Marks the exposes as processed with batched writes"""
+        collection = self.database.collection(u'processed')
+        for ids in chunk(list(expose_ids), self.WRITE_BATCH_SIZE):
+            batch = self.database.batch()
+            for expose_id in ids:
+                batch.set(collection.document(str(expose_id)), {u'id': expose_id})
+            batch.commit()
+            for expose_id in ids:
+                self.seen_ids().add(expose_id)
+            self.seen_ids_changed = True
 
     def is_processed(self, expose_id):
         """Returns true if an expose has already been marked as processed"""
         logger.debug('is_processed(%d)', expose_id)
+        if not self.seen_ids().might_contain(expose_id):
+            return False
         doc = self.database.collection(u'processed').document(str(expose_id))
-        return doc.get().exists
+        processed = doc.get().exists
+        self.seen_ids().confirm(processed)
+        return processed
 
-    def save_expose(self, expose):
-        """Writes an expose to the storage backend"""
+    def flush(self):
+        """Stores the seen-id filter if ids were marked as processed since the last
+           flush. Ids marked by a run that stops before it flushes are missing from the
+           stored filter, so they would be reported as new once more"""
+        if self.seen_ids_changed:
+            self.save_seen_ids()
+            self.seen_ids_changed = False
+
+    @staticmethod
+    def expose_record(expose):
+        """The document stored for an expose"""
         record = expose.copy()
         record.update({'created_at': pytz.utc.localize(datetime.datetime.now()),
                        'created_sort': (0 - datetime.datetime.now().timestamp())})
-        self.database.collection(u'exposes').document(str(expose[u'id'])).set(record)
+        return record
+
+    def save_expose(self, expose):
+        """Writes an expose to the storage backend"""
+        self.database.collection(u'exposes').document(str(expose[u'id'])) \
+            .set(self.expose_record(expose))
+
+    def save_exposes(self, exposes):
+        """Writes exposes to the storage backend with batched writes"""
+        collection = self.database.collection(u'exposes')
+        for exposes_batch in chunk(list(exposes), self.WRITE_BATCH_SIZE):
+            batch = self.database.batch()
+            for expose in exposes_batch:
+                batch.set(collection.document(str(expose[u'id'])), self.expose_record(expose))
+            batch.commit()
 
     def get_exposes_since(self, min_datetime):
-        """Returns all exposes since the supplied datetime"""
+        """Returns all exposes since the supplied datetime, newest first. Only the
+           matching documents are read"""
         localized_datetime = min_datetime.replace(tzinfo=pytz.UTC)
-        res = []
-        for doc in self.database.collection(u'exposes')\
-                       .order_by('created_sort').limit(10000).stream():
-            if doc.to_dict()[u'created_at'] < localized_datetime:
-                break
-            res.append(doc.to_dict())
-        return res
+        # pylint: disable=no-member
+        query = self.database.collection(u'exposes') \
+            .where(u'created_at', u'>=', localized_datetime) \
+            .order_by(u'created_at', direction=firestore.Query.DESCENDING)
+        return [doc.to_dict() for doc in query.stream()]
 
     def get_recent_exposes(self, count, filter_set=None):
         """Returns recent exposes (no more than 'count'), conforming to
-           the provided filter if supplied"""
+           the provided filter if supplied. Without a filter, only 'count' documents
+           are read; with one, they are read page by page until enough pass it"""
+        page_size = max(count, 1) if filter_set is None else self.RECENT_EXPOSES_PAGE_SIZE
+        query = self.database.collection(u'exposes').order_by('created_sort')
         res = []
-        for doc in self.database.collection(u'exposes')\
-                       .order_by('created_sort').limit(100).stream():
-            expose = doc.to_dict()
-            if filter_set is None or filter_set.is_interesting_expose(expose):
-                res.append(expose)
-                if len(res) == count:
-                    break
+        scanned = 0
+        last_doc = None
+        while scanned < self.RECENT_EXPOSES_SCAN_LIMIT:
+            page = query if last_doc is None else query.start_after(last_doc)
+            docs = list(page.limit(page_size).stream())
+            for doc in docs:
+                expose = doc.to_dict()
+                if filter_set is None or filter_set.is_interesting_expose(expose):
+                    res.append(expose)
+                    if len(res) == count:
+                        return res
+            scanned += len(docs)
+            if len(docs) < page_size:
+                break
+            last_doc = docs[-1]
         return res
 
     def get_settings_for_user(self, user_id):
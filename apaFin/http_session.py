@@ -0,0 +1,21 @@
+"""Pooled HTTP sessions, so that page fetches reuse keep-alive connections"""
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+
+
+def create_session(headers=None,
+                   pool_connections=DEFAULT_POOL_CONNECTIONS,
+                   pool_maxsize=DEFAULT_POOL_MAXSIZE):
+    """Creates a requests session with a keep-alive connection pool of the given size.
+       'pool_connections' is the number of hosts to keep pools for, 'pool_maxsize' the
+       number of connections kept open per host"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if headers is not None:
+        session.headers.update(headers)
+    return session
@@ -5,6 +5,7 @@ import requests
 
 from apaFin.logging import logger
 from apaFin.config import YamlConfig
+from apaFin.crawl_executor import CrawlExecutor
 from apaFin.filter import Filter
 from apaFin.processor import ProcessorChain
 from apaFin.captcha.captcha_solver import CaptchaUnsolvableError
@@ -20,7 +21,9 @@ class Hunter:
         self.id_watch = id_watch
 
     def crawl_for_exposes(self, max_pages=None):
-        """Trigger a new crawl of the configured URLs"""
+        """Trigger a new crawl of the configured URLs. If crawl concurrency is configured,
+           the crawls run on a pool of worker threads; the exposes are still processed
+           on the calling thread, so the (thread-local) storage connections stay safe"""
 
         def try_crawl(searcher, url, max_pages):
             try:
@@ -32,9 +35,21 @@ class Hunter:
                 logger.info("Error while scraping url %s:\n%s", url, traceback.format_exc())
                 return []
 
-        return chain(*[try_crawl(searcher, url, max_pages)
-                       for searcher in self.config.searchers()
-                       for url in self.config.target_urls()])
+        jobs = self.config.portal_registry().jobs(self.config.target_urls())
+
+        concurrency = self.config.crawl_concurrency()
+        if concurrency > 1 and len(jobs) > 1:
+            executor = CrawlExecutor(concurrency)
+            return chain(*executor.run(lambda searcher, url: try_crawl(searcher, url, max_pages),
+                                       jobs))
+
+        return chain(*[try_crawl(searcher, url, max_pages) for (searcher, url) in jobs])
+
+    def commit_page_fingerprints(self):
+        """Lets the crawlers skip the unchanged search pages of this hunt next time, once
+           their exposes have been processed"""
+        for searcher in self.config.searchers():
+            searcher.page_cache.commit()
 
     def hunt_flats(self, max_pages=None):
         """Crawl, process and filter exposes"""
@@ -57,4 +72,8 @@ class Hunter:
             logger.info('New offer: %s', expose['title'])
             result.append(expose)
 
+        self.id_watch.flush()
+        self.commit_page_fingerprints()
+        if hasattr(self.id_watch, 'seen_ids'):
+            logger.debug('Seen-id filter: %s', self.id_watch.seen_ids().stats())
         return result
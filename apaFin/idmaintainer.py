@@ -1,11 +1,17 @@
 """SQLite implementation of IDMaintainer interface"""
+import atexit
 import threading
 import sqlite3 as lite
 import datetime
 import json
+from itertools import islice
 
 from apaFin.logging import logger
 from apaFin.abstract_processor import Processor
+from apaFin.expose_helper import ExposeHelper
+from apaFin.seen_ids import SeenIdCache
+from apaFin.utils.list import chunk
+from apaFin.write_behind import WriteBehindWriter
 
 __author__ = "Nody"
 __version__ = "0.1"
@@ -13,9 +19,155 @@ __maintainer__ = "Nody"
 __email__ = "harrymcfly@protonmail.com"
 __status__ = "Prodction"
 
+def expose_numbers(expose):
+    """Price, size, rooms and price per square of the expose, None where unknown"""
+    def parse(getter):
+        try:
+            return getter(expose)
+        except (KeyError, TypeError):
+            return None
+    price = parse(ExposeHelper.get_price)
+    size = parse(ExposeHelper.get_size)
+    rooms = parse(ExposeHelper.get_rooms)
+    price_per_sqm = price / size if price is not None and size else None
+    return price, size, rooms, price_per_sqm
+
+
+def backfill_expose_numbers(connection):
+    """Fills the numeric columns of the exposes saved before they existed"""
+    rows = connection.execute('SELECT rowid, details FROM exposes').fetchall()
+    connection.executemany('UPDATE exposes SET price = ?, size = ?, rooms = ?, \
+                            price_per_sqm = ? WHERE rowid = ?',
+                           [(*expose_numbers(json.loads(details)), rowid)
+                            for rowid, details in rows])
+
+
+def add_application_latency(connection):
+    """Adds the submission time to the applications table. Queues created before the
+       table was migrated may have the column already"""
+    columns = [row[1] for row in connection.execute('PRAGMA table_info(applications)')]
+    if 'latency' not in columns:
+        connection.execute('ALTER TABLE applications ADD COLUMN latency REAL')
+
+
+# Schema migrations, applied in order to databases whose user_version is lower
+# than their position in the list (counting from 1). A migration step is an SQL
+# statement or a function of the connection
+SCHEMA_MIGRATIONS = [
+    [
+        'CREATE TABLE IF NOT EXISTS processed (ID INTEGER)',
+        'CREATE TABLE IF NOT EXISTS executions (timestamp timestamp)',
+        'CREATE TABLE IF NOT EXISTS exposes (id INTEGER, created TIMESTAMP, \
+            crawler STRING, details BLOB, PRIMARY KEY (id, crawler))',
+        'CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, settings BLOB)',
+    ],
+    [
+        'DELETE FROM processed WHERE rowid NOT IN \
+            (SELECT MIN(rowid) FROM processed GROUP BY id)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS processed_id ON processed (id)',
+        'CREATE INDEX IF NOT EXISTS exposes_created ON exposes (created)',
+    ],
+    [
+        'ALTER TABLE exposes ADD COLUMN price REAL',
+        'ALTER TABLE exposes ADD COLUMN size REAL',
+        'ALTER TABLE exposes ADD COLUMN rooms REAL',
+        'ALTER TABLE exposes ADD COLUMN price_per_sqm REAL',
+        backfill_expose_numbers,
+    ],
+    [
+        # the age of ids processed so far is unknown, they count as processed now
+        'ALTER TABLE processed ADD COLUMN created TIMESTAMP',
+        "UPDATE processed SET created = datetime('now', 'localtime')",
+        'CREATE INDEX IF NOT EXISTS processed_created ON processed (created)',
+        'CREATE TABLE IF NOT EXISTS executions_daily (day TEXT PRIMARY KEY, runs INTEGER, \
+            first_run TIMESTAMP, last_run TIMESTAMP)',
+    ],
+    [
+        # contacted exposes, see ContactedStore
+        'CREATE TABLE IF NOT EXISTS contacted (portal TEXT, user TEXT, expose_id TEXT, \
+            details BLOB, created TIMESTAMP, PRIMARY KEY (portal, user, expose_id))',
+        'CREATE TABLE IF NOT EXISTS contacted_imports (portal TEXT, user TEXT, \
+            imported TIMESTAMP, PRIMARY KEY (portal, user))',
+    ],
+    [
+        # queued applications, see ApplicationQueue
+        'CREATE TABLE IF NOT EXISTS applications (crawler STRING, expose_id STRING, \
+            expose BLOB, status STRING, attempts INTEGER, last_error STRING, \
+            created TIMESTAMP, updated TIMESTAMP, next_attempt TIMESTAMP, \
+            PRIMARY KEY (crawler, expose_id))',
+        add_application_latency,
+    ],
+]
+
+# Bytes of the database file that SQLite reads through memory mapping
+MMAP_SIZE = 64 * 1024 * 1024
+
+
+def migrate(connection):
+    """Brings the schema of the database up to date. The check and the migrations run
+       in one write transaction, so concurrent connections migrate only once"""
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        for number, statements in enumerate(SCHEMA_MIGRATIONS[version:], start=version + 1):
+            logger.info('Migrating database schema to version %d', number)
+            for statement in statements:
+                if callable(statement):
+                    statement(connection)
+                else:
+                    connection.execute(statement)
+        connection.execute(f'PRAGMA user_version = {len(SCHEMA_MIGRATIONS)}')
+        connection.commit()
+    except lite.Error:
+        connection.rollback()
+        raise
+
+
+def tune(connection):
+    """Sets the journal and I/O pragmas of a connection"""
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute('PRAGMA synchronous = NORMAL')
+    connection.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+
+
+def enable_incremental_vacuum(connection):
+    """Converts a database created without incremental auto-vacuum with a full VACUUM.
+       This runs once compaction is enabled, before the hunt starts, so the VACUUM
+       does not lock out the writes of a hunt"""
+    if connection.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        return
+    try:
+        logger.info('Enabling incremental vacuum')
+        connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        connection.execute('VACUUM')
+    except lite.OperationalError as error:
+        logger.warning('Enabling incremental vacuum postponed: %s', error.args[0])
+
+
+def archive_columns(connection):
+    """Creates the exposes table of the attached archive database, or adds the columns
+       that later migrations added to the exposes table, and returns the column names"""
+    columns = [(row[1], row[2]) for row in
+               connection.execute('PRAGMA main.table_info(exposes)')]
+    archived = {row[1].lower() for row in
+                connection.execute('PRAGMA archive.table_info(exposes)')}
+    if len(archived) == 0:
+        definitions = ", ".join(f'{name} {column_type}' for name, column_type in columns)
+        connection.execute(f'CREATE TABLE archive.exposes ({definitions})')
+    else:
+        for name, column_type in columns:
+            if name.lower() not in archived:
+                connection.execute(
+                    f'ALTER TABLE archive.exposes ADD COLUMN {name} {column_type}')
+    return [name for name, _ in columns]
+
+
 class SaveAllExposesProcessor(Processor):
     """Processor that saves all exposes to the database"""
 
+    # Number of exposes saved together
+    BATCH_SIZE = 100
+
     def __init__(self, config, id_watch):
         self.config = config
         self.id_watch = id_watch
@@ -25,6 +177,16 @@ class SaveAllExposesProcessor(Processor):
         self.id_watch.save_expose(expose)
         return expose
 
+    def process_exposes(self, exposes):
+        """Save the exposes in batches, passing them on unchanged"""
+        exposes = iter(exposes)
+        while True:
+            batch = list(islice(exposes, self.BATCH_SIZE))
+            if len(batch) == 0:
+                return
+            self.id_watch.save_exposes(batch)
+            yield from batch
+
 class AlreadySeenFilter:
     """Filter exposes that have already been processed"""
 
@@ -38,56 +200,185 @@ class AlreadySeenFilter:
             return True
         return False
 
+    def filter_batch(self, exposes):
+        """Returns the exposes of the list that have not been processed, and marks them
+           as processed, with one lookup and one write for the whole list"""
+        processed = self.id_watch.are_processed([expose['id'] for expose in exposes])
+        new_exposes = []
+        new_ids = set()
+        for expose in exposes:
+            if expose['id'] in processed or expose['id'] in new_ids:
+                continue
+            new_exposes.append(expose)
+            new_ids.add(expose['id'])
+        self.id_watch.mark_processed_many([expose['id'] for expose in new_exposes])
+        return new_exposes
+
 class IdMaintainer:
     """SQLite back-end for the database"""
 
+    # Number of ids per query, below SQLite's limit of query parameters
+    QUERY_BATCH_SIZE = 500
+
+    # Rows deleted per transaction by the retention policies, and pages freed per
+    # incremental vacuum step, so that compaction never holds the lock for long
+    DELETE_BATCH_SIZE = 1000
+    VACUUM_PAGES = 1000
+
+    # Pending rows and seconds after which buffered writes are committed
+    WRITE_BATCH_SIZE = 100
+    WRITE_DELAY_SECONDS = 1.0
+
     def __init__(self, db_name):
         self.db_name = db_name
         self.threadlocal = threading.local()
+        self.migrated = False
+        self.writer = None
+        self.writer_lock = threading.Lock()
+        self.seen_id_cache = SeenIdCache(self.get_processed_ids)
+
+    def open_connection(self):
+        """Opens a new read-write connection"""
+        connection = lite.connect(self.db_name)
+        tune(connection)
+        return connection
 
     def get_connection(self):
         """Connects to the SQLite database. Connections are thread-local"""
         connection = getattr(self.threadlocal, 'connection', None)
         if connection is None:
             try:
-                self.threadlocal.connection = lite.connect(self.db_name)
-                connection = self.threadlocal.connection
-                cur = self.threadlocal.connection.cursor()
-                cur.execute('CREATE TABLE IF NOT EXISTS processed (ID INTEGER)')
-                cur.execute('CREATE TABLE IF NOT EXISTS executions (timestamp timestamp)')
-                cur.execute('CREATE TABLE IF NOT EXISTS exposes (id INTEGER, created TIMESTAMP, \
-                                    crawler STRING, details BLOB, PRIMARY KEY (id, crawler))')
-                cur.execute('CREATE TABLE IF NOT EXISTS users \
-                                    (id INTEGER PRIMARY KEY, settings BLOB)')
-                self.threadlocal.connection.commit()
+                connection = self.open_connection()
+                if not self.migrated:
+                    migrate(connection)
+                    self.migrated = True
+                self.threadlocal.connection = connection
             except lite.Error as error:
                 logger.error("Error %s:", error.args[0])
                 raise error
         return connection
 
+    def get_read_connection(self):
+        """Connects to the SQLite database read-only, for the queries of the web
+           interface. Connections are thread-local. In-memory databases cannot be
+           shared between connections, so these use the read-write connection"""
+        if self.db_name == ':memory:':
+            return self.get_connection()
+        connection = getattr(self.threadlocal, 'read_connection', None)
+        if connection is None:
+            if not self.migrated:
+                self.get_connection()
+            try:
+                connection = lite.connect(f'file:{self.db_name}?mode=ro', uri=True)
+                connection.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+                self.threadlocal.read_connection = connection
+            except lite.Error as error:
+                logger.error("Error %s:", error.args[0])
+                raise error
+        return connection
+
+    def write(self, statement, rows):
+        """Executes the statement once for each row of parameters. Writes to database
+           files are handed to the writer thread, which commits them in batches; call
+           flush() to wait for them. In-memory databases are written right away, as
+           they cannot be shared with the writer's connection"""
+        if self.db_name == ':memory:':
+            self.get_connection().executemany(statement, rows)
+            self.get_connection().commit()
+            return
+        self.get_writer().write(statement, rows)
+
+    def call_writer(self, function):
+        """Runs function(connection) with the write connection, after the buffered writes,
+           and returns its result. Writes that need more than one statement, or the
+           results of a statement, go through here"""
+        if self.db_name == ':memory:':
+            return function(self.get_connection())
+        return self.get_writer().call(function)
+
+    def get_writer(self):
+        """Returns the writer thread, starting it on first use"""
+        with self.writer_lock:
+            if self.writer is None:
+                self.get_connection()
+                self.writer = WriteBehindWriter(self.open_connection, self.WRITE_BATCH_SIZE,
+                                                self.WRITE_DELAY_SECONDS)
+                self.writer.start()
+                atexit.register(self.writer.close)
+            return self.writer
+
+    def flush(self):
+        """Waits until all buffered writes are committed"""
+        if self.writer is not None:
+            self.writer.flush()
+
+    def seen_ids(self):
+        """Filter of the processed ids, answering most lookups without a query"""
+        return self.seen_id_cache
+
+    def get_processed_ids(self):
+        """Returns the ids of all processed exposes"""
+        self.flush()
+        cur = self.get_connection().cursor()
+        cur.execute('SELECT id FROM processed')
+        return [row[0] for row in cur.fetchall()]
+
     def is_processed(self, expose_id):
         """Returns true if an expose has already been processed"""
         logger.debug('is_processed(%d)', expose_id)
+        if not self.seen_ids().might_contain(expose_id):
+            return False
+        self.flush()
         cur = self.get_connection().cursor()
         cur.execute('SELECT id FROM processed WHERE id = ?', (expose_id,))
-        row = cur.fetchone()
-        return row is not None
+        processed = cur.fetchone() is not None
+        self.seen_ids().confirm(processed)
+        return processed
+
+    def are_processed(self, expose_ids):
+        """Returns the set of the given ids that have already been processed"""
+        candidates = {str(expose_id): expose_id for expose_id in expose_ids
+                      if self.seen_ids().might_contain(expose_id)}
+        found = set()
+        if len(candidates) > 0:
+            self.flush()
+        cur = self.get_connection().cursor()
+        for ids in chunk(list(candidates), self.QUERY_BATCH_SIZE):
+            cur.execute(f'SELECT id FROM processed WHERE id IN ({",".join("?" * len(ids))})', ids)
+            found.update(str(row[0]) for row in cur.fetchall())
+        for expose_id in candidates:
+            self.seen_ids().confirm(expose_id in found)
+        return {candidates[expose_id] for expose_id in found if expose_id in candidates}
+
+    def mark_processed_many(self, expose_ids):
+        """Marks the exposes as processed in a single transaction"""
+        if len(expose_ids) == 0:
+            return
+        logger.debug('mark_processed_many(%d ids)', len(expose_ids))
+        now = datetime.datetime.now()
+        self.write('INSERT OR IGNORE INTO processed (id, created) VALUES(?, ?)',
+                   [(expose_id, now) for expose_id in expose_ids])
+        for expose_id in expose_ids:
+            self.seen_ids().add(expose_id)
 
     def mark_processed(self, expose_id):
         """Mark an expose as processed in the database"""
         logger.debug('mark_processed(%d)', expose_id)
-        cur = self.get_connection().cursor()
-        cur.execute('INSERT INTO processed VALUES(?)', (expose_id,))
-        self.get_connection().commit()
+        self.write('INSERT OR IGNORE INTO processed (id, created) VALUES(?, ?)',
+                   [(expose_id, datetime.datetime.now())])
+        self.seen_ids().add(expose_id)
 
     def save_expose(self, expose):
         """Saves an expose to a database"""
-        cur = self.get_connection().cursor()
-        cur.execute('INSERT OR REPLACE INTO exposes(id, created, crawler, details) \
-                     VALUES (?, ?, ?, ?)',
-                    (int(expose['id']), datetime.datetime.now(),
-                     expose['crawler'], json.dumps(expose)))
-        self.get_connection().commit()
+        self.save_exposes([expose])
+
+    def save_exposes(self, exposes):
+        """Saves exposes to the database in one transaction"""
+        now = datetime.datetime.now()
+        self.write('INSERT OR REPLACE INTO exposes(id, created, crawler, details, \
+                    price, size, rooms, price_per_sqm) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                   [(int(expose['id']), now, expose['crawler'],
+                     json.dumps(expose), *expose_numbers(expose)) for expose in exposes])
 
     def get_exposes_since(self, min_datetime):
         """Loads all exposes since the specified date"""
@@ -95,15 +386,20 @@ class IdMaintainer:
             obj = json.loads(row[2])
             obj['created_at'] = row[0]
             return obj
-        cur = self.get_connection().cursor()
+        self.flush()
+        cur = self.get_read_connection().cursor()
         cur.execute('SELECT created, crawler, details FROM exposes \
                      WHERE created >= ? ORDER BY created DESC', (min_datetime,))
         return list(map(row_to_expose, cur.fetchall()))
 
     def get_recent_exposes(self, count, filter_set=None):
-        """Returns up to 'count' recent exposes, filtered by the provided filter"""
-        cur = self.get_connection().cursor()
-        cur.execute('SELECT details FROM exposes ORDER BY created DESC')
+        """Returns up to 'count' recent exposes, filtered by the provided filter. The
+           conditions of the filter that have an SQL equivalent are applied by the
+           database, so only exposes that pass them are decoded"""
+        where, params = filter_set.sql_where() if filter_set is not None else ('1', [])
+        self.flush()
+        cur = self.get_read_connection().cursor()
+        cur.execute(f'SELECT details FROM exposes WHERE {where} ORDER BY created DESC', params)
         res = []
         next_batch = []
         while len(res) < count:
@@ -118,13 +414,12 @@ class IdMaintainer:
 
     def save_settings_for_user(self, user_id, settings):
         """Saves the user settings to the database"""
-        cur = self.get_connection().cursor()
-        cur.execute('INSERT OR REPLACE INTO users VALUES (?, ?)', (user_id, json.dumps(settings)))
-        self.get_connection().commit()
+        self.write('INSERT OR REPLACE INTO users VALUES (?, ?)', [(user_id, json.dumps(settings))])
 
     def get_settings_for_user(self, user_id):
         """Loads the settings for a user from the database"""
-        cur = self.get_connection().cursor()
+        self.flush()
+        cur = self.get_read_connection().cursor()
         cur.execute('SELECT settings FROM users WHERE id = ?', (user_id,))
         row = cur.fetchone()
         if row is None:
@@ -133,7 +428,8 @@ class IdMaintainer:
 
     def get_user_settings(self):
         """Loads all users' settings from the database"""
-        cur = self.get_connection().cursor()
+        self.flush()
+        cur = self.get_read_connection().cursor()
         cur.execute('SELECT id, settings FROM users')
         res = []
         for row in cur.fetchall():
@@ -142,7 +438,8 @@ class IdMaintainer:
 
     def get_last_run_time(self):
         """Returns the time of the last hunt"""
-        cur = self.get_connection().cursor()
+        self.flush()
+        cur = self.get_read_connection().cursor()
         cur.execute("SELECT * FROM executions ORDER BY timestamp DESC LIMIT 1")
         row = cur.fetchone()
         if row is None:
@@ -151,8 +448,100 @@ class IdMaintainer:
 
     def update_last_run_time(self):
         """Saves the time of the most recent hunt to the database"""
-        cur = self.get_connection().cursor()
         result = datetime.datetime.now()
-        cur.execute('INSERT INTO executions VALUES(?);', (result,))
-        self.get_connection().commit()
+        self.write('INSERT INTO executions VALUES(?);', [(result,)])
         return result
+
+    def _delete_in_batches(self, table, where, params):
+        """Deletes the matching rows of the table on the writer thread, in short
+           transactions, so the buffered writes of a hunt are committed in between"""
+        def delete_batch(connection):
+            cur = connection.execute(f'DELETE FROM {table} WHERE rowid IN \
+                                      (SELECT rowid FROM {table} WHERE {where} LIMIT ?)',
+                                     (*params, self.DELETE_BATCH_SIZE))
+            connection.commit()
+            return cur.rowcount
+        deleted = 0
+        while True:
+            rowcount = self.call_writer(delete_batch)
+            deleted += rowcount
+            if rowcount < self.DELETE_BATCH_SIZE:
+                return deleted
+
+    def prune_processed(self, before):
+        """Forgets the ids processed before the given time. Returns the number of ids"""
+        return self._delete_in_batches('processed', 'created < ?', (before,))
+
+    def prune_exposes(self, before, archive=None):
+        """Deletes the exposes saved before the given time. If 'archive' names a database
+           file, they are copied to its exposes table first. Returns the number of exposes"""
+        if archive is None:
+            return self._delete_in_batches('exposes', 'created < ?', (before,))
+        def archive_batch(connection):
+            connection.execute('ATTACH DATABASE ? AS archive', (archive,))
+            try:
+                columns = ", ".join(archive_columns(connection))
+                rowids = [row[0] for row in connection.execute(
+                    'SELECT rowid FROM main.exposes WHERE created < ? LIMIT ?',
+                    (before, self.DELETE_BATCH_SIZE))]
+                if len(rowids) == 0:
+                    return 0
+                placeholders = ",".join("?" * len(rowids))
+                connection.execute(f'INSERT INTO archive.exposes ({columns}) \
+                                     SELECT {columns} FROM main.exposes \
+                                     WHERE rowid IN ({placeholders})', rowids)
+                connection.execute(f'DELETE FROM main.exposes WHERE rowid IN ({placeholders})',
+                                   rowids)
+                connection.commit()
+                return len(rowids)
+            except lite.Error:
+                connection.rollback()
+                raise
+            finally:
+                connection.execute('DETACH DATABASE archive')
+        archived = 0
+        while True:
+            rowcount = self.call_writer(archive_batch)
+            archived += rowcount
+            if rowcount < self.DELETE_BATCH_SIZE:
+                return archived
+
+    def roll_up_executions(self, before):
+        """Replaces the hunts before the given time by one summary row per day in
+           executions_daily. Returns the number of hunts rolled up"""
+        def roll_up(connection):
+            connection.execute('INSERT INTO executions_daily (day, runs, first_run, last_run) \
+                                SELECT date(timestamp), COUNT(*), MIN(timestamp), \
+                                MAX(timestamp) FROM executions WHERE timestamp < ? \
+                                GROUP BY date(timestamp) \
+                                ON CONFLICT(day) DO UPDATE SET runs = runs + excluded.runs, \
+                                first_run = MIN(first_run, excluded.first_run), \
+                                last_run = MAX(last_run, excluded.last_run)', (before,))
+            cur = connection.execute('DELETE FROM executions WHERE timestamp < ?', (before,))
+            connection.commit()
+            return cur.rowcount
+        return self.call_writer(roll_up)
+
+    def enable_incremental_vacuum(self):
+        """Converts the database to incremental auto-vacuum, which compact() needs to
+           return free pages. Call it before the hunt starts, as it may run a VACUUM"""
+        enable_incremental_vacuum(self.get_connection())
+
+    def compact(self):
+        """Returns free pages to the file system, a few at a time, and lets SQLite update
+           its query planner statistics. Free pages are only returned once the database
+           has been converted to incremental auto-vacuum"""
+        def vacuum_step(connection):
+            connection.execute(f'PRAGMA incremental_vacuum({self.VACUUM_PAGES})').fetchall()
+            return connection.execute('PRAGMA freelist_count').fetchone()[0]
+        def optimize(connection):
+            connection.execute('PRAGMA optimize')
+        try:
+            connection = self.get_read_connection()
+            if connection.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+                free_pages = connection.execute('PRAGMA freelist_count').fetchone()[0]
+                while free_pages > 0:
+                    free_pages = self.call_writer(vacuum_step)
+            self.call_writer(optimize)
+        except lite.OperationalError as error:
+            logger.warning('Compaction of %s postponed: %s', self.db_name, error.args[0])
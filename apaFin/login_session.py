@@ -0,0 +1,77 @@
+"""Persistence of logged in browser sessions, so that auto-submit flows do not
+have to log in to a portal for every application"""
+import json
+import os
+import threading
+import time
+
+from apaFin.logging import logger
+
+LOCAL_STORAGE_READ_SCRIPT = "return Object.assign({}, window.localStorage);"
+LOCAL_STORAGE_WRITE_SCRIPT = """
+for (const [key, value] of Object.entries(arguments[0])) {
+    window.localStorage.setItem(key, value);
+}
+"""
+
+
+class LoginSessionStore:
+    """Saves the cookies and localStorage of a logged in browser to one JSON file per
+       portal, and restores them into another browser"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+
+    def path(self, portal_name):
+        """File holding the session of the named crawler"""
+        return os.path.join(self.directory, f'{portal_name}.json')
+
+    def save(self, portal_name, driver):
+        """Stores the session of the browser, which must be on a page of the portal"""
+        session = {
+            'saved_at': time.time(),
+            'cookies': driver.get_cookies(),
+            'local_storage': driver.execute_script(LOCAL_STORAGE_READ_SCRIPT) or {}
+        }
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            # the session grants access to the account, so only the owner may read it
+            descriptor = os.open(self.path(portal_name), os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                                 0o600)
+            with open(descriptor, 'w', encoding='utf-8') as file:
+                json.dump(session, file)
+        logger.debug("Saved login session for %s", portal_name)
+
+    def load(self, portal_name):
+        """Returns the saved session of the named crawler, or None"""
+        with self.lock:
+            try:
+                with open(self.path(portal_name), encoding='utf-8') as file:
+                    return json.load(file)
+            except FileNotFoundError:
+                return None
+            except json.JSONDecodeError:
+                logger.warning("Ignoring unreadable login session for %s", portal_name)
+                return None
+
+    def restore(self, portal_name, driver):
+        """Copies the saved session into the browser, which must be on a page of the
+           portal. Expired cookies are skipped. Returns False if there is no session"""
+        session = self.load(portal_name)
+        if session is None:
+            return False
+        now = time.time()
+        for cookie in session['cookies']:
+            if 'expiry' in cookie and cookie['expiry'] < now:
+                continue
+            driver.add_cookie(cookie)
+        driver.execute_script(LOCAL_STORAGE_WRITE_SCRIPT, session['local_storage'])
+        logger.debug("Restored login session for %s", portal_name)
+        return True
+
+    def clear(self, portal_name):
+        """Deletes the saved session of the named crawler"""
+        with self.lock:
+            if os.path.exists(self.path(portal_name)):
+                os.remove(self.path(portal_name))
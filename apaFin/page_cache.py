@@ -0,0 +1,95 @@
+"""Change detection for search result pages, so unchanged pages are not processed again"""
+import hashlib
+import threading
+
+from apaFin.logging import logger
+
+
+class PageNotModified(Exception):
+    """Raised when a search result page has not changed since it was last crawled"""
+
+
+class SearchPageCache:
+    """Remembers the HTTP validators (ETag / Last-Modified) and fingerprints of the
+       content and of the result list of the search pages a crawler is tracking.
+
+       The state of a freshly crawled page is pending until commit() is called, once
+       its exposes have been processed, so a page whose processing failed is not
+       skipped next time"""
+
+    def __init__(self):
+        self.pages = {}
+        self.pending = {}
+        self.skipped_pages = 0
+        self.lock = threading.Lock()
+
+    def track(self, url):
+        """Start tracking changes of the search result page at the URL"""
+        with self.lock:
+            self.pages.setdefault(url, {})
+
+    def is_tracked(self, url):
+        """Returns true if the URL is a search result page that is tracked"""
+        return url in self.pages
+
+    def conditional_headers(self, url):
+        """Returns the conditional request headers for the URL, if it is tracked"""
+        state = self.pages.get(url, {})
+        headers = {}
+        if 'etag' in state:
+            headers['If-None-Match'] = state['etag']
+        if 'last_modified' in state:
+            headers['If-Modified-Since'] = state['last_modified']
+        return headers
+
+    def check_response(self, url, response):
+        """Raises PageNotModified if the server answered 304, or sent the same content
+           as last time. Otherwise, remembers the validators of the response"""
+        if url not in self.pages:
+            return
+        if response.status_code == 304:
+            self.skip(url, "not modified")
+        if response.status_code != 200:
+            return
+        fingerprint = hashlib.sha256(response.content).hexdigest()
+        if self.pages[url].get('content') == fingerprint:
+            self.skip(url, "identical content")
+        self.remember(url, {'content': fingerprint,
+                            'etag': response.headers.get('ETag'),
+                            'last_modified': response.headers.get('Last-Modified')})
+
+    def check_entries(self, url, entries):
+        """Raises PageNotModified if the page lists the same exposes as last time"""
+        if url not in self.pages:
+            return
+        ids = sorted(str(entry['id']) for entry in entries)
+        fingerprint = hashlib.sha256(",".join(ids).encode('utf-8')).hexdigest()
+        if self.pages[url].get('entries') == fingerprint:
+            self.skip(url, "same result list")
+        self.remember(url, {'entries': fingerprint})
+
+    def remember(self, url, values):
+        """Records new state of the page, to be committed. None values are removed"""
+        with self.lock:
+            self.pending.setdefault(url, {}).update(values)
+
+    def commit(self):
+        """Makes the state of the pages crawled since the last commit the one that the
+           next crawl compares against"""
+        with self.lock:
+            for url, values in self.pending.items():
+                state = self.pages[url]
+                for key, value in values.items():
+                    if value is None:
+                        state.pop(key, None)
+                    else:
+                        state[key] = value
+            self.pending = {}
+
+    def skip(self, url, reason):
+        """Count the page as skipped and abort its processing"""
+        with self.lock:
+            self.skipped_pages += 1
+        logger.info("Search page unchanged (%s), skipping: %s (%d pages skipped so far)",
+                    reason, url, self.skipped_pages)
+        raise PageNotModified(url)
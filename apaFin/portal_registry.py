@@ -0,0 +1,37 @@
+"""Dispatch of URLs to the crawler that handles the URL's portal"""
+import re
+from urllib.parse import urlparse
+
+from apaFin.logging import logger
+
+
+class PortalRegistry:
+    """Index from scheme and host name to the crawler responsible for them. Each
+       claimed host is matched against the crawlers' URL patterns once; later lookups
+       are dictionary hits. URLs no crawler claims are matched again on every lookup,
+       as the patterns may still claim other URLs of the same host"""
+
+    def __init__(self, searchers, target_urls=None):
+        self.searchers = searchers
+        self.hosts = {}
+        self.unclaimed_urls = [url for url in (target_urls or [])
+                               if self.searcher_for_url(url) is None]
+        for url in self.unclaimed_urls:
+            logger.warning("No crawler supports URL %s - it will not be crawled", url)
+
+    def searcher_for_url(self, url):
+        """Returns the crawler for the portal of the URL, or None if no crawler claims it"""
+        parsed = urlparse(url)
+        host = (parsed.scheme, parsed.hostname)
+        if host in self.hosts:
+            return self.hosts[host]
+        searcher = next((searcher for searcher in self.searchers
+                         if re.search(searcher.URL_PATTERN, url)), None)
+        if searcher is not None:
+            self.hosts[host] = searcher
+        return searcher
+
+    def jobs(self, urls):
+        """Returns the (crawler, url) pairs for all URLs claimed by a crawler"""
+        pairs = [(self.searcher_for_url(url), url) for url in urls]
+        return [(searcher, url) for (searcher, url) in pairs if searcher is not None]
@@ -0,0 +1,144 @@
+"""In-process membership cache for the ids of processed exposes"""
+import hashlib
+import math
+import threading
+
+from apaFin.logging import logger
+
+
+class BloomFilter:
+    """Bloom filter over strings: 'in' is never false for added items, and true for
+       other items with a probability of about 'error_rate' while no more than
+       'capacity' items have been added"""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, item):
+        """Bit positions of the item, by double hashing a single digest"""
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        """Adds the item to the filter"""
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self.positions(item))
+
+    def to_dict(self):
+        """The filter as a dictionary of plain values, for storing it"""
+        return {'capacity': self.capacity, 'error_rate': self.error_rate,
+                'count': self.count, 'bits': bytes(self.bits)}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Restores a filter stored with to_dict()"""
+        bloom = cls(data['capacity'], data['error_rate'])
+        if len(data['bits']) != len(bloom.bits):
+            raise ValueError('stored filter does not match its capacity')
+        bloom.bits = bytearray(data['bits'])
+        bloom.count = data['count']
+        return bloom
+
+    def merge(self, other):
+        """Adds the items of a filter of the same capacity and error rate"""
+        self.bits = bytearray(a | b for a, b in zip(self.bits, other.bits))
+        self.count = max(self.count, other.count)
+
+
+class SeenIdCache:
+    """Bloom filter of the processed expose ids, loaded from the backing store on first
+       use and updated when ids are marked as processed. Ids the filter has not seen
+       are not processed, so only possible hits are looked up in the store.
+
+       Ids marked as processed by another process are only noticed after a reload.
+
+       If 'load_filter' is given, it is called first to restore a stored filter, which
+       spares reading all ids; it returns None if there is none. The ids are only read
+       when there is no stored filter, or when the filter has to grow"""
+
+    def __init__(self, load_ids, capacity=100000, error_rate=0.001, load_filter=None):
+        self.load_ids = load_ids
+        self.load_filter = load_filter
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bloom = None
+        self.hits = 0
+        self.misses = 0
+        self.false_positives = 0
+        self.lock = threading.RLock()
+
+    def load(self):
+        """(Re)loads the ids from the backing store. The filter is sized for twice
+           the number of ids, so it can grow before it has to be rebuilt"""
+        with self.lock:
+            if self.bloom is None and self.load_filter is not None:
+                bloom = self.load_filter()
+                if bloom is not None:
+                    self.bloom = bloom
+                    self.capacity = bloom.capacity
+                    logger.debug('Restored the seen-id filter of %d ids', bloom.count)
+                    return
+            ids = [str(expose_id) for expose_id in self.load_ids()]
+            self.capacity = max(self.capacity, 2 * len(ids))
+            self.bloom = BloomFilter(self.capacity, self.error_rate)
+            for expose_id in ids:
+                self.bloom.add(expose_id)
+            logger.debug('Loaded %d processed ids into the seen-id filter', len(ids))
+
+    def might_contain(self, expose_id):
+        """False if the id is certainly not processed. A true result must be confirmed
+           by the backing store, and then be reported with confirm()"""
+        with self.lock:
+            if self.bloom is None:
+                self.load()
+            if str(expose_id) in self.bloom:
+                return True
+            self.misses += 1
+            return False
+
+    def confirm(self, processed):
+        """Counts the result of looking up a possible hit in the backing store"""
+        with self.lock:
+            if processed:
+                self.hits += 1
+            else:
+                self.false_positives += 1
+
+    def add(self, expose_id):
+        """Records a newly processed id"""
+        with self.lock:
+            if self.bloom is None:
+                self.load()
+            self.bloom.add(str(expose_id))
+            if self.bloom.count > self.capacity:
+                self.capacity *= 2
+                self.load()
+
+    def snapshot(self, merge_with=None):
+        """The filter, after adding the items of 'merge_with' if it has the same capacity
+           and error rate, or None if it has not been loaded"""
+        with self.lock:
+            if self.bloom is None:
+                return None
+            if merge_with is not None and merge_with.capacity == self.bloom.capacity \
+                    and merge_with.error_rate == self.bloom.error_rate:
+                self.bloom.merge(merge_with)
+            return self.bloom.to_dict()
+
+    def stats(self):
+        """Number of confirmed hits, misses answered without the store and false positives"""
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'false_positives': self.false_positives}
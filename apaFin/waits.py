@@ -0,0 +1,102 @@
+"""Condition based waits for browser flows, recording the time spent in each step"""
+import time
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.wait import WebDriverWait
+
+from apaFin.logging import logger
+
+# Deadline in seconds of each named wait step, unless configured in 'browser: wait_timeouts'
+DEFAULT_WAIT_TIMEOUTS = {
+    'captcha_iframe': 10,
+    'captcha_iframe_gone': 10,
+    'captcha_checkbox': 30,
+    'captcha_solved': 120,
+    'geetest_submitted': 5,
+    'page_settled': 5,
+    'contact_form': 15,
+    'login_form': 15,
+    'login_submitted': 15,
+}
+
+POLL_SECONDS = 0.2
+
+NETWORK_ACTIVITY_SCRIPT = """
+return [document.readyState, performance.getEntriesByType('resource').length];
+"""
+
+
+def element_visible(by, value):
+    """Condition: the element is in the page and visible"""
+    return EC.visibility_of_element_located((by, value))
+
+
+def element_invisible(by, value):
+    """Condition: the element is hidden or not in the page"""
+    return EC.invisibility_of_element_located((by, value))
+
+
+def url_changed(previous_url):
+    """Condition: the browser has navigated away from the given URL"""
+    return lambda driver: driver.current_url != previous_url
+
+
+class NetworkIdle:
+    """Condition: the document is loaded and no resource was requested for
+       'idle_seconds'. Create a new instance for every wait"""
+
+    def __init__(self, idle_seconds=0.5):
+        self.idle_seconds = idle_seconds
+        self.resources = None
+        self.quiet_since = None
+
+    def __call__(self, driver):
+        ready_state, resources = driver.execute_script(NETWORK_ACTIVITY_SCRIPT)
+        now = time.monotonic()
+        if ready_state != 'complete' or resources != self.resources:
+            self.resources = resources
+            self.quiet_since = now
+            return False
+        return now - self.quiet_since >= self.idle_seconds
+
+
+class StepTimer:
+    """Runs the waits of a browser flow and records how long each step took"""
+
+    def __init__(self, flow):
+        self.flow = flow
+        self.steps = []
+
+    def wait(self, driver, step, condition, timeout, required=False):
+        """Waits until the condition holds, at most 'timeout' seconds. Returns the value
+           of the condition, or None if the deadline passed. Raises TimeoutException
+           instead if the step is 'required'"""
+        started = time.monotonic()
+        try:
+            result = WebDriverWait(driver, timeout, poll_frequency=POLL_SECONDS).until(condition)
+            self.record(step, started, 'done')
+            return result
+        except TimeoutException:
+            self.record(step, started, 'timeout')
+            if required:
+                raise
+            return None
+
+    def record(self, step, started, outcome):
+        """Records a step that started at 'started' (time.monotonic) and ends now"""
+        duration = time.monotonic() - started
+        self.steps.append((step, duration, outcome))
+        logger.debug('%s: waited %.2fs for %s (%s)', self.flow, duration, step, outcome)
+
+    def total(self):
+        """Seconds spent waiting in all steps"""
+        return sum(duration for _, duration, _ in self.steps)
+
+    def log_summary(self):
+        """Logs the time spent in each step"""
+        if len(self.steps) == 0:
+            return
+        steps = [f'{step} {duration:.1f}s' + ('' if outcome == 'done' else f' ({outcome})')
+                 for step, duration, outcome in self.steps]
+        logger.info('%s waited %.1fs: %s', self.flow, self.total(), ', '.join(steps))
@@ -29,6 +29,8 @@ class WebHunter(Hunter):
         new_exposes = []
         for expose in processor_chain.process(self.crawl_for_exposes(max_pages=max_pages)):
             new_exposes.append(expose)
+        self.id_watch.flush()
+        self.commit_page_fingerprints()
 
         for (user_id, settings) in self.id_watch.get_user_settings():
             if 'mute_notifications' in settings:
@@ -51,6 +53,7 @@ class WebHunter(Hunter):
                 self.id_watch.save_settings_for_user(user_id, settings)
 
         self.id_watch.update_last_run_time()
+        self.id_watch.flush()
         return list(new_exposes)
 
     def get_last_run_time(self):
@@ -0,0 +1,201 @@
+"""Write-behind buffer for SQLite, grouping writes into transactions"""
+import queue
+import threading
+import time
+import sqlite3 as lite
+
+from apaFin.logging import logger
+
+
+class Call:
+    """Function queued to run with the writer's connection"""
+
+    def __init__(self, function):
+        self.function = function
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def run(self, connection):
+        """Runs the function, keeping its result or error for the caller"""
+        try:
+            self.result = self.function(connection)
+        # pylint: disable=broad-except
+        except Exception as error:
+            connection.rollback()
+            self.error = error
+        finally:
+            self.done.set()
+
+class WriteBehindWriter(threading.Thread):
+    """Single thread that owns the write connection to a database. Writes are queued
+       and committed together, once 'batch_size' rows are pending, 'delay' seconds
+       after the first pending write, or when flush() is called.
+
+       If the thread is not running, because it was closed or has failed, writes are
+       committed synchronously on the calling thread instead"""
+
+    # Seconds flush() waits for the writer thread before giving up
+    FLUSH_TIMEOUT = 60
+
+    def __init__(self, connect, batch_size, delay):
+        super().__init__(name='sqlite-writer', daemon=True)
+        self.connect = connect
+        self.batch_size = batch_size
+        self.delay = delay
+        self.queue = queue.Queue()
+        self.waiting = []
+        self.sync_lock = threading.Lock()
+        self.transactions = 0
+
+    def write(self, statement, rows):
+        """Queues the statement, to be executed once for each row of parameters"""
+        self.queue.put((statement, rows))
+        if not self.is_alive():
+            self.write_pending()
+
+    def flush(self):
+        """Blocks until all writes queued so far are committed, at most FLUSH_TIMEOUT
+           seconds"""
+        if not self.is_alive():
+            self.write_pending()
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        if not done.wait(self.FLUSH_TIMEOUT):
+            logger.error('Buffered writes not committed after %ds', self.FLUSH_TIMEOUT)
+        if not self.is_alive():
+            self.write_pending()
+
+    def call(self, function):
+        """Runs function(connection) with the write connection, once the writes queued
+           so far are committed, and returns its result. Writes queued meanwhile wait
+           until it returns, so long tasks should be split into several calls"""
+        queued = Call(function)
+        self.queue.put(queued)
+        if not self.is_alive():
+            self.write_pending()
+        while not queued.done.wait(1):
+            if not self.is_alive():
+                self.write_pending()
+        if queued.error is not None:
+            raise queued.error
+        return queued.result
+
+    def close(self):
+        """Commits the pending writes and stops the thread"""
+        if self.is_alive():
+            self.queue.put(None)
+            self.join()
+
+    def run(self):
+        try:
+            self.write_batches()
+        # pylint: disable=broad-except
+        except Exception as error:
+            logger.error('SQLite writer stopped: %s', error)
+        finally:
+            for done in self.waiting:
+                done.set()
+            self.waiting = []
+            # wake flush() calls queued after the failure; their writes stay queued
+            # and are committed by the calling thread
+            items = []
+            while not self.queue.empty():
+                item = self.queue.get_nowait()
+                if isinstance(item, threading.Event):
+                    item.set()
+                elif item is not None:
+                    items.append(item)
+            for item in items:
+                self.queue.put(item)
+
+    def write_batches(self):
+        """Commits the queued writes in batches until close() is called"""
+        connection = self.connect()
+        try:
+            running = True
+            while running:
+                item = self.queue.get()
+                pending = []
+                queued = None
+                rows = 0
+                deadline = time.monotonic() + self.delay
+                while True:
+                    if item is None:
+                        running = False
+                        break
+                    if isinstance(item, threading.Event):
+                        self.waiting.append(item)
+                        break
+                    if isinstance(item, Call):
+                        queued = item
+                        break
+                    pending.append(item)
+                    rows += len(item[1])
+                    if rows >= self.batch_size:
+                        break
+                    try:
+                        item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                if len(pending) > 0:
+                    self.commit(connection, pending)
+                if queued is not None:
+                    queued.run(connection)
+                for done in self.waiting:
+                    done.set()
+                self.waiting = []
+        finally:
+            connection.close()
+
+    def write_pending(self):
+        """Commits the queued writes, and runs the queued calls, on the calling thread
+           with a connection of its own"""
+        with self.sync_lock:
+            pending = []
+            waiting = []
+            connection = None
+            try:
+                while not self.queue.empty():
+                    item = self.queue.get_nowait()
+                    if isinstance(item, threading.Event):
+                        waiting.append(item)
+                    elif isinstance(item, Call):
+                        connection = connection or self.connect()
+                        if len(pending) > 0:
+                            self.commit(connection, pending)
+                            pending = []
+                        item.run(connection)
+                    elif item is not None:
+                        pending.append(item)
+                if len(pending) > 0:
+                    connection = connection or self.connect()
+                    self.commit(connection, pending)
+            finally:
+                if connection is not None:
+                    connection.close()
+            for done in waiting:
+                done.set()
+
+    def commit(self, connection, pending):
+        """Executes the writes in one transaction. If that fails, they are retried one by
+           one, so a single bad write does not take the others down with it"""
+        try:
+            for statement, rows in pending:
+                connection.executemany(statement, rows)
+            connection.commit()
+            self.transactions += 1
+            return
+        except lite.Error as error:
+            connection.rollback()
+            logger.error("Error %s in batch of %d writes, retrying one by one",
+                         error.args[0], len(pending))
+        for statement, rows in pending:
+            try:
+                connection.executemany(statement, rows)
+                connection.commit()
+                self.transactions += 1
+            except lite.Error as error:
+                connection.rollback()
+                logger.error("Error %s, dropped write: %s", error.args[0], statement)
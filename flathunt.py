@@ -11,6 +11,9 @@ import time
 
 from apaFin.logging import logger, wdm_logger, configure_logging
 from apaFin.idmaintainer import IdMaintainer
+from apaFin.db_maintenance import DatabaseMaintenance
+from apaFin.application_queue import ApplicationQueue, start_application_workers, \
+    drain_application_workers
 from apaFin.hunter import Hunter
 from apaFin.config import Config, Env
 from apaFin.heartbeat import Heartbeat
@@ -25,11 +28,27 @@ __status__ = "Production"
 def launch_flat_hunt(config, heartbeat=None):
     """Starts the crawler / notification loop"""
     id_watch = IdMaintainer(f'{config.database_location()}/processed_ids.db')
+    # migrate the database before the maintenance thread and the hunt share it
+    id_watch.get_connection()
+    if config.retention_compact():
+        id_watch.enable_incremental_vacuum()
+    DatabaseMaintenance(config, id_watch).start()
+
+    workers = []
+    if config.auto_submit_enabled():
+        application_queue = ApplicationQueue(f'{config.database_location()}/processed_ids.db')
+        config.set_application_queue(application_queue)
+        workers = start_application_workers(config, application_queue)
 
     hunter = Hunter(config, id_watch)
     hunter.hunt_flats()
     counter = 0
 
+    if not config.loop_is_active():
+        # the workers are daemon threads; submit what was queued before exiting
+        drain_application_workers(workers)
+        return
+
     while config.loop_is_active():
         counter += 1
         counter = heartbeat.send_heartbeat(counter)
@@ -1,4 +1,5 @@
 import re
+import threading
 from random import seed
 from random import random
 from random import randint
@@ -6,6 +7,7 @@ from random import choice
 
 from apaFin.logging import logger
 from apaFin.abstract_crawler import Crawler
+from apaFin.page_cache import SearchPageCache
 
 class DummyCrawler(Crawler):
     URL_PATTERN = re.compile(r'https://www\.example\.com')
@@ -14,6 +16,9 @@ class DummyCrawler(Crawler):
         seed(1)
         self.titlewords = titlewords
         self.addresses_as_links = addresses_as_links
+        self.thread_leases = threading.local()
+        self.primed_urls = set()
+        self.page_cache = SearchPageCache()
 
     def get_results(self, search_url, max_pages=None):
         logger.debug("Generating dummy results")
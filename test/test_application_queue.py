@@ -0,0 +1,156 @@
+import datetime
+import re
+import sqlite3
+import threading
+
+from apaFin.abstract_crawler import Crawler
+from apaFin.application_queue import ApplicationQueue, ApplicationWorker, \
+    drain_application_workers, start_application_workers
+from utils.config import StringConfig
+
+CONFIG = """
+auto_submit:
+  enable: true
+  contact_text_file: contact_text.txt
+  max_attempts: 2
+  retry_delay_seconds: 0
+"""
+
+EXPOSE = {'id': 12345, 'url': 'https://www.example.com/expose/12345', 'title': 'Flat'}
+
+class FormCrawler(Crawler):
+    URL_PATTERN = re.compile(r'https://www\.example\.com')
+
+    def __init__(self, config, failures=0):
+        super().__init__(config)
+        self.failures = failures
+        self.submitted = []
+
+    def submit_application(self, entry):
+        if self.failures > 0:
+            self.failures -= 1
+            raise TimeoutError("contact form did not load")
+        self.submitted.append(entry['id'])
+
+def setup_worker(tmp_path, monkeypatch, failures=0):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'contact_text.txt').write_text('Hello')
+    config = StringConfig(string=CONFIG)
+    crawler = FormCrawler(config, failures)
+    config.set_searchers([crawler])
+    queue = ApplicationQueue(str(tmp_path / 'processed_ids.db'))
+    config.set_application_queue(queue)
+    return crawler, queue, ApplicationWorker(config, queue)
+
+def test_crawl_queues_applications(tmp_path, monkeypatch):
+    crawler, queue, worker = setup_worker(tmp_path, monkeypatch)
+    crawler.submit_to_entries([EXPOSE])
+    crawler.submit_to_entries([EXPOSE])
+    assert crawler.submitted == []
+    assert queue.status_counts() == {'pending': 1}
+
+    assert worker.process_next()
+    assert crawler.submitted == [12345]
+    assert queue.status_counts() == {'applied': 1}
+    assert not worker.process_next()
+
+def test_failed_application_is_retried(tmp_path, monkeypatch):
+    crawler, queue, worker = setup_worker(tmp_path, monkeypatch, failures=1)
+    queue.enqueue(crawler.get_name(), EXPOSE)
+    worker.process_next()
+    assert queue.status_counts() == {'pending': 1}
+    worker.process_next()
+    assert crawler.submitted == [12345]
+    assert queue.status_counts() == {'applied': 1}
+
+def test_application_gives_up_after_max_attempts(tmp_path, monkeypatch):
+    crawler, queue, worker = setup_worker(tmp_path, monkeypatch, failures=5)
+    queue.enqueue(crawler.get_name(), EXPOSE)
+    worker.process_next()
+    worker.process_next()
+    assert not worker.process_next()
+    assert queue.status_counts() == {'failed': 1}
+
+def test_interrupted_applications_are_resumed(tmp_path):
+    queue = ApplicationQueue(str(tmp_path / 'processed_ids.db'))
+    queue.enqueue('FormCrawler', EXPOSE)
+    assert queue.claim_next() == ('FormCrawler', EXPOSE)
+    assert queue.claim_next() is None
+    assert queue.requeue_interrupted() == 1
+    assert queue.claim_next() == ('FormCrawler', EXPOSE)
+
+def test_retry_waits_for_delay(tmp_path):
+    queue = ApplicationQueue(str(tmp_path / 'processed_ids.db'))
+    queue.enqueue('FormCrawler', EXPOSE)
+    queue.claim_next()
+    queue.mark_failed('FormCrawler', EXPOSE, 'error', 3, datetime.timedelta(hours=1))
+    assert queue.claim_next() is None
+
+def test_claim_respects_portal_concurrency(tmp_path):
+    queue = ApplicationQueue(str(tmp_path / 'processed_ids.db'))
+    for expose_id in [1, 2]:
+        queue.enqueue('SlowPortal', {'id': expose_id})
+    queue.enqueue('FastPortal', {'id': 3})
+    concurrency = {'SlowPortal': 1, 'FastPortal': 2}.get
+    assert queue.claim_next(concurrency) == ('SlowPortal', {'id': 1})
+    assert queue.claim_next(concurrency) == ('FastPortal', {'id': 3})
+    assert queue.claim_next(concurrency) is None
+    queue.mark_applied('SlowPortal', {'id': 1}, 1.5)
+    assert queue.claim_next(concurrency) == ('SlowPortal', {'id': 2})
+
+class ParallelCrawler(FormCrawler):
+    def __init__(self, config):
+        super().__init__(config)
+        self.barrier = threading.Barrier(2, timeout=5)
+
+    def submit_application(self, entry):
+        # only passes if two applications are submitted at the same time
+        self.barrier.wait()
+        self.submitted.append(entry['id'])
+
+def test_workers_submit_in_parallel(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'contact_text.txt').write_text('Hello')
+    config = StringConfig(string=CONFIG + """
+  workers: 2
+portals:
+  ParallelCrawler:
+    application_concurrency: 2
+""")
+    crawler = ParallelCrawler(config)
+    config.set_searchers([crawler])
+    queue = ApplicationQueue(str(tmp_path / 'processed_ids.db'))
+    for expose_id in [1, 2]:
+        queue.enqueue(crawler.get_name(), {'id': expose_id, 'url': f'https://www.example.com/{expose_id}'})
+    workers = [ApplicationWorker(config, queue, number) for number in range(2)]
+    threads = [threading.Thread(target=worker.process_next) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert sorted(crawler.submitted) == [1, 2]
+    assert queue.status_counts() == {'applied': 2}
+    latencies = queue.get_connection().execute('SELECT latency FROM applications').fetchall()
+    assert all(latency is not None for (latency,) in latencies)
+
+def test_draining_submits_queued_applications(tmp_path, monkeypatch):
+    crawler, queue, _ = setup_worker(tmp_path, monkeypatch)
+    for expose_id in [1, 2, 3]:
+        queue.enqueue(crawler.get_name(), {'id': expose_id, 'url': f'https://www.example.com/{expose_id}'})
+    workers = start_application_workers(crawler.config, queue)
+    drain_application_workers(workers)
+    assert not any(worker.is_alive() for worker in workers)
+    assert sorted(crawler.submitted) == [1, 2, 3]
+
+def test_queue_table_is_migrated_with_the_database(tmp_path):
+    db_name = str(tmp_path / 'processed_ids.db')
+    legacy = sqlite3.connect(db_name)
+    legacy.execute('CREATE TABLE applications (crawler STRING, expose_id STRING, expose BLOB, \
+                    status STRING, attempts INTEGER, last_error STRING, created TIMESTAMP, \
+                    updated TIMESTAMP, next_attempt TIMESTAMP, PRIMARY KEY (crawler, expose_id))')
+    legacy.commit()
+    legacy.close()
+    queue = ApplicationQueue(db_name)
+    assert queue.enqueue('FormCrawler', EXPOSE)
+    queue.mark_applied('FormCrawler', EXPOSE, latency=1.5)
+    assert queue.status_counts() == {ApplicationQueue.APPLIED: 1}
@@ -0,0 +1,74 @@
+import re
+
+from apaFin.abstract_crawler import Crawler
+from apaFin.browser_profile import GEETEST_URL_PATTERN, blocked_url_patterns
+from utils.config import StringConfig
+
+DUMMY_CONFIG = """
+auto_submit:
+  enable: false
+
+browser:
+  page_load_strategy: eager
+  block_resources:
+    - images
+    - fonts
+
+portals:
+  FormCrawler:
+    block_resources:
+      - analytics
+    blocked_hosts:
+      - ads.example.com
+"""
+
+class RecordingDriver:
+    def __init__(self):
+        self.commands = []
+
+    def execute_cdp_cmd(self, cmd, params):
+        self.commands.append((cmd, params))
+
+    def execute_script(self, script):
+        return 'complete'
+
+    def quit(self):
+        pass
+
+class ListingCrawler(Crawler):
+    URL_PATTERN = re.compile(r'https://www\.example\.com')
+
+    def get_driver(self):
+        return RecordingDriver()
+
+class FormCrawler(ListingCrawler):
+    pass
+
+def test_blocked_url_patterns():
+    patterns = blocked_url_patterns(['images', 'unknown'], ['ads.example.com'])
+    assert patterns[0] == GEETEST_URL_PATTERN
+    assert '*.png' in patterns
+    assert '*.png?*' in patterns
+    assert '*.png*' not in patterns
+    assert '*://*.ads.example.com/*' in patterns
+    assert blocked_url_patterns([], []) == [GEETEST_URL_PATTERN]
+
+def test_blocklist_is_applied_per_portal_on_lease():
+    config = StringConfig(string=DUMMY_CONFIG)
+    assert config.browser_page_load_strategy() == 'eager'
+    listing = ListingCrawler(config)
+    listing.captcha_solver = object()
+    form = FormCrawler(config)
+    form.captcha_solver = object()
+
+    driver = listing.driver
+    listing.release_driver()
+    assert form.driver is driver
+    form.release_driver()
+
+    (_, listing_params), (_, form_params) = driver.commands
+    assert '*.woff?*' in listing_params['urls']
+    assert '*://*.google-analytics.com/*' not in listing_params['urls']
+    assert '*.woff?*' not in form_params['urls']
+    assert '*://*.google-analytics.com/*' in form_params['urls']
+    assert '*://ads.example.com/*' in form_params['urls']
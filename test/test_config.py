@@ -3,6 +3,7 @@ import tempfile
 import os.path
 import os
 from apaFin.config import Config
+from dummy_crawler import DummyCrawler
 from utils.config import StringConfig
 
 class ConfigTest(unittest.TestCase):
@@ -86,3 +87,38 @@ filters:
        config = StringConfig(string=self.FILTERS_CONFIG)
        self.assertIsNotNone(config)
        self.assertEqual(config.database_location(), os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/.."))
+
+    MIXED_URLS_CONFIG = """
+urls:
+  - https://www.example.com/search/flats-in-berlin
+  - https://www.unknown-portal.de/search
+"""
+
+    def test_portal_registry_dispatches_by_host(self):
+       crawler = DummyCrawler()
+       config = StringConfig(string=self.MIXED_URLS_CONFIG)
+       config.set_searchers([crawler])
+       registry = config.portal_registry()
+       self.assertEqual(registry.unclaimed_urls, ["https://www.unknown-portal.de/search"])
+       self.assertEqual(registry.jobs(config.target_urls()),
+                        [(crawler, "https://www.example.com/search/flats-in-berlin")])
+       self.assertIs(registry.searcher_for_url("https://www.example.com/expose/1"), crawler)
+       self.assertIs(config.portal_registry(), registry)
+
+    AUTO_SUBMIT_CONFIG = """
+auto_submit:
+  enable: true
+  workers: 3
+"""
+
+    def test_browser_pool_has_room_for_application_workers(self):
+       self.assertEqual(StringConfig(string=self.MIXED_URLS_CONFIG).browser_pool_size(), 1)
+       self.assertEqual(StringConfig(string=self.AUTO_SUBMIT_CONFIG).browser_pool_size(), 4)
+
+    def test_portal_registry_does_not_cache_unclaimed_hosts(self):
+       crawler = DummyCrawler()
+       config = StringConfig(string=self.MIXED_URLS_CONFIG)
+       config.set_searchers([crawler])
+       registry = config.portal_registry()
+       self.assertIsNone(registry.searcher_for_url("http://www.example.com/search/flats-in-berlin"))
+       self.assertIs(registry.searcher_for_url("https://www.example.com/search/flats-in-berlin"), crawler)
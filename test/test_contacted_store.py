@@ -0,0 +1,49 @@
+import json
+
+from apaFin.abstract_crawler import Crawler
+from apaFin.contacted_store import ContactedStore
+from utils.config import StringConfig
+
+DUMMY_CONFIG = """
+user: test
+database_location: .
+auto_submit:
+  enable: false
+"""
+
+def test_contacted_ids_are_recorded(tmp_path):
+    store = ContactedStore(str(tmp_path / 'processed_ids.db'))
+    store.add('immoscout', 'test', [{'id': 1}, {'id': '2'}])
+    assert store.is_contacted('immoscout', 'test', '1')
+    assert store.is_contacted('immoscout', 'test', 2)
+    assert not store.is_contacted('immoscout', 'other', 1)
+    assert not store.is_contacted('immowelt', 'test', 1)
+    reopened = ContactedStore(str(tmp_path / 'processed_ids.db'))
+    assert reopened.contacted_ids('immoscout', 'test') == {'1', '2'}
+
+def test_json_file_is_imported_once(tmp_path):
+    filepath = tmp_path / 'immoscout_test.json'
+    filepath.write_text(json.dumps({'11': {'id': 11, 'title': 'Flat'}, '12': {'id': 12}}))
+    store = ContactedStore(str(tmp_path / 'processed_ids.db'))
+    assert store.import_json('immoscout', 'test', str(filepath)) == 2
+    assert store.import_json('immoscout', 'test', str(filepath)) == 0
+    assert filepath.exists()
+    reopened = ContactedStore(str(tmp_path / 'processed_ids.db'))
+    assert reopened.import_json('immoscout', 'test', str(filepath)) == 0
+    assert reopened.contacted_ids('immoscout', 'test') == {'11', '12'}
+
+def test_contacted_entries_are_filtered(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'immoscout_test.json').write_text(json.dumps({'11': {'id': 11}}))
+    crawler = Crawler(StringConfig(string=DUMMY_CONFIG))
+    entries = [{'id': 11}, {'id': 12}, {'id': 12}, {'id': 13}]
+    assert crawler.entry_is_new_and_fits(entries, 'immoscout') == [{'id': 12}, {'id': 13}]
+    assert crawler.entry_is_new_and_fits(entries, 'immoscout') == []
+
+def test_portal_json_file_is_not_imported(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'immoscout.json').write_text(json.dumps({'11': {'id': 11}}))
+    crawler = Crawler(StringConfig(string=DUMMY_CONFIG))
+    assert crawler.entry_is_new_and_fits([{'id': 11}, {'id': 12}], 'immoscout') == \
+        [{'id': 11}, {'id': 12}]
+    assert (tmp_path / 'immoscout.json').exists()
@@ -0,0 +1,73 @@
+import re
+import threading
+import time
+
+from apaFin.crawl_executor import CrawlExecutor
+from apaFin.hunter import Hunter
+from apaFin.idmaintainer import IdMaintainer
+from dummy_crawler import DummyCrawler
+from test_util import count
+from utils.config import StringConfig
+
+CONCURRENT_CONFIG = """
+urls:
+  - https://www.example.com/search/flats-in-berlin
+  - https://www.example.com/search/flats-in-munich
+  - https://www.example.com/search/flats-in-hamburg
+
+crawl:
+  concurrency: 4
+"""
+
+class Tracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def enter(self):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+
+    def leave(self):
+        with self.lock:
+            self.running -= 1
+
+class SlowCrawler:
+    URL_PATTERN = re.compile(r'https://www\.example\.com')
+
+    def __init__(self, all_portals):
+        self.portal = Tracker()
+        self.all_portals = all_portals
+
+    def get_name(self):
+        return type(self).__name__
+
+    def crawl(self, url, max_pages=None):
+        self.portal.enter()
+        self.all_portals.enter()
+        time.sleep(0.05)
+        self.all_portals.leave()
+        self.portal.leave()
+        return [{'id': url}]
+
+class OtherSlowCrawler(SlowCrawler):
+    pass
+
+def test_concurrent_hunt_finds_exposes():
+    config = StringConfig(string=CONCURRENT_CONFIG)
+    config.set_searchers([DummyCrawler()])
+    hunter = Hunter(config, IdMaintainer(":memory:"))
+    exposes = hunter.hunt_flats()
+    assert count(exposes) > 4
+
+def test_portals_are_crawled_one_job_at_a_time():
+    all_portals = Tracker()
+    crawlers = [SlowCrawler(all_portals), OtherSlowCrawler(all_portals)]
+    jobs = [(crawlers[i % 2], f"https://www.example.com/{i}") for i in range(8)]
+    executor = CrawlExecutor(4)
+    results = executor.run(lambda searcher, url: searcher.crawl(url), jobs)
+    assert [crawler.portal.max_running for crawler in crawlers] == [1, 1]
+    assert all_portals.max_running == 2
+    assert [result[0]['id'] for result in results] == [url for _, url in jobs]
@@ -3,6 +3,7 @@ import json
 import os
 import sys
 
+from selenium.common.exceptions import JavascriptException
 from apaFin.crawl_immobilienscout import CrawlImmobilienscout
 from utils.config import StringConfigWithCaptchas
 
@@ -51,3 +52,122 @@ def test_process_expose_fetches_details(crawler):
     for expose in updated_entries:
         for attr in [ 'title', 'price', 'size', 'rooms', 'address', 'from' ]:
             assert expose[attr] is not None
+
+PAGINATION_CONFIG = """
+user: test
+database_location: .
+auto_submit:
+  enable: false
+portals:
+  CrawlImmobilienscout:
+    pagination_concurrency: 2
+"""
+
+PAGED_URL = 'https://www.immobilienscout24.de/Suche/de/berlin/berlin/wohnung-mieten?sorting=2'
+
+def result_page(first_id, count, total):
+    items = "".join(f"""<li>
+<a class="result-list-entry__brand-title-container" href="/expose/{expose_id}">Flat {expose_id}</a>
+<div class="result-list-entry__address">Street {expose_id}</div>
+<dl data-is24-qa="attributes"><dd>800 €</dd><dd>60 m²</dd><dd>2 Zi.</dd></dl>
+<div class="result-list-entry__gallery-container"></div>
+</li>""" for expose_id in range(first_id, first_id + count))
+    return f"""<html><body><span data-is24-qa="resultlist-resultCount">{total}</span>
+<ul id="resultListItems">{items}</ul></body></html>"""
+
+def test_remaining_pages_are_fetched_up_to_result_limit(requests_mock, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    for page_no in range(1, 6):
+        requests_mock.get(f'{PAGED_URL}&pagenumber={page_no}',
+                          text=result_page(100000 + page_no * 100, 20, 95))
+    crawler = CrawlImmobilienscout(StringConfigWithCaptchas(string=PAGINATION_CONFIG))
+    entries = crawler.get_results(PAGED_URL)
+    requested = sorted(request.qs['pagenumber'][0] for request in requests_mock.request_history)
+    assert requested == ['1', '2', '3']
+    assert [entry['id'] // 100 for entry in entries[::20]] == [1001, 1002, 1003]
+    assert len(entries) == 60
+
+def test_max_pages_limits_pagination(requests_mock, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    for page_no in range(1, 4):
+        requests_mock.get(f'{PAGED_URL}&pagenumber={page_no}',
+                          text=result_page(100000 + page_no * 100, 20, 45))
+    crawler = CrawlImmobilienscout(StringConfigWithCaptchas(string=PAGINATION_CONFIG))
+    entries = crawler.get_results(PAGED_URL, max_pages=2)
+    assert requests_mock.call_count == 2
+    assert len(entries) == 40
+
+class TabbedDriver:
+    """Stands in for a browser, serving the IS24 fixture in every tab"""
+
+    def __init__(self, data):
+        self.data = data
+        self.window_handles = ['main']
+        self.current_window_handle = 'main'
+        self.opened_urls = []
+
+    def execute_script(self, script, *args):
+        if script.startswith('window.open'):
+            self.opened_urls.append(args[0])
+            self.window_handles.append(f'tab-{len(self.opened_urls)}')
+            return None
+        return self.data
+
+    @property
+    def switch_to(self):
+        driver = self
+        class SwitchTo:
+            def window(self, handle):
+                driver.current_window_handle = handle
+        return SwitchTo()
+
+    def close(self):
+        self.window_handles.remove(self.current_window_handle)
+
+def test_browser_paginates_in_tabs():
+    crawler = CrawlImmobilienscout(StringConfigWithCaptchas(string=PAGINATION_CONFIG))
+    with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures", "immo-scout-IS24-object.json")) as fixture:
+        data = json.load(fixture)
+    crawler.driver = TabbedDriver(data)
+    paging = crawler.get_paging_from_json(data)
+    page_numbers = crawler.remaining_page_numbers(paging['numberOfHits'], paging['pageSize'])
+    assert page_numbers == [2]
+    entries = crawler.get_entries_from_tabs(TEST_URL.replace('pagenumber=1', 'pagenumber={0}'),
+                                            page_numbers, crawler.RESULT_LIMIT)
+    assert len(entries) == len(crawler.get_entries_from_json(data))
+    assert crawler.driver.opened_urls == [TEST_URL.replace('pagenumber=1', 'pagenumber=2')]
+    assert crawler.driver.window_handles == ['main']
+    assert crawler.driver.current_window_handle == 'main'
+
+def inline_json_page(data):
+    model = json.dumps(data['resultList']['resultListModel'])
+    return f"""<html><head><script>var IS24 = IS24 || {{}};
+IS24.resultList = {{
+    resultListModel: {model},
+    isUserLoggedIn: false
+}};</script></head><body><ul id="resultListItems"></ul></body></html>"""
+
+def test_results_are_read_from_inline_json(requests_mock, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures", "immo-scout-IS24-object.json")) as fixture:
+        data = json.load(fixture)
+    requests_mock.get(f'{PAGED_URL}&pagenumber=1', text=inline_json_page(data))
+    requests_mock.get(f'{PAGED_URL}&pagenumber=2', text=inline_json_page(data))
+    crawler = CrawlImmobilienscout(StringConfigWithCaptchas(string=PAGINATION_CONFIG))
+    assert crawler.driver is None
+    entries = crawler.get_results(PAGED_URL)
+    assert requests_mock.call_count == 2
+    assert len(entries) == len(crawler.get_entries_from_json(data))
+    assert entries[0]['url'].startswith("https://www.immobilienscout24.de/expose/")
+
+def test_failed_tab_closes_remaining_tabs():
+    crawler = CrawlImmobilienscout(StringConfigWithCaptchas(string=PAGINATION_CONFIG))
+    crawler.driver = TabbedDriver({})
+    def fail():
+        raise JavascriptException('page crashed')
+    crawler.wait_for_result_list = fail
+    with pytest.raises(JavascriptException):
+        crawler.get_entries_from_tabs(TEST_URL.replace('pagenumber=1', 'pagenumber={0}'),
+                                      [2, 3], crawler.RESULT_LIMIT)
+    assert crawler.driver.window_handles == ['main']
+    assert crawler.driver.current_window_handle == 'main'
@@ -0,0 +1,104 @@
+import datetime
+import sqlite3
+
+from apaFin.db_maintenance import DatabaseMaintenance
+from apaFin.idmaintainer import IdMaintainer
+from utils.config import StringConfig
+
+RETENTION_CONFIG = """
+retention:
+  processed_days: 30
+  exposes_days: 30
+  executions_days: 2
+  compact: true
+"""
+
+def age_rows(id_watch, table, column, days):
+    connection = id_watch.get_connection()
+    connection.execute(f'UPDATE {table} SET {column} = ?',
+                       (datetime.datetime.now() - datetime.timedelta(days=days),))
+    connection.commit()
+
+def test_old_records_are_removed(tmp_path):
+    id_watch = IdMaintainer(str(tmp_path / 'processed_ids.db'))
+    id_watch.enable_incremental_vacuum()
+    id_watch.mark_processed_many([1, 2])
+    id_watch.save_expose({'id': 1, 'crawler': 'test'})
+    for _ in range(3):
+        id_watch.update_last_run_time()
+    id_watch.flush()
+    age_rows(id_watch, 'processed', 'created', 40)
+    age_rows(id_watch, 'exposes', 'created', 40)
+    age_rows(id_watch, 'executions', 'timestamp', 5)
+    id_watch.mark_processed(3)
+    last_run = id_watch.update_last_run_time()
+
+    DatabaseMaintenance(StringConfig(string=RETENTION_CONFIG), id_watch).run_once()
+
+    assert id_watch.are_processed([1, 2, 3]) == {3}
+    assert id_watch.get_recent_exposes(10) == []
+    assert id_watch.get_last_run_time() == last_run
+    connection = id_watch.get_connection()
+    assert connection.execute('SELECT SUM(runs) FROM executions_daily').fetchone()[0] == 3
+    assert connection.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+
+def test_old_exposes_are_archived(tmp_path):
+    id_watch = IdMaintainer(str(tmp_path / 'processed_ids.db'))
+    id_watch.save_expose({'id': 1, 'crawler': 'test'})
+    id_watch.flush()
+    age_rows(id_watch, 'exposes', 'created', 40)
+    archive = str(tmp_path / 'exposes_archive.db')
+    assert id_watch.prune_exposes(datetime.datetime.now(), archive=archive) == 1
+    connection = sqlite3.connect(archive)
+    assert connection.execute('SELECT id, crawler FROM exposes').fetchall() == [(1, 'test')]
+
+def test_archive_gets_the_columns_added_later(tmp_path):
+    archive = str(tmp_path / 'exposes_archive.db')
+    legacy = sqlite3.connect(archive)
+    legacy.execute('CREATE TABLE exposes (id INTEGER, created TIMESTAMP, crawler TEXT, \
+                    details BLOB)')
+    legacy.commit()
+    legacy.close()
+    id_watch = IdMaintainer(str(tmp_path / 'processed_ids.db'))
+    id_watch.save_expose({'id': 1, 'crawler': 'test', 'price': '500 €'})
+    id_watch.flush()
+    age_rows(id_watch, 'exposes', 'created', 40)
+    assert id_watch.prune_exposes(datetime.datetime.now(), archive=archive) == 1
+    connection = sqlite3.connect(archive)
+    assert connection.execute('SELECT id, price FROM exposes').fetchall() == [(1, 500.0)]
+
+def test_hunts_are_kept_and_not_compacted_by_default(tmp_path, mocker):
+    id_watch = IdMaintainer(str(tmp_path / 'processed_ids.db'))
+    id_watch.update_last_run_time()
+    id_watch.flush()
+    age_rows(id_watch, 'executions', 'timestamp', 400)
+    compact = mocker.patch.object(id_watch, 'compact')
+    DatabaseMaintenance(StringConfig(string='retention:'), id_watch).run_once()
+    count = id_watch.get_connection().execute('SELECT COUNT(*) FROM executions').fetchone()[0]
+    assert count == 1
+    compact.assert_not_called()
+
+def test_existing_database_is_converted_when_compaction_is_enabled(tmp_path):
+    db_name = str(tmp_path / 'processed_ids.db')
+    legacy = sqlite3.connect(db_name)
+    legacy.execute('CREATE TABLE processed (ID INTEGER)')
+    legacy.commit()
+    legacy.close()
+    id_watch = IdMaintainer(db_name)
+    id_watch.enable_incremental_vacuum()
+    connection = id_watch.get_connection()
+    assert connection.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+
+def test_failed_run_does_not_stop_maintenance(tmp_path, mocker):
+    id_watch = IdMaintainer(str(tmp_path / 'processed_ids.db'))
+    maintenance = DatabaseMaintenance(StringConfig(string=RETENTION_CONFIG), id_watch)
+    runs = []
+    def run_once():
+        runs.append(True)
+        if len(runs) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        maintenance.stop()
+    mocker.patch.object(maintenance, 'run_once', side_effect=run_once)
+    mocker.patch.object(maintenance.config, 'maintenance_interval_hours', return_value=0)
+    maintenance.run()
+    assert len(runs) == 2
@@ -0,0 +1,122 @@
+import os
+import re
+import threading
+import time
+
+from selenium.common.exceptions import WebDriverException
+
+from apaFin.abstract_crawler import Crawler
+from apaFin.driver_pool import DriverPool, process_tree_rss_mb
+from utils.config import StringConfig
+
+DUMMY_CONFIG = """
+auto_submit:
+  enable: false
+
+browser:
+  pool_size: 2
+"""
+
+class FakeDriver:
+    def __init__(self):
+        self.quit_called = False
+
+    def quit(self):
+        self.quit_called = True
+
+    def execute_cdp_cmd(self, cmd, params):
+        pass
+
+    def execute_script(self, script):
+        return 'complete'
+
+class BrowserCrawler(Crawler):
+    URL_PATTERN = re.compile(r'https://www\.example\.com')
+
+    launched = 0
+
+    def get_driver(self):
+        BrowserCrawler.launched += 1
+        return FakeDriver()
+
+    def get_results(self, search_url, max_pages=None):
+        assert self.driver is not None
+        return []
+
+def test_pool_launches_lazily_and_reuses_drivers():
+    pool = DriverPool(2)
+    assert pool.drivers == []
+    first = pool.acquire(FakeDriver)
+    pool.release(first)
+    assert pool.acquire(FakeDriver) is first
+    assert len(pool.drivers) == 1
+
+def test_pool_size_bounds_concurrent_leases():
+    pool = DriverPool(1)
+    first = pool.acquire(FakeDriver)
+    leased = []
+    thread = threading.Thread(target=lambda: leased.append(pool.acquire(FakeDriver)))
+    thread.start()
+    time.sleep(0.1)
+    assert leased == []
+    pool.release(first)
+    thread.join(1)
+    assert leased == [first]
+    pool.quit()
+    assert first.quit_called
+
+def test_crawler_without_captcha_has_no_browser():
+    config = StringConfig(string=DUMMY_CONFIG)
+    crawler = BrowserCrawler(config)
+    crawler.initialize_driver()
+    assert crawler.driver is None
+    assert config.driver_pool().drivers == []
+
+def test_crawl_leases_and_returns_driver():
+    config = StringConfig(string=DUMMY_CONFIG)
+    assert config.browser_pool_size() == 2
+    crawler = BrowserCrawler(config)
+    crawler.captcha_solver = object()
+    launched = BrowserCrawler.launched
+    assert crawler.browser_available()
+    assert BrowserCrawler.launched == launched
+    crawler.crawl('https://www.example.com/list')
+    crawler.crawl('https://www.example.com/list')
+    assert BrowserCrawler.launched == launched + 1
+    pool = config.driver_pool()
+    assert pool.idle == pool.drivers
+
+class ProbedDriver(FakeDriver):
+    def __init__(self, healthy=True):
+        super().__init__()
+        self.healthy = healthy
+
+    def execute_script(self, script):
+        if not self.healthy:
+            raise WebDriverException("browser is gone")
+        return 'complete'
+
+def test_driver_is_restarted_after_max_page_loads():
+    pool = DriverPool(1, max_page_loads=2)
+    first = pool.acquire(ProbedDriver)
+    pool.record_page_load(first)
+    pool.release(first)
+    assert pool.acquire(ProbedDriver) is first
+    pool.record_page_load(first)
+    pool.release(first)
+    second = pool.acquire(ProbedDriver)
+    assert second is not first
+    assert first.quit_called
+    assert pool.stats() == {'running': 1, 'launched': 2, 'restarts': {'page_loads': 1}}
+
+def test_unresponsive_driver_is_replaced():
+    pool = DriverPool(1)
+    first = pool.acquire(ProbedDriver)
+    first.healthy = False
+    pool.release(first)
+    assert pool.acquire(ProbedDriver) is not first
+    assert pool.stats()['restarts'] == {'unhealthy': 1}
+
+def test_memory_of_process_tree():
+    assert process_tree_rss_mb(os.getpid()) > 0
+    assert process_tree_rss_mb(2 ** 22 + 1) is None
@@ -0,0 +1,119 @@
+import re
+import pytest
+import requests_mock
+
+from apaFin.abstract_crawler import Crawler, FetchFailed
+from utils.config import StringConfig
+
+DUMMY_CONFIG = """
+auto_submit:
+  enable: false
+"""
+
+PROXY_CONFIG = """
+auto_submit:
+  enable: false
+use_proxy_list: true
+"""
+
+URL = 'https://www.example.com/search'
+
+class ExampleCrawler(Crawler):
+    URL_PATTERN = re.compile(r'https://www\.example\.com')
+
+class SessionCrawler(ExampleCrawler):
+    FETCH_STRATEGIES = ('session', 'proxy', 'browser')
+
+def test_direct_fetches_once():
+    crawler = ExampleCrawler(StringConfig(string=DUMMY_CONFIG))
+    assert crawler.fetch_strategies() == ['direct']
+    with requests_mock.Mocker() as m:
+        m.get(URL, text='<p>page</p>')
+        assert crawler.get_soup_from_url(URL).p.text == 'page'
+        assert m.call_count == 1
+
+def test_session_primes_search_page_once():
+    crawler = SessionCrawler(StringConfig(string=DUMMY_CONFIG))
+    crawler.page_cache.track(URL)
+    with requests_mock.Mocker() as m:
+        m.get(URL, text='<p>page</p>')
+        crawler.get_soup_from_url(URL)
+        crawler.get_soup_from_url(URL)
+        assert m.call_count == 3
+
+def test_session_does_not_prime_other_pages():
+    crawler = SessionCrawler(StringConfig(string=DUMMY_CONFIG))
+    with requests_mock.Mocker() as m:
+        m.get(URL, text='<p>page</p>')
+        crawler.get_soup_from_url(URL)
+        assert m.call_count == 1
+    assert len(crawler.primed_urls) == 0
+
+def test_falls_back_to_next_strategy(mocker):
+    mocker.patch('apaFin.proxies.get_proxies', return_value=['10.0.0.1:8080'])
+    crawler = ExampleCrawler(StringConfig(string=PROXY_CONFIG))
+    assert crawler.fetch_strategies() == ['direct', 'proxy']
+    with requests_mock.Mocker() as m:
+        m.get(URL, [{'status_code': 403, 'text': 'blocked'}, {'text': '<p>page</p>'}])
+        assert crawler.get_soup_from_url(URL).p.text == 'page'
+        assert m.call_count == 2
+
+def test_proxy_gives_up_after_proxy_lists(mocker):
+    get_proxies = mocker.patch('apaFin.proxies.get_proxies', return_value=['10.0.0.1:8080'])
+    crawler = ExampleCrawler(StringConfig(string=PROXY_CONFIG))
+    with requests_mock.Mocker() as m:
+        m.get(URL, status_code=403, text='blocked')
+        with pytest.raises(FetchFailed):
+            crawler.fetch_proxy(URL)
+    assert get_proxies.call_count == crawler.PROXY_LIST_ATTEMPTS
+
+def test_last_strategy_returns_rejected_page():
+    crawler = ExampleCrawler(StringConfig(string=DUMMY_CONFIG))
+    with requests_mock.Mocker() as m:
+        m.get(URL, status_code=403, text='<p>blocked</p>')
+        assert crawler.get_soup_from_url(URL).p.text == 'blocked'
+
+class ChallengedBrowser:
+    """Browser that shows a recaptcha on the first page it loads"""
+
+    def __init__(self):
+        self.loaded = []
+
+    def get(self, url):
+        self.loaded.append(url)
+
+    @property
+    def page_source(self):
+        if len(self.loaded) == 1:
+            return '<div class="g-recaptcha"></div>'
+        return f'<p>{self.loaded[-1]}</p>'
+
+    def get_cookies(self):
+        return [{'name': 'clearance', 'value': 'solved', 'domain': 'www.example.com', 'path': '/'}]
+
+    def execute_script(self, script, *args):
+        if 'navigator.userAgent' in script:
+            return 'BrowserAgent/1.0'
+        return None
+
+def test_solved_browser_session_is_handed_off():
+    crawler = ExampleCrawler(StringConfig(string=DUMMY_CONFIG))
+    crawler.driver = ChallengedBrowser()
+    crawler.resolve_recaptcha = lambda driver, checkbox, afterlogin_string: None
+    assert crawler.fetch_strategies() == ['direct', 'browser']
+    with requests_mock.Mocker() as m:
+        m.get(URL, text='<div class="g-recaptcha"></div>')
+        m.get(URL + '?page=2', text='<p>page 2</p>')
+        crawler.get_soup_from_url(URL)
+        assert crawler.driver.loaded == [URL]
+
+        assert crawler.get_soup_from_url(URL + '?page=2').p.text == 'page 2'
+        assert crawler.driver.loaded == [URL]
+        request = m.request_history[-1]
+        assert request.headers['User-Agent'] == 'BrowserAgent/1.0'
+        assert 'clearance=solved' in request.headers['Cookie']
+
+        # challenged again: back to the browser and random user agents
+        assert crawler.get_soup_from_url(URL).p.text == URL
+        assert crawler.driver.loaded == [URL, URL]
+        assert crawler.browser_user_agent is None
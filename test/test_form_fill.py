@@ -0,0 +1,64 @@
+from apaFin.abstract_crawler import Crawler
+from utils.config import StringConfig
+
+DUMMY_CONFIG = """
+auto_submit:
+  enable: false
+"""
+
+TYPING_CONFIG = """
+auto_submit:
+  enable: false
+  fill_mode: type
+"""
+
+class FormField:
+
+    def __init__(self, accepts_injection=True):
+        self.value = ''
+        self.accepts_injection = accepts_injection
+        self.typed = False
+
+    def clear(self):
+        self.value = ''
+
+    def send_keys(self, value):
+        self.typed = True
+        self.value += value
+
+    def get_attribute(self, name):
+        return 'message' if name == 'name' else None
+
+class FormDriver:
+
+    def execute_script(self, script, field, value):
+        if not field.accepts_injection:
+            return False
+        field.value = value
+        return True
+
+def crawler_with_driver(config):
+    crawler = Crawler(StringConfig(string=config))
+    crawler.driver = FormDriver()
+    return crawler
+
+def test_value_is_injected():
+    crawler = crawler_with_driver(DUMMY_CONFIG)
+    field = FormField()
+    crawler.fill_element(field, 'Hello')
+    assert field.value == 'Hello'
+    assert not field.typed
+
+def test_rejected_value_is_typed():
+    crawler = crawler_with_driver(DUMMY_CONFIG)
+    field = FormField(accepts_injection=False)
+    crawler.fill_element(field, 'Hello')
+    assert field.value == 'Hello'
+    assert field.typed
+
+def test_type_fill_mode():
+    crawler = crawler_with_driver(TYPING_CONFIG)
+    field = FormField()
+    crawler.fill_element(field, 'Hello')
+    assert field.value == 'Hello'
+    assert field.typed
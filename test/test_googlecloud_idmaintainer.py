@@ -11,10 +11,30 @@ from dummy_crawler import DummyCrawler
 from test_util import count
 from utils.config import StringConfig
 
-class MockGoogleCloudIdMaintainer(GoogleCloudIdMaintainer):
+class MockWriteBatch:
+    """mockfirestore has no write batches; this one writes on commit"""
 
     def __init__(self):
-        self.database = MockFirestore()
+        self.writes = []
+
+    def set(self, reference, data):
+        self.writes.append((reference, data))
+
+    def commit(self):
+        for reference, data in self.writes:
+            reference.set(data)
+
+class MockFirestoreWithBatches(MockFirestore):
+
+    def batch(self):
+        return MockWriteBatch()
+
+class MockGoogleCloudIdMaintainer(GoogleCloudIdMaintainer):
+
+    def __init__(self, database=None):
+        self.database = database or MockFirestoreWithBatches()
+        self.seen_id_cache = self.create_seen_id_cache()
+        self.seen_ids_changed = False
 
 CONFIG_WITH_FILTERS = """
 urls:
@@ -32,6 +52,10 @@ def test_read_after_write(id_watch):
     id_watch.mark_processed(12345)
     assert id_watch.is_processed(12345)
 
+def test_batch_lookup_returns_processed_ids(id_watch):
+    id_watch.mark_processed_many([1, 2, 3])
+    assert id_watch.are_processed([2, 3, 4]) == {2, 3}
+
 def test_get_last_run_time_none_by_default(id_watch):
     assert id_watch.get_last_run_time() == None
 
@@ -112,3 +136,35 @@ def test_all_filters_can_be_loaded(id_watch):
     hunter.set_filters_for_user(123, filter)
     hunter.set_filters_for_user(124, filter)
     assert id_watch.get_user_settings() == [ (123, { 'filters': filter }), (124, { 'filters': filter }) ]
+
+def test_recent_exposes_are_read_in_pages(id_watch):
+    for expose_id in range(1, 41):
+        record = id_watch.expose_record({'id': expose_id, 'price': f'{expose_id * 100} €'})
+        record['created_sort'] = -expose_id
+        id_watch.database.collection('exposes').document(str(expose_id)).set(record)
+    assert [expose['id'] for expose in id_watch.get_recent_exposes(5)] == [40, 39, 38, 37, 36]
+    filter_set = Filter.builder().read_config({'filters': {'max_price': 300}}).build()
+    exposes = id_watch.get_recent_exposes(10, filter_set=filter_set)
+    assert sorted(expose['id'] for expose in exposes) == [1, 2, 3]
+
+def test_exposes_are_saved_in_batches(id_watch):
+    id_watch.save_exposes([{'id': expose_id} for expose_id in range(1, 4)])
+    assert len(id_watch.get_recent_exposes(10)) == 3
+
+def test_exposes_since_are_queried_by_date(id_watch):
+    id_watch.save_exposes([{'id': 1}, {'id': 2}])
+    old = id_watch.expose_record({'id': 3})
+    old['created_at'] = old['created_at'] - datetime.timedelta(days=2)
+    id_watch.database.collection('exposes').document('3').set(old)
+    since = datetime.datetime.now() - datetime.timedelta(days=1)
+    assert sorted(expose['id'] for expose in id_watch.get_exposes_since(since)) == [1, 2]
+
+def test_seen_id_filter_is_stored_and_restored(id_watch, mocker):
+    id_watch.mark_processed_many([1, 2, 3])
+    id_watch.flush()
+    restored = MockGoogleCloudIdMaintainer(id_watch.database)
+    load_ids = mocker.patch.object(restored.seen_id_cache, 'load_ids',
+                                   wraps=restored.get_processed_ids)
+    assert restored.are_processed([2, 3, 4]) == {2, 3}
+    assert load_ids.call_count == 0
+    assert restored.seen_ids().stats()['misses'] == 1
@@ -0,0 +1,38 @@
+import re
+import requests_mock
+
+from apaFin.abstract_crawler import Crawler
+from utils.config import StringConfig
+
+DUMMY_CONFIG = """
+auto_submit:
+  enable: false
+
+http:
+  pool_maxsize: 4
+
+portals:
+  PooledCrawler:
+    pool_connections: 2
+"""
+
+class PooledCrawler(Crawler):
+    URL_PATTERN = re.compile(r'https://www\.example\.com')
+
+@requests_mock.Mocker(kw='m')
+def test_fetches_reuse_session(**kwargs):
+    m = kwargs['m']
+    m.get('https://www.example.com/list', text='<html><body>list</body></html>')
+    m.get('https://www.example.com/expose/1', text='<html><body>detail</body></html>')
+    crawler = PooledCrawler(StringConfig(string=DUMMY_CONFIG))
+    session = crawler.get_session()
+    assert crawler.get_soup_from_url('https://www.example.com/list').body.text == 'list'
+    assert crawler.get_soup_from_url('https://www.example.com/expose/1').body.text == 'detail'
+    assert crawler.get_session() is session
+    assert m.call_count == 2
+
+def test_pool_size_is_configurable():
+    crawler = PooledCrawler(StringConfig(string=DUMMY_CONFIG))
+    adapter = crawler.get_session().get_adapter('https://www.example.com')
+    assert adapter._pool_connections == 2
+    assert adapter._pool_maxsize == 4
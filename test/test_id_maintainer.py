@@ -1,8 +1,11 @@
 import unittest
 import datetime
 import re
+import sqlite3
 
-from apaFin.idmaintainer import IdMaintainer
+import pytest
+
+from apaFin.idmaintainer import IdMaintainer, SCHEMA_MIGRATIONS
 from apaFin.hunter import Hunter
 from apaFin.web_hunter import WebHunter
 from apaFin.filter import Filter
@@ -56,11 +59,18 @@ def test_ids_are_added_to_maintainer(mocker):
     config = StringConfig(string=IdMaintainerTest.DUMMY_CONFIG)
     config.set_searchers([DummyCrawler()])
     id_watch = IdMaintainer(":memory:")
-    spy = mocker.spy(id_watch, "mark_processed")
+    spy = mocker.spy(id_watch, "mark_processed_many")
     hunter = Hunter(config, id_watch)
     exposes = hunter.hunt_flats()
     assert count(exposes) > 4
-    assert spy.call_count == 24
+    assert spy.call_count == 1
+    assert len(spy.call_args.args[0]) == 24
+
+def test_batch_lookup_returns_processed_ids():
+    id_watch = IdMaintainer(":memory:")
+    id_watch.mark_processed_many([1, 2, 3])
+    assert id_watch.are_processed([2, 3, 4]) == {2, 3}
+    assert id_watch.are_processed([]) == set()
 
 def test_exposes_are_saved_to_maintainer():
     config = StringConfig(string=IdMaintainerTest.CONFIG_WITH_FILTERS)
@@ -125,3 +135,76 @@ def test_all_filters_can_be_loaded():
     hunter.set_filters_for_user(123, filter)
     hunter.set_filters_for_user(124, filter)
     assert id_watch.get_user_settings() == [ (123, { 'filters': filter }), (124, { 'filters': filter }) ]
+
+def test_existing_database_is_migrated_in_place(tmp_path):
+    db_name = str(tmp_path / 'processed_ids.db')
+    connection = sqlite3.connect(db_name)
+    connection.execute('CREATE TABLE processed (ID INTEGER)')
+    connection.executemany('INSERT INTO processed VALUES(?)', [(1,), (1,), (2,)])
+    connection.commit()
+    connection.close()
+    id_watch = IdMaintainer(db_name)
+    id_watch.mark_processed(2)
+    connection = id_watch.get_connection()
+    assert connection.execute('PRAGMA user_version').fetchone()[0] == len(SCHEMA_MIGRATIONS)
+    assert connection.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert sorted(row[0] for row in connection.execute('SELECT id FROM processed')) == [1, 2]
+    indexes = [row[1] for row in connection.execute("PRAGMA index_list('exposes')")]
+    assert 'exposes_created' in indexes
+
+def test_web_queries_use_read_only_connection(tmp_path):
+    id_watch = IdMaintainer(str(tmp_path / 'processed_ids.db'))
+    time = id_watch.update_last_run_time()
+    assert id_watch.get_last_run_time() == time
+    with pytest.raises(sqlite3.OperationalError):
+        id_watch.get_read_connection().execute('DELETE FROM executions')
+
+def test_writes_to_database_file_are_batched(tmp_path):
+    id_watch = IdMaintainer(str(tmp_path / 'processed_ids.db'))
+    for expose_id in range(250):
+        id_watch.save_expose({'id': expose_id, 'crawler': 'test'})
+        id_watch.mark_processed(expose_id)
+    id_watch.flush()
+    assert id_watch.writer.transactions < 20
+    assert id_watch.is_processed(249)
+    assert len(id_watch.get_recent_exposes(300)) == 250
+
+def test_failed_write_does_not_drop_the_batch(tmp_path):
+    id_watch = IdMaintainer(str(tmp_path / 'processed_ids.db'))
+    id_watch.mark_processed(1)
+    id_watch.write('INSERT INTO missing_table VALUES(?)', [(1,)])
+    id_watch.mark_processed(2)
+    assert id_watch.are_processed([1, 2]) == {1, 2}
+
+def test_recent_exposes_are_filtered_by_the_database(tmp_path):
+    id_watch = IdMaintainer(str(tmp_path / 'processed_ids.db'))
+    for expose_id, price in enumerate(['500 €', '1.500 €', 'auf Anfrage']):
+        id_watch.save_expose({'id': expose_id, 'crawler': 'test', 'price': price,
+                              'size': '50 m²', 'rooms': '2'})
+    filter_set = Filter.builder().read_config({'filters': {'max_price': 1000}}).build()
+    assert filter_set.sql_where() == ('(price IS NULL OR price <= ?)', [1000])
+    exposes = id_watch.get_recent_exposes(10, filter_set=filter_set)
+    assert sorted(expose['id'] for expose in exposes) == [0, 2]
+    row = id_watch.get_connection().execute(
+        'SELECT price, size, rooms, price_per_sqm FROM exposes WHERE id = 1').fetchone()
+    assert row == (1500, 50, 2, 30)
+
+def test_numeric_columns_are_backfilled(tmp_path):
+    db_name = str(tmp_path / 'processed_ids.db')
+    connection = sqlite3.connect(db_name)
+    connection.execute('CREATE TABLE exposes (id INTEGER, created TIMESTAMP, \
+                        crawler STRING, details BLOB, PRIMARY KEY (id, crawler))')
+    connection.execute('INSERT INTO exposes VALUES (1, ?, ?, ?)',
+                       (datetime.datetime.now(), 'test', '{"id": 1, "price": "800 €"}'))
+    connection.commit()
+    connection.close()
+    id_watch = IdMaintainer(db_name)
+    row = id_watch.get_connection().execute('SELECT price, size FROM exposes').fetchone()
+    assert row == (800, None)
+
+def test_exposes_rejected_by_other_filters_are_marked_as_seen():
+    id_watch = IdMaintainer(':memory:')
+    filter_set = Filter.builder().max_size_filter(70).filter_already_seen(id_watch).build()
+    exposes = [{'id': 1, 'size': '50 m²'}, {'id': 2, 'size': '90 m²'}]
+    assert [expose['id'] for expose in filter_set.filter(exposes)] == [1]
+    assert id_watch.are_processed([1, 2]) == {1, 2}
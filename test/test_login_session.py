@@ -0,0 +1,102 @@
+import os
+import re
+import time
+
+from apaFin.abstract_crawler import Crawler
+from apaFin.login_session import LoginSessionStore
+from utils.config import StringConfig
+
+CONFIG = """
+auto_submit:
+  enable: false
+  session_directory: {directory}
+"""
+
+class Timeouts:
+    implicit_wait = 10
+
+class BrowserStub:
+    """Browser whose login state is given by its cookies"""
+
+    def __init__(self, cookies=None):
+        self.cookies = cookies or []
+        self.local_storage = {}
+        self.timeouts = Timeouts()
+        self.refreshed = 0
+
+    def get_cookies(self):
+        return list(self.cookies)
+
+    def add_cookie(self, cookie):
+        self.cookies.append(cookie)
+
+    def execute_script(self, script, *args):
+        if 'setItem' in script:
+            self.local_storage.update(args[0])
+            return None
+        return dict(self.local_storage)
+
+    def implicitly_wait(self, seconds):
+        self.timeouts.implicit_wait = seconds
+
+    def find_elements(self, by, value):
+        return ['logout'] if any(cookie['name'] == 'sso' for cookie in self.cookies) else []
+
+    def refresh(self):
+        self.refreshed += 1
+
+class PortalCrawler(Crawler):
+    URL_PATTERN = re.compile(r'https://www\.example\.com')
+
+    LOGGED_IN_XPATH = "//a[contains(@href, 'logout')]"
+
+    logins = 0
+
+    def login(self):
+        self.logins += 1
+        self.driver.add_cookie({'name': 'sso', 'value': 'token'})
+
+def create_crawler(tmp_path, driver):
+    crawler = PortalCrawler(StringConfig(string=CONFIG.format(directory=tmp_path)))
+    crawler.driver = driver
+    return crawler
+
+def test_store_round_trip_skips_expired_cookies(tmp_path):
+    store = LoginSessionStore(str(tmp_path))
+    source = BrowserStub([{'name': 'sso', 'value': 'token'},
+                          {'name': 'old', 'value': 'x', 'expiry': int(time.time()) - 60}])
+    source.local_storage = {'user': 'me'}
+    store.save('PortalCrawler', source)
+    assert os.stat(store.path('PortalCrawler')).st_mode & 0o077 == 0
+
+    target = BrowserStub()
+    assert store.restore('PortalCrawler', target)
+    assert [cookie['name'] for cookie in target.cookies] == ['sso']
+    assert target.local_storage == {'user': 'me'}
+    assert not store.restore('OtherCrawler', target)
+
+def test_full_login_only_without_valid_session(tmp_path):
+    first = create_crawler(tmp_path, BrowserStub())
+    first.ensure_logged_in()
+    assert first.logins == 1
+
+    second = create_crawler(tmp_path, BrowserStub())
+    second.ensure_logged_in()
+    assert second.logins == 0
+    assert second.driver.refreshed == 1
+    assert second.driver.timeouts.implicit_wait == 10
+
+def test_expired_session_logs_in_again(tmp_path):
+    store = LoginSessionStore(str(tmp_path))
+    store.save('PortalCrawler', BrowserStub([{'name': 'sso', 'value': 'token',
+                                              'expiry': int(time.time()) - 60}]))
+    crawler = create_crawler(tmp_path, BrowserStub())
+    crawler.ensure_logged_in()
+    assert crawler.logins == 1
+
+def test_session_is_not_saved_without_logged_in_marker(tmp_path):
+    crawler = create_crawler(tmp_path, BrowserStub())
+    crawler.LOGGED_IN_XPATH = None
+    crawler.ensure_logged_in()
+    assert crawler.logins == 1
+    assert not os.path.exists(LoginSessionStore(str(tmp_path)).path('PortalCrawler'))
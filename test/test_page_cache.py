@@ -0,0 +1,62 @@
+import re
+import pytest
+import requests_mock
+
+from apaFin.abstract_crawler import Crawler
+from utils.config import StringConfig
+
+DUMMY_CONFIG = """
+user: test
+database_location: .
+auto_submit:
+  enable: false
+"""
+
+SEARCH_URL = 'https://www.example.com/search'
+
+PAGE = '<html><body><div class="item" id="1"></div><div class="item" id="2"></div></body></html>'
+
+class ListCrawler(Crawler):
+    URL_PATTERN = re.compile(r'https://www\.example\.com')
+    MODULE_NAME = 'page_cache_test'
+
+    def extract_data(self, soup):
+        return [{'id': int(item['id'])} for item in soup.find_all('div', {'class': 'item'})]
+
+@pytest.fixture
+def crawler(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return ListCrawler(StringConfig(string=DUMMY_CONFIG))
+
+def test_not_modified_page_is_skipped(crawler):
+    with requests_mock.Mocker() as m:
+        m.get(SEARCH_URL, [{'text': PAGE, 'headers': {'ETag': '"v1"'}},
+                           {'status_code': 304}])
+        assert len(crawler.crawl(SEARCH_URL)) == 2
+        crawler.page_cache.commit()
+        assert crawler.crawl(SEARCH_URL) == []
+        assert m.request_history[1].headers['If-None-Match'] == '"v1"'
+    assert crawler.page_cache.skipped_pages == 1
+
+def test_identical_result_list_is_skipped(crawler):
+    with requests_mock.Mocker() as m:
+        m.get(SEARCH_URL, [{'text': PAGE}, {'text': PAGE.replace('<body>', '<body><p>ad</p>')}])
+        assert len(crawler.crawl(SEARCH_URL)) == 2
+        crawler.page_cache.commit()
+        assert crawler.crawl(SEARCH_URL) == []
+    assert crawler.page_cache.skipped_pages == 1
+
+def test_page_is_not_skipped_before_commit(crawler):
+    with requests_mock.Mocker() as m:
+        m.get(SEARCH_URL, text=PAGE, headers={'ETag': '"v1"'})
+        crawler.crawl(SEARCH_URL)
+        crawler.crawl(SEARCH_URL)
+        assert 'If-None-Match' not in m.request_history[1].headers
+    assert crawler.page_cache.skipped_pages == 0
+
+def test_detail_pages_are_not_tracked(crawler):
+    with requests_mock.Mocker() as m:
+        m.get('https://www.example.com/expose/1', text=PAGE)
+        crawler.get_soup_from_url('https://www.example.com/expose/1')
+        assert crawler.get_soup_from_url('https://www.example.com/expose/1') is not None
+    assert crawler.page_cache.skipped_pages == 0
@@ -0,0 +1,36 @@
+from apaFin.idmaintainer import IdMaintainer
+from apaFin.seen_ids import BloomFilter, SeenIdCache
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    for expose_id in range(1000):
+        bloom.add(str(expose_id))
+    assert all(str(expose_id) in bloom for expose_id in range(1000))
+    false_positives = sum(str(expose_id) in bloom for expose_id in range(1000, 11000))
+    assert false_positives < 300
+
+def test_cache_is_loaded_once_and_grows():
+    stored = [1, 2]
+    loads = []
+    def load_ids():
+        loads.append(True)
+        return stored
+    cache = SeenIdCache(load_ids, capacity=4)
+    assert cache.might_contain(1)
+    assert not cache.might_contain(3)
+    for expose_id in range(3, 10):
+        stored.append(expose_id)
+        cache.add(expose_id)
+    assert all(cache.might_contain(expose_id) for expose_id in stored)
+    assert cache.capacity >= len(stored)
+    assert len(loads) == 2
+    assert cache.stats()['misses'] == 1
+
+def test_unseen_ids_are_answered_without_query(mocker):
+    maintainer = IdMaintainer(":memory:")
+    maintainer.mark_processed(12345)
+    spy = mocker.spy(maintainer, "get_connection")
+    assert not maintainer.is_processed(54321)
+    assert spy.call_count == 0
+    assert maintainer.is_processed(12345)
+    assert maintainer.seen_ids().stats() == {'hits': 1, 'misses': 1, 'false_positives': 0}
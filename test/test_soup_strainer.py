@@ -0,0 +1,67 @@
+import re
+import requests_mock
+from bs4 import SoupStrainer
+
+from apaFin.abstract_crawler import Crawler
+from apaFin.crawl_immobilienscout import CrawlImmobilienscout
+from utils.config import StringConfig
+
+DUMMY_CONFIG = """
+auto_submit:
+  enable: false
+
+portals:
+  StrainedCrawler:
+    html_parser: html.parser
+"""
+
+PAGE = """<html><head><script>var tracking = 1;</script></head><body>
+<nav><a href="/">Home</a></nav>
+<h1><span data-is24-qa="resultlist-resultCount">3</span> Wohnungen</h1>
+<ul id="resultListItems"><li>first</li><li>second</li></ul>
+<footer>Impressum</footer>
+</body></html>"""
+
+class StrainedCrawler(Crawler):
+    URL_PATTERN = re.compile(r'https://www\.example\.com')
+
+    RESULT_LIST_STRAINER = SoupStrainer(id="resultListItems")
+
+def test_html_parser_is_configurable():
+    config = StringConfig(string=DUMMY_CONFIG)
+    assert config.html_parser('StrainedCrawler') == 'html.parser'
+    assert config.html_parser('CrawlImmobilienscout') == 'lxml'
+
+@requests_mock.Mocker(kw='m')
+def test_search_page_parses_only_result_list(**kwargs):
+    m = kwargs['m']
+    m.get('https://www.example.com/list', text=PAGE)
+    crawler = StrainedCrawler(StringConfig(string=DUMMY_CONFIG))
+    soup = crawler.get_page('https://www.example.com/list')
+    assert [li.text for li in soup.find(id="resultListItems").find_all('li')] \
+        == ['first', 'second']
+    assert soup.find('footer') is None
+    assert soup.find('script') is None
+
+@requests_mock.Mocker(kw='m')
+def test_detail_page_is_parsed_completely(**kwargs):
+    m = kwargs['m']
+    m.get('https://www.example.com/expose/1', text=PAGE)
+    crawler = StrainedCrawler(StringConfig(string=DUMMY_CONFIG))
+    soup = crawler.get_soup_from_url('https://www.example.com/expose/1')
+    assert soup.find('footer').text == 'Impressum'
+
+def test_immoscout_strainer_keeps_json_and_result_list():
+    crawler = StrainedCrawler(StringConfig(string=DUMMY_CONFIG))
+    soup = crawler.make_soup(PAGE, parse_only=CrawlImmobilienscout.RESULT_LIST_STRAINER)
+    assert soup.find('script') is not None
+    assert soup.find(attrs={'data-is24-qa': 'resultlist-resultCount'}).text == '3'
+    assert len(soup.find(id="resultListItems").find_all('li')) == 2
+    assert soup.find('nav') is None
+
+def test_immoscout_strainer_with_lxml():
+    crawler = StrainedCrawler(StringConfig(string="auto_submit:\n  enable: false\n"))
+    soup = crawler.make_soup(PAGE, parse_only=CrawlImmobilienscout.RESULT_LIST_STRAINER)
+    assert soup.find(attrs={'data-is24-qa': 'resultlist-resultCount'}).text == '3'
+    assert len(soup.find(id="resultListItems").find_all('li')) == 2
+    assert soup.find('footer') is None
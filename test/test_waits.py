@@ -0,0 +1,53 @@
+import pytest
+from selenium.common.exceptions import TimeoutException
+
+from apaFin.waits import NetworkIdle, StepTimer, url_changed
+from utils.config import StringConfig
+
+DUMMY_CONFIG = """
+auto_submit:
+  enable: false
+
+browser:
+  wait_timeouts:
+    contact_form: 3
+"""
+
+class LoadingDriver:
+    """Reports a page that requests a new resource on each of its first polls"""
+
+    def __init__(self, busy_polls):
+        self.busy_polls = busy_polls
+        self.polls = 0
+        self.current_url = 'https://www.example.com/form'
+
+    def execute_script(self, script):
+        self.polls += 1
+        return ['complete', min(self.polls, self.busy_polls)]
+
+def test_network_idle_waits_for_requests_to_stop():
+    driver = LoadingDriver(busy_polls=3)
+    timer = StepTimer('Example')
+    assert timer.wait(driver, 'page_settled', NetworkIdle(idle_seconds=0.1), 5)
+    assert driver.polls > 3
+    assert timer.steps[0][0] == 'page_settled'
+    assert timer.steps[0][2] == 'done'
+
+def test_missed_deadline_is_recorded():
+    driver = LoadingDriver(busy_polls=1)
+    timer = StepTimer('Example')
+    assert timer.wait(driver, 'submitted', url_changed(driver.current_url), 0.3) is None
+    step, duration, outcome = timer.steps[0]
+    assert (step, outcome) == ('submitted', 'timeout')
+    assert duration >= 0.3
+
+def test_required_step_raises_on_timeout():
+    driver = LoadingDriver(busy_polls=1)
+    with pytest.raises(TimeoutException):
+        StepTimer('Example').wait(driver, 'submitted', url_changed(driver.current_url), 0.1,
+                                  required=True)
+
+def test_wait_timeouts_are_configurable():
+    config = StringConfig(string=DUMMY_CONFIG)
+    assert config.wait_timeout('contact_form') == 3
+    assert config.wait_timeout('captcha_solved') == 120
@@ -0,0 +1,51 @@
+import sqlite3
+
+from apaFin.write_behind import WriteBehindWriter
+
+def connector(db_name):
+    def connect():
+        connection = sqlite3.connect(db_name)
+        connection.execute('CREATE TABLE IF NOT EXISTS items (id INTEGER)')
+        return connection
+    return connect
+
+def count_items(db_name):
+    return sqlite3.connect(db_name).execute('SELECT COUNT(*) FROM items').fetchone()[0]
+
+def test_writes_after_close_are_committed_synchronously(tmp_path):
+    db_name = str(tmp_path / 'items.db')
+    writer = WriteBehindWriter(connector(db_name), 100, 10)
+    writer.start()
+    writer.write('INSERT INTO items VALUES (?)', [(1,)])
+    writer.close()
+    writer.write('INSERT INTO items VALUES (?)', [(2,)])
+    writer.flush()
+    assert count_items(db_name) == 2
+
+def test_flush_does_not_hang_when_the_thread_failed(tmp_path):
+    db_name = str(tmp_path / 'items.db')
+    connect = connector(db_name)
+    attempts = []
+    def connect_once_failing():
+        attempts.append(True)
+        if len(attempts) == 1:
+            raise RuntimeError('no connection')
+        return connect()
+    writer = WriteBehindWriter(connect_once_failing, 100, 10)
+    writer.start()
+    writer.join()
+    writer.write('INSERT INTO items VALUES (?)', [(1,)])
+    writer.flush()
+    assert count_items(db_name) == 1
+
+def test_calls_run_after_the_queued_writes(tmp_path):
+    db_name = str(tmp_path / 'items.db')
+    writer = WriteBehindWriter(connector(db_name), 100, 10)
+    writer.start()
+    writer.write('INSERT INTO items VALUES (?)', [(1,)])
+    count = writer.call(lambda connection: connection.execute(
+        'SELECT COUNT(*) FROM items').fetchone()[0])
+    writer.close()
+    assert count == 1
+    assert writer.call(lambda connection: connection.execute(
+        'SELECT COUNT(*) FROM items').fetchone()[0]) == 1